@@ -0,0 +1,156 @@
+"""Circuit breakers with per-call deadlines for the Google API clients
+
+Every guarded call runs on the breaker's small thread pool and the caller
+waits at most the deadline. After failure_threshold consecutive failures or
+timeouts the breaker opens and calls fail immediately with CircuitOpen, so
+the callers' fallbacks (plaintext, no-op) apply without waiting. Once
+reset_seconds have passed a single probe call is let through (half-open):
+success closes the breaker, failure opens it again. A client error (4xx
+other than 429, e.g. KMS rejecting a ciphertext) shows the dependency is
+up and counts as a success.
+
+Settings per dependency come from <NAME>_DEADLINE_SECONDS,
+<NAME>_FAILURE_THRESHOLD and <NAME>_RESET_SECONDS, falling back to the
+BREAKER_* defaults.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+BREAKER_DEADLINE_SECONDS = float(os.environ.get('BREAKER_DEADLINE_SECONDS', '2.0'))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', '30'))
+BREAKER_MAX_WORKERS = int(os.environ.get('BREAKER_MAX_WORKERS', '8'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """The dependency is considered down, the call was not attempted"""
+
+
+class DeadlineExceeded(Exception):
+    """The call did not finish within the breaker deadline"""
+
+
+def is_client_error(error):
+    """Whether a Google API error rejected the request itself, see api_core exceptions"""
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and 400 <= code < 500 and code != 429
+
+
+class CircuitBreaker:
+    """Deadline, failure counting and half-open probing for one dependency"""
+
+    def __init__(self, name, deadline=BREAKER_DEADLINE_SECONDS, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds=BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0
+        self._probing = False
+        # Hung calls keep their thread, the pool bounds how many can pile up
+        self._executor = ThreadPoolExecutor(max_workers=BREAKER_MAX_WORKERS, thread_name_prefix=f'breaker-{name}')
+        self.opened_total = 0
+        self.rejected_total = 0
+        self.timeouts_total = 0
+
+    @classmethod
+    def from_env(cls, name):
+        prefix = name.upper()
+        return cls(
+            name,
+            deadline=float(os.environ.get(f'{prefix}_DEADLINE_SECONDS', BREAKER_DEADLINE_SECONDS)),
+            failure_threshold=int(os.environ.get(f'{prefix}_FAILURE_THRESHOLD', BREAKER_FAILURE_THRESHOLD)),
+            reset_seconds=float(os.environ.get(f'{prefix}_RESET_SECONDS', BREAKER_RESET_SECONDS))
+        )
+
+    def _admit(self):
+        """Return True when this call is the half-open probe"""
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected_total += 1
+            raise CircuitOpen(f'{self.name} circuit is open')
+
+    def call(self, fn, *args, **kwargs):
+        probe = self._admit()
+        future = self._executor.submit(fn, *args, **kwargs)
+        try:
+            result = future.result(timeout=self.deadline)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts_total += 1
+            self._record_failure(probe)
+            raise DeadlineExceeded(f'{self.name} call exceeded {self.deadline}s')
+        except Exception as e:
+            if is_client_error(e):
+                self._record_success()
+            else:
+                self._record_failure(probe)
+            raise
+        self._record_success()
+        return result
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self.state = CLOSED
+
+    def _record_failure(self, probe):
+        with self._lock:
+            self._failures += 1
+            if probe:
+                self._probing = False
+            if probe or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened_total += 1
+                self.state = OPEN
+                self._opened_at = self.clock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'opened_total': self.opened_total,
+                'rejected_total': self.rejected_total,
+                'timeouts_total': self.timeouts_total,
+                'deadline_seconds': self.deadline,
+                'failure_threshold': self.failure_threshold,
+                'reset_seconds': self.reset_seconds
+            }
+
+
+class GuardedClient:
+    """Proxy that sends the listed client methods through a breaker"""
+
+    def __init__(self, client, breaker, methods):
+        self._client = client
+        self._breaker = breaker
+        self._methods = frozenset(methods)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in self._methods:
+            return attr
+
+        def guarded(*args, **kwargs):
+            return self._breaker.call(attr, *args, **kwargs)
+        return guarded
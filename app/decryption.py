@@ -0,0 +1,117 @@
+"""Cached, parallel decryption for the GET path of secure_main
+
+Ciphertexts never change after a todo is created, so plaintexts are kept
+in a bounded LRU keyed by the SHA-256 digest of the ciphertext. Only cache
+misses are decrypted, concurrently on a thread pool, and a request gives up
+once its deadline has passed. A warm GET does no decryption at all.
+
+Texts that are not ciphertexts (stored in plaintext when encryption failed)
+are cached unchanged like any plaintext. Only a decrypt function raising
+DecryptUnavailable, e.g. with KMS down, leaves the text uncached for a retry.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+PLAINTEXT_CACHE_SIZE = int(os.environ.get('PLAINTEXT_CACHE_SIZE', '100000'))
+DECRYPT_WORKERS = int(os.environ.get('DECRYPT_WORKERS', '8'))
+DECRYPT_DEADLINE_SECONDS = float(os.environ.get('DECRYPT_DEADLINE_SECONDS', '2.0'))
+
+
+class DecryptTimeout(Exception):
+    """Some ciphertexts were not decrypted before the request deadline"""
+
+
+class DecryptUnavailable(Exception):
+    """Decryption failed for now, the text is served as stored and retried later"""
+
+
+class PlaintextCache:
+    """LRU of ciphertext digest -> plaintext"""
+
+    def __init__(self, max_entries=PLAINTEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            plaintext = self._entries.get(key)
+            if plaintext is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return plaintext
+
+    def put(self, key, plaintext):
+        with self._lock:
+            self._entries[key] = plaintext
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ParallelDecryptor:
+    """Decrypts lists through a PlaintextCache and a shared thread pool"""
+
+    def __init__(self, decrypt, cache=None, workers=DECRYPT_WORKERS, deadline=DECRYPT_DEADLINE_SECONDS):
+        self.decrypt = decrypt
+        self.cache = cache if cache is not None else PlaintextCache()
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decrypt')
+        self.timeouts = 0
+
+    def decrypt_all(self, ciphertexts):
+        """Return the plaintexts in order, raises DecryptTimeout past the deadline"""
+        plaintexts = [None] * len(ciphertexts)
+        # Equal ciphertexts are decrypted once: {digest: (ciphertext, [index, ...])}
+        pending = {}
+        for index, ciphertext in enumerate(ciphertexts):
+            key = hashlib.sha256(ciphertext.encode('utf-8')).digest()
+            plaintext = self.cache.get(key)
+            if plaintext is None:
+                pending.setdefault(key, (ciphertext, []))[1].append(index)
+            else:
+                plaintexts[index] = plaintext
+
+        if not pending:
+            return plaintexts
+
+        futures = {self._executor.submit(self.decrypt, ciphertext): key for key, (ciphertext, _) in pending.items()}
+        done, not_done = wait(futures, timeout=self.deadline)
+        for future in not_done:
+            future.cancel()
+
+        for future in done:
+            key = futures[future]
+            ciphertext, indexes = pending[key]
+            try:
+                plaintext = future.result()
+            except DecryptUnavailable:
+                plaintext = ciphertext
+            else:
+                self.cache.put(key, plaintext)
+            for index in indexes:
+                plaintexts[index] = plaintext
+
+        if not_done:
+            self.timeouts += 1
+            raise DecryptTimeout(f'{len(not_done)} of {len(pending)} items not decrypted in {self.deadline}s')
+        return plaintexts
+
+    def stats(self):
+        return {
+            'cached_plaintexts': len(self.cache),
+            'max_cached_plaintexts': self.cache.max_entries,
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'timeouts': self.timeouts
+        }
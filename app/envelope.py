@@ -0,0 +1,118 @@
+"""Envelope encryption for todo texts
+
+Instead of one KMS round trip per todo, a random data-encryption key (DEK)
+is wrapped by KMS once and todos are encrypted locally with AES-GCM. The
+wrapped DEK is kept in the store under a key version, and every ciphertext
+carries that version:
+
+    v1:<key_version>:<base64(nonce + ciphertext + tag)>
+
+Unwrapped DEKs are cached in memory for DEK_TTL_SECONDS. A new DEK is
+generated once the current one is older than that, so KMS is called about
+once per key version and worker instead of once per todo.
+"""
+import base64
+import hashlib
+import os
+import threading
+import time
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+DEK_TTL_SECONDS = int(os.environ.get('DEK_TTL_SECONDS', '3600'))
+
+_PREFIX = 'v1:'
+_NONCE_SIZE = 12
+
+
+def is_envelope(text):
+    """True for texts produced by EnvelopeCipher.encrypt"""
+    return isinstance(text, str) and text.startswith(_PREFIX)
+
+
+class EnvelopeCipher:
+    """AES-GCM with KMS-wrapped data keys cached for a limited time
+
+    kms_client is a KeyManagementServiceClient (or anything with the same
+    encrypt/decrypt calls), key_store any store with save_data_key,
+    load_data_key and data_key_versions.
+    """
+
+    def __init__(self, kms_client, key_name, key_store, ttl=DEK_TTL_SECONDS, clock=time.monotonic):
+        self.kms_client = kms_client
+        self.key_name = key_name
+        self.key_store = key_store
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Key version used for new ciphertexts and when it expires
+        self._current = None
+        self._current_expires = 0
+        # {key_version: (AESGCM, expires_at)}
+        self._keys = {}
+        self.wraps = 0
+        self.unwraps = 0
+
+    def encrypt(self, text):
+        key_version, aead = self._current_key()
+        nonce = os.urandom(_NONCE_SIZE)
+        # The key version is authenticated, so it cannot be swapped
+        sealed = aead.encrypt(nonce, text.encode('utf-8'), key_version.encode('ascii'))
+        return f"{_PREFIX}{key_version}:{base64.b64encode(nonce + sealed).decode('ascii')}"
+
+    def decrypt(self, token):
+        key_version, payload = token[len(_PREFIX):].split(':', 1)
+        data = base64.b64decode(payload)
+        aead = self._key(key_version)
+        plaintext = aead.decrypt(data[:_NONCE_SIZE], data[_NONCE_SIZE:], key_version.encode('ascii'))
+        return plaintext.decode('utf-8')
+
+    def _current_key(self):
+        with self._lock:
+            now = self.clock()
+            if self._current is None or now >= self._current_expires:
+                # Expired keys are unwrapped again on their next use
+                self._keys = {version: key for version, key in self._keys.items() if key[1] > now}
+                dek = AESGCM.generate_key(bit_length=256)
+                response = self.kms_client.encrypt(request={'name': self.key_name, 'plaintext': dek})
+                self.wraps += 1
+                key_version = hashlib.sha256(response.ciphertext).hexdigest()[:16]
+                self.key_store.save_data_key(key_version, base64.b64encode(response.ciphertext).decode('ascii'))
+                self._keys[key_version] = (AESGCM(dek), now + self.ttl)
+                self._current = key_version
+                self._current_expires = now + self.ttl
+            return self._current, self._keys[self._current][0]
+
+    def preload(self):
+        """Create the current data key and unwrap every stored one, returns how many"""
+        self._current_key()
+        versions = self.key_store.data_key_versions()
+        for key_version in versions:
+            self._key(key_version)
+        return len(versions)
+
+    def _key(self, key_version):
+        with self._lock:
+            now = self.clock()
+            cached = self._keys.get(key_version)
+            if cached is not None and now < cached[1]:
+                return cached[0]
+
+            wrapped = self.key_store.load_data_key(key_version)
+            if wrapped is None:
+                raise KeyError(f'unknown data key version {key_version}')
+            response = self.kms_client.decrypt(
+                request={'name': self.key_name, 'ciphertext': base64.b64decode(wrapped)}
+            )
+            self.unwraps += 1
+            aead = AESGCM(response.plaintext)
+            self._keys[key_version] = (aead, now + self.ttl)
+            return aead
+
+    def stats(self):
+        return {
+            'key_version': self._current,
+            'cached_keys': len(self._keys),
+            'kms_wraps': self.wraps,
+            'kms_unwraps': self.unwraps
+        }
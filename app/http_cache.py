@@ -0,0 +1,50 @@
+"""HTTP caching helpers for GET /api/todos
+
+Each todo list carries a version that the store bumps on every write. The
+ETag is built from that version, so a conditional GET can be answered with
+304 Not Modified before the list is read, decrypted or serialized.
+"""
+import os
+
+from flask import Response, request
+
+# The global list is shared by everyone, so a CDN may cache it briefly
+GLOBAL_LIST_MAX_AGE = int(os.environ.get('GLOBAL_LIST_MAX_AGE', '5'))
+GLOBAL_CACHE_CONTROL = f'public, max-age={GLOBAL_LIST_MAX_AGE}'
+# Client lists are private and always revalidated with If-None-Match
+CLIENT_CACHE_CONTROL = 'private, no-cache'
+
+
+def list_version(store, client_id):
+    """Return (epoch, version) of a todo list
+
+    Read it before reading the list: a write landing in between then only
+    makes the body newer than its tag, which costs one extra download
+    instead of a stale 304.
+    """
+    return store.epoch, store.version(client_id)
+
+
+def _etag(list_ver):
+    return '{}-{}'.format(*list_ver)
+
+
+def with_cache_headers(response, list_ver, client_id):
+    """Add the ETag, the version headers used by delta sync and Cache-Control"""
+    epoch, version = list_ver
+    response.set_etag(_etag(list_ver))
+    response.headers['X-Todos-Epoch'] = epoch
+    response.headers['X-Todos-Version'] = str(version)
+    response.headers['Cache-Control'] = CLIENT_CACHE_CONTROL if client_id else GLOBAL_CACHE_CONTROL
+    if not client_id:
+        # Access-Control-Allow-Origin echoes the request Origin, a shared
+        # cache must not hand one origin's copy to another
+        response.vary.add('Origin')
+    return response
+
+
+def not_modified(list_ver, client_id):
+    """Return a 304 response when the request already holds this version"""
+    if request.if_none_match.contains(_etag(list_ver)):
+        return with_cache_headers(Response(status=304), list_ver, client_id)
+    return None
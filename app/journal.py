@@ -0,0 +1,341 @@
+"""Write-ahead log and snapshots that make the in-memory store durable
+
+Every write of an InMemoryStore with a journal is appended to the current
+log segment as one framed record (length, CRC32, compact JSON) before it is
+applied, so a batch is either recovered whole or not at all. The record
+reaches the OS before the request is answered and survives a crashed
+process. fsync is group committed: a background thread syncs every
+TODO_WAL_SYNC_MS milliseconds, or sooner once TODO_WAL_SYNC_RECORDS records
+are pending, which bounds what a power loss can take. TODO_WAL_SYNC_MS=0
+syncs every record before returning.
+
+Every TODO_SNAPSHOT_SECONDS a background snapshot starts a new segment,
+writes the full state and deletes the segments and snapshots it replaces.
+On start the latest snapshot is loaded and the segments after it replayed.
+Records carry their todo ids, so todos already in the snapshot are skipped
+and replay is idempotent. A torn record at the end of a segment (crash
+mid-write) ends that segment's replay.
+
+Directory layout (TODO_WAL_DIR):
+    wal-00000007.log        log segments, replayed in order
+    snapshot-00000007.json  state before segment 7
+    LOCK                    held by the one process using the directory
+"""
+import atexit
+import fcntl
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+from records import Todo
+
+TODO_WAL_SYNC_MS = float(os.environ.get('TODO_WAL_SYNC_MS', '5'))
+TODO_WAL_SYNC_RECORDS = int(os.environ.get('TODO_WAL_SYNC_RECORDS', '100'))
+TODO_SNAPSHOT_SECONDS = float(os.environ.get('TODO_SNAPSHOT_SECONDS', '300'))
+
+_FRAME = struct.Struct('<II')
+_SEGMENT = re.compile(r'^wal-(\d{8})\.log$')
+_SNAPSHOT = re.compile(r'^snapshot-(\d{8})\.json$')
+SNAPSHOT_FORMAT = 1
+
+
+class JournalLocked(Exception):
+    """Another process is using the journal directory"""
+
+
+def _encode(record):
+    payload = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_segment(path):
+    """Yield the records of a segment up to its first torn or corrupt frame"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        start = offset + _FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield json.loads(payload)
+        offset = start + length
+
+
+def todo_row(todo):
+    return [todo.id, todo.text, todo.created_ms, todo.encrypted]
+
+
+def row_todo(row):
+    todo_id, text, created_ms, encrypted = row
+    return Todo(text, created_ms, encrypted, todo_id)
+
+
+def apply_record(store, record):
+    """Apply one log record, returns the number of todos added"""
+    if record[0] == 't':
+        return store.replay_todos(record[1], [row_todo(row) for row in record[2]])
+    if record[0] == 'k':
+        store.restore_data_key(record[1], record[2])
+    elif record[0] == 'p':
+        store.restore_partition(record[1], record[2], record[3], [row_todo(row) for row in record[4]])
+        return len(record[4])
+    elif record[0] == 'd':
+        store.drop_partition(record[1])
+    return 0
+
+
+def snapshot_lines(store, **header):
+    """Yield the state of store as JSON lines, a header then one line per partition"""
+    header = dict(header, format=SNAPSHOT_FORMAT, data_keys=store.export_data_keys())
+    yield json.dumps(header, separators=(',', ':')) + '\n'
+    for client_id, next_id, version, todos in store.export_partitions():
+        row = [client_id, next_id, version, [todo_row(todo) for todo in todos]]
+        yield json.dumps(row, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def load_snapshot(store, lines):
+    """Restore snapshot_lines into an empty store, returns (header, todos restored)"""
+    lines = iter(lines)
+    header = json.loads(next(lines))
+    if header.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unknown snapshot format {header.get('format')}")
+    for key_version, wrapped in header['data_keys'].items():
+        store.restore_data_key(key_version, wrapped)
+    count = 0
+    for line in lines:
+        client_id, next_id, version, rows = json.loads(line)
+        store.restore_partition(client_id, next_id, version, [row_todo(row) for row in rows])
+        count += len(rows)
+    return header, count
+
+
+def _fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """Log segments and snapshots of one InMemoryStore in a directory"""
+
+    def __init__(self, directory, sync_ms=TODO_WAL_SYNC_MS, sync_records=TODO_WAL_SYNC_RECORDS,
+                 snapshot_seconds=TODO_SNAPSHOT_SECONDS):
+        self.directory = directory
+        self.sync_ms = sync_ms
+        self.sync_records = sync_records
+        self.snapshot_seconds = snapshot_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        # Two processes appending to the same segments would corrupt them
+        self._lock_file = open(os.path.join(directory, 'LOCK'), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise JournalLocked(f'{directory} is used by another process, run a single worker')
+
+        # Appends take _lock. The group commit fsyncs under _sync_lock only,
+        # so appends go on meanwhile; rotate and close take both, in this order
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._sync_wanted = threading.Event()
+        self._stopped = threading.Event()
+        self._file = None
+        self.segment = 0
+        self._pending = 0
+        self._since_snapshot = 0
+        self.records = 0
+        self.fsyncs = 0
+        self.snapshots = 0
+        self.recovered_todos = 0
+        self.recovery_seconds = None
+        self.last_snapshot_seconds = None
+        self._store = None
+
+    def _numbered(self, pattern):
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'wal-{number:08d}.log')
+
+    def _snapshot_path(self, number):
+        return os.path.join(self.directory, f'snapshot-{number:08d}.json')
+
+    def recover(self, store):
+        """Load the latest snapshot and replay the log into an empty store"""
+        started = time.perf_counter()
+        recovered = 0
+        snapshots = self._numbered(_SNAPSHOT)
+        first_segment = 0
+        if snapshots:
+            first_segment = snapshots[-1]
+            recovered += self._load_snapshot(store, self._snapshot_path(first_segment))
+
+        segments = [number for number in self._numbered(_SEGMENT) if number >= first_segment]
+        for number in segments:
+            for record in read_segment(self._segment_path(number)):
+                recovered += apply_record(store, record)
+
+        # Never append to a segment that may end in a torn record
+        self._open_segment(max(segments + snapshots + [0]) + 1)
+        self.recovered_todos = recovered
+        self.recovery_seconds = time.perf_counter() - started
+
+    def _load_snapshot(self, store, path):
+        with open(path, encoding='utf-8') as f:
+            return load_snapshot(store, f)[1]
+
+    def _open_segment(self, number):
+        # Unbuffered, so each record is a single write() to the OS
+        self._file = open(self._segment_path(number), 'ab', buffering=0)
+        self.segment = number
+        _fsync_directory(self.directory)
+
+    def start(self, store):
+        """Start the group commit and snapshot threads for store"""
+        self._store = store
+        if self.sync_ms > 0:
+            threading.Thread(target=self._sync_loop, name='wal-sync', daemon=True).start()
+        if self.snapshot_seconds > 0:
+            threading.Thread(target=self._snapshot_loop, name='wal-snapshot', daemon=True).start()
+        atexit.register(self.close)
+
+    def log_todos(self, client_id, todos):
+        self._append(['t', client_id, [todo_row(todo) for todo in todos]])
+
+    def log_partition(self, client_id, next_id, version, todos):
+        self._append(['p', client_id, next_id, version, [todo_row(todo) for todo in todos]])
+
+    def log_drop(self, client_id):
+        self._append(['d', client_id])
+
+    def log_data_key(self, key_version, wrapped_key):
+        self._append(['k', key_version, wrapped_key])
+
+    def _append(self, record):
+        frame = _encode(record)
+        with self._lock:
+            self._file.write(frame)
+            self.records += 1
+            self._since_snapshot += 1
+            self._pending += 1
+            if self.sync_ms <= 0:
+                self._sync_locked()
+            elif self._pending >= self.sync_records:
+                self._sync_wanted.set()
+
+    def _sync_locked(self):
+        if self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+            self.fsyncs += 1
+
+    def sync(self):
+        """fsync everything appended so far, without holding up new appends"""
+        with self._sync_lock:
+            with self._lock:
+                pending = self._pending
+                if not pending or self._file.closed:
+                    return
+                fd = self._file.fileno()
+            os.fsync(fd)
+            with self._lock:
+                # Records appended during the fsync wait for the next one
+                self._pending = max(0, self._pending - pending)
+                self.fsyncs += 1
+
+    def _sync_loop(self):
+        while not self._stopped.is_set():
+            self._sync_wanted.wait(self.sync_ms / 1000)
+            self._sync_wanted.clear()
+            try:
+                self.sync()
+            except (OSError, ValueError) as e:
+                print(f"Failed to sync the todo log: {e}")
+
+    def _snapshot_loop(self):
+        while not self._stopped.wait(self.snapshot_seconds):
+            if self._since_snapshot:
+                try:
+                    self.snapshot()
+                except OSError as e:
+                    print(f"Failed to snapshot the todo store: {e}")
+
+    def rotate(self):
+        """Continue in a new segment and return its number"""
+        with self._sync_lock, self._lock:
+            self._sync_locked()
+            self._file.close()
+            self._open_segment(self.segment + 1)
+            self._since_snapshot = 0
+            return self.segment
+
+    def snapshot(self):
+        """Write the full state and drop the log segments it replaces"""
+        with self._snapshot_lock:
+            started = time.perf_counter()
+            # Writes from here on go to the new segment. Each partition is
+            # copied under its lock afterwards, so it holds every write of
+            # the older segments (and maybe a few of the new one, which
+            # replay skips by id)
+            segment = self.rotate()
+            self.write_snapshot(segment)
+            self.compact(segment)
+            self.snapshots += 1
+            self.last_snapshot_seconds = time.perf_counter() - started
+
+    def write_snapshot(self, segment):
+        path = self._snapshot_path(segment)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(snapshot_lines(self._store))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(self.directory)
+
+    def compact(self, segment):
+        """Delete the segments and snapshots older than the snapshot of segment"""
+        for number in self._numbered(_SEGMENT):
+            if number < segment:
+                os.remove(self._segment_path(number))
+        for number in self._numbered(_SNAPSHOT):
+            if number < segment:
+                os.remove(self._snapshot_path(number))
+
+    def close(self):
+        self._stopped.set()
+        self._sync_wanted.set()
+        with self._sync_lock, self._lock:
+            if self._file is not None and not self._file.closed:
+                self._sync_locked()
+                self._file.close()
+        if not self._lock_file.closed:
+            self._lock_file.close()
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'segment': self.segment,
+            'records': self.records,
+            'fsyncs': self.fsyncs,
+            'snapshots': self.snapshots,
+            'records_since_snapshot': self._since_snapshot,
+            'recovered_todos': self.recovered_todos,
+            'recovery_seconds': self.recovery_seconds,
+            'last_snapshot_seconds': self.last_snapshot_seconds
+        }
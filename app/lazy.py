@@ -0,0 +1,78 @@
+"""Clients created on first use instead of at import
+
+Importing the Google Cloud libraries and building their clients takes
+seconds on an F1 instance. A LazyClient holds the factory and runs it the
+first time the client is needed, once, even when several threads ask at the
+same moment. Attribute access is passed on to the client, so a holder can
+stand in wherever the client itself was used.
+
+A factory that raises marks the holder as failed and the error is kept:
+the feature stays disabled, as it did when construction failed at import.
+"""
+import threading
+import time
+
+PENDING = 'not_loaded'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class ClientUnavailable(Exception):
+    """The client could not be created"""
+
+
+class LazyClient:
+    """Thread-safe holder that builds a client with factory() on first use"""
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._client = None
+        self._error = None
+        self._load_seconds = None
+
+    def get(self):
+        """The client, or None when it could not be created"""
+        if self._client is None and self._error is None:
+            with self._lock:
+                if self._client is None and self._error is None:
+                    started = time.perf_counter()
+                    try:
+                        self._client = self._factory()
+                    except Exception as e:
+                        self._error = e
+                        print(f"{self._name} disabled: {e}")
+                    self._load_seconds = time.perf_counter() - started
+        return self._client
+
+    def available(self):
+        """Create the client if needed and tell whether that worked"""
+        return self.get() is not None
+
+    @property
+    def state(self):
+        if self._client is not None:
+            return READY
+        return FAILED if self._error is not None else PENDING
+
+    @property
+    def enabled(self):
+        """True or False once loaded, None before, never triggers a load"""
+        state = self.state
+        return None if state == PENDING else state == READY
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        client = self.get()
+        if client is None:
+            raise ClientUnavailable(f'{self._name} is unavailable: {self._error}')
+        return getattr(client, attr)
+
+    def describe(self):
+        return {
+            'state': self.state,
+            'load_seconds': self._load_seconds,
+            'error': str(self._error) if self._error is not None else None
+        }
@@ -1,13 +1,55 @@
 from flask import Flask, jsonify, request
-from datetime import datetime
+import os
+from storage import create_store
+from replication import Replication
+from pagination import parse_page_args
+from http_cache import list_version, not_modified, with_cache_headers
+from response_cache import ResponseCache
+from streaming import stream_list, wants_stream
+from request_metrics import RequestMetrics
+from server_timing import SERVER_TIMING_HISTOGRAMS, ServerTiming, span
+from profiling import Profiler
+from warmup import Warmup
+from records import Todo, TodoJSONProvider, now_ms, to_dicts
 
 app = Flask(__name__)
+app.json = TodoJSONProvider(app)
 
-# User-specific storage: {client_id: {todos: [], next_id: 1}}
-user_data = {}
-# Global storage for backward compatibility
-todos = []
-next_id = 1
+# Per-route latency histograms, served at /metrics
+request_metrics = RequestMetrics()
+request_metrics.install(app)
+
+# Server-Timing header with the phases of a request (see server_timing.py)
+server_timing = ServerTiming(metrics=request_metrics if SERVER_TIMING_HISTOGRAMS else None)
+server_timing.install(app)
+
+# Sampled or admin-requested profiles, listed at /admin/profiles
+profiler = Profiler()
+profiler.install(app)
+
+# Todo storage, in-memory by default (see storage.py for backends)
+store = create_store()
+
+# Leader/follower log shipping between instances (see replication.py)
+replication = Replication(store)
+store = replication.store
+replication.install(app)
+
+# Encoded bodies of full lists, reused until the list changes
+response_cache = ResponseCache()
+
+# Opens the store before the first request, run by /_ah/warmup (App Engine)
+# or at start for the GKE readiness probe
+warmup = Warmup()
+
+@warmup.phase('store')
+def warm_store():
+    store.warm()
+
+warmup.install(app)
+
+# Maximum number of texts accepted by POST /api/todos/batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '50'))
 
 # Add CORS headers to allow frontend access
 @app.after_request
@@ -22,13 +64,16 @@ def add_cors_headers(response):
     if origin in allowed_origins:
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS, PUT, DELETE'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, If-None-Match, X-Server-Timing'
+        response.headers['Access-Control-Expose-Headers'] = 'ETag, X-Todos-Epoch, X-Todos-Version, X-Replica-Role, X-Replica-Staleness-Ms'
+        response.headers['Timing-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Credentials'] = 'true'
 
     return response
 
 # Handle preflight requests
 @app.route('/api/todos', methods=['OPTIONS'])
+@app.route('/api/todos/batch', methods=['OPTIONS'])
 def handle_options():
     return '', 200
 
@@ -41,8 +86,15 @@ def status():
     return jsonify({
         'status': 'operational',
         'features': ['user_separation', 'cors_support', 'client_id'],
-        'users_count': len(user_data),
-        'global_todos_count': len(todos),
+        'users_count': store.users_count(),
+        'global_todos_count': store.global_count(),
+        'storage_backend': store.name,
+        'storage': store.stats(),
+        'response_cache': response_cache.stats(),
+        'server_timing': server_timing.stats(),
+        'profiler': profiler.stats(),
+        'warmup': warmup.report(),
+        'replication': replication.stats(),
         'version': '2.0'
     })
 
@@ -50,14 +102,70 @@ def status():
 def get_todos():
     client_id = request.args.get('client_id')
 
-    if client_id:
-        # User-specific todos
-        if client_id not in user_data:
-            user_data[client_id] = {'todos': [], 'next_id': 1}
-        return jsonify(user_data[client_id]['todos'])
+    try:
+        page_args = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Nothing to compare against: the version comes with the list
+    if page_args is None and not wants_stream(request.args) and not request.if_none_match:
+        with span('serialize'):
+            list_ver, body = response_cache.read_list(store, client_id, to_dicts)
+        response = app.response_class(body, mimetype='application/json')
+        return with_cache_headers(response, list_ver, client_id)
+
+    # Answer conditional requests before touching the list
+    list_ver = list_version(store, client_id)
+    cached = not_modified(list_ver, client_id)
+    if cached:
+        return cached
+
+    # User-specific todos, or the global list for backward compatibility
+    if page_args is None and wants_stream(request.args):
+        response = app.response_class(stream_list(store, client_id, to_dicts), mimetype='application/json')
+    elif page_args is None:
+        with span('serialize'):
+            body = response_cache.list_body(store, client_id, list_ver, to_dicts)
+        response = app.response_class(body, mimetype='application/json')
     else:
-        # Global todos for backward compatibility
-        return jsonify(todos)
+        with span('store'):
+            page, next_cursor = store.page_todos(client_id, **page_args)
+        with span('serialize'):
+            response = jsonify({'todos': page, 'next_cursor': next_cursor})
+
+    return with_cache_headers(response, list_ver, client_id)
+
+@app.route('/api/todos/changes', methods=['GET'])
+def get_todo_changes():
+    client_id = request.args.get('client_id')
+
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer version'}), 400
+
+    version, changes = store.changes_since(client_id, since)
+
+    # Too far behind, or a version from a restarted store: reload everything
+    epoch = request.args.get('epoch')
+    if changes is None or (epoch and epoch != store.epoch):
+        return jsonify({'epoch': store.epoch, 'version': version, 'resync': True})
+
+    return jsonify({'epoch': store.epoch, 'version': version, 'changes': changes})
+
+def clean_text(raw_text):
+    """Strip and validate a todo text, returns (text, error)"""
+    if not isinstance(raw_text, str):
+        return None, 'text must be a string'
+
+    text = raw_text.strip()
+    if not text:
+        return None, 'text cannot be empty'
+
+    if len(text) > 255:
+        return None, 'text maximum 255 characters'
+
+    return text, None
 
 @app.route('/api/todos', methods=['POST'])
 def create_todo():
@@ -67,45 +175,63 @@ def create_todo():
     if not data or 'text' not in data:
         return jsonify({'error': 'text field is required'}), 400
 
-    text = data['text'].strip()
-    if not text:
-        return jsonify({'error': 'text cannot be empty'}), 400
+    with span('validate'):
+        text, error = clean_text(data['text'])
+    if error:
+        return jsonify({'error': error}), 400
 
-    if len(text) > 255:
-        return jsonify({'error': 'text maximum 255 characters'}), 400
+    # The id is assigned by the store
+    todo = Todo(text)
 
-    todo = {
-        'id': 0,  # Will be set based on user context
-        'text': text,
-        'created_at': datetime.utcnow().isoformat() + 'Z'
-    }
+    with span('store'):
+        count = store.add_todo(client_id, todo)
 
     if client_id:
         # User-specific todo
-        if client_id not in user_data:
-            user_data[client_id] = {'todos': [], 'next_id': 1}
-
-        user_todo_data = user_data[client_id]
-        todo['id'] = user_todo_data['next_id']
-        user_todo_data['todos'].append(todo)
-        user_todo_data['next_id'] += 1
-
         return jsonify({
-            'count': len(user_todo_data['todos']),
+            'count': count,
             'user_id': client_id,
-            'todos_count': len(user_todo_data['todos'])
+            'todos_count': count
         }), 201
     else:
         # Global todo for backward compatibility
-        global next_id
-        todo['id'] = next_id
-        todos.append(todo)
-        next_id += 1
-
         return jsonify({
-            'count': len(todos),
-            'global_todos': len(todos)
+            'count': count,
+            'global_todos': count
         }), 201
 
+@app.route('/api/todos/batch', methods=['POST'])
+def create_todos_batch():
+    client_id = request.args.get('client_id')
+    data = request.get_json()
+
+    if not isinstance(data, dict) or not isinstance(data.get('texts'), list) or not data['texts']:
+        return jsonify({'error': 'texts field is required'}), 400
+
+    if len(data['texts']) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'texts maximum {MAX_BATCH_SIZE} items'}), 400
+
+    # Validate everything before storing anything
+    created_ms = now_ms()
+    new_todos = []
+    for index, raw_text in enumerate(data['texts']):
+        text, error = clean_text(raw_text)
+        if error:
+            return jsonify({'error': f'texts[{index}]: {error}'}), 400
+        new_todos.append(Todo(text, created_ms))
+
+    with span('store'):
+        count = store.add_todos(client_id, new_todos)
+
+    response_data = {
+        'count': count,
+        'created': len(new_todos),
+        'first_id': new_todos[0].id,
+        'last_id': new_todos[-1].id
+    }
+    if client_id:
+        response_data['user_id'] = client_id
+    return jsonify(response_data), 201
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '8080')), debug=True)
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""Buffered Cloud Monitoring metrics for secure_main
+
+Requests only update in-process counters and distributions keyed by metric
+name and labels. A background thread sends everything collected since the
+previous flush as one batched create_time_series call every
+METRICS_FLUSH_INTERVAL seconds, and again when the worker shuts down.
+
+Counters are written as DOUBLE gauges holding the total of the interval,
+the same kind the per-request writes created. Distributions go to a
+separate <name>_distribution metric with exponential buckets.
+
+The Cloud Monitoring types are imported by the first flush, on the
+background thread, so importing this module stays cheap at cold start.
+"""
+import atexit
+import math
+import os
+import signal
+import threading
+import time
+
+# Cloud Monitoring accepts one point per series every few seconds at most
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '10'))
+METRIC_PREFIX = 'custom.googleapis.com/flask_app/'
+# Time series accepted by a single create_time_series request
+MAX_SERIES_PER_CALL = 200
+# How long shutdown waits for the last flush
+METRICS_SHUTDOWN_TIMEOUT = float(os.environ.get('METRICS_SHUTDOWN_TIMEOUT', '5'))
+
+# Buckets [2^(i-1), 2^i) ms for i in 1..16, plus underflow and overflow
+BUCKET_SCALE = 1.0
+BUCKET_GROWTH = 2.0
+NUM_FINITE_BUCKETS = 16
+
+
+def _bucket_index(value):
+    if value < BUCKET_SCALE:
+        return 0
+    index = int(math.log(value / BUCKET_SCALE, BUCKET_GROWTH)) + 1
+    return min(index, NUM_FINITE_BUCKETS + 1)
+
+
+class _Distribution:
+    """Running count, mean, squared deviation and bucket counts"""
+
+    __slots__ = ('count', 'mean', 'm2', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.buckets = [0] * (NUM_FINITE_BUCKETS + 2)
+
+    def add(self, value):
+        # Welford's update keeps the variance numerically stable
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.buckets[_bucket_index(value)] += 1
+
+
+class MetricsAggregator:
+    """Collects metrics in memory and writes them in batches"""
+
+    def __init__(self, client, project_id, resource_type, resource_labels, interval=METRICS_FLUSH_INTERVAL):
+        self.client = client
+        self.project_id = project_id
+        self.resource_type = resource_type
+        self.resource_labels = resource_labels
+        self.interval = interval
+        self.shutdown_timeout = METRICS_SHUTDOWN_TIMEOUT
+        self._lock = threading.Lock()
+        # {(metric, sorted label items): total}
+        self._counters = {}
+        # {(metric, sorted label items): _Distribution}
+        self._distributions = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.dropped = 0
+
+    def count(self, metric_type, value=1, labels=None):
+        key = (metric_type, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, metric_type, value, labels=None):
+        key = (metric_type, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            distribution = self._distributions.get(key)
+            if distribution is None:
+                distribution = self._distributions[key] = _Distribution()
+            distribution.add(value)
+
+    def flush(self):
+        """Send everything collected since the last flush, returns the series count"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            distributions, self._distributions = self._distributions, {}
+
+        end_time = {'seconds': int(time.time())}
+        series = [self._series(metric, labels, end_time, double_value=float(total))
+                  for (metric, labels), total in counters.items()]
+        series += [self._series(f'{metric}_distribution', labels, end_time,
+                                distribution_value=self._distribution_value(distribution))
+                   for (metric, labels), distribution in distributions.items()]
+
+        for start in range(0, len(series), MAX_SERIES_PER_CALL):
+            batch = series[start:start + MAX_SERIES_PER_CALL]
+            try:
+                self.client.create_time_series(name=f'projects/{self.project_id}', time_series=batch)
+            except Exception as e:
+                # Dropped rather than re-queued, so a Monitoring outage
+                # cannot grow the buffer without bound
+                self.dropped += len(batch)
+                print(f"Failed to record metrics: {e}")
+        self.flushes += 1
+        return len(series)
+
+    def _series(self, metric_type, labels, end_time, **value):
+        from google.cloud import monitoring_v3
+
+        series = monitoring_v3.TimeSeries()
+        series.metric.type = METRIC_PREFIX + metric_type
+        series.metric.labels.update(dict(labels))
+        series.resource.type = self.resource_type
+        series.resource.labels.update(self.resource_labels)
+
+        point = monitoring_v3.Point()
+        point.interval.end_time = end_time
+        for field, field_value in value.items():
+            setattr(point.value, field, field_value)
+        series.points = [point]
+        return series
+
+    @staticmethod
+    def _distribution_value(distribution):
+        from google.api import distribution_pb2
+
+        exponential = distribution_pb2.Distribution.BucketOptions.Exponential(
+            num_finite_buckets=NUM_FINITE_BUCKETS, growth_factor=BUCKET_GROWTH, scale=BUCKET_SCALE
+        )
+        return distribution_pb2.Distribution(
+            count=distribution.count,
+            mean=distribution.mean,
+            sum_of_squared_deviation=distribution.m2,
+            bucket_options=distribution_pb2.Distribution.BucketOptions(exponential_buckets=exponential),
+            bucket_counts=distribution.buckets
+        )
+
+    def start(self):
+        """Flush from a daemon thread and once more at shutdown"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        self._chain_sigterm()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+        # The final flush also runs here, never on the thread stop() is called from
+        self.flush()
+
+    def stop(self):
+        """Wake the flush thread for a last flush and wait a bounded time for it"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.shutdown_timeout)
+
+    def _chain_sigterm(self):
+        """Flush on SIGTERM, then hand the signal to the previous handler"""
+        try:
+            previous = signal.getsignal(signal.SIGTERM)
+
+            def handle_sigterm(signum, frame):
+                # The interrupted request may hold self._lock, so the
+                # handler only waits (bounded) for the flush thread
+                self.stop()
+                if callable(previous):
+                    previous(signum, frame)
+                elif previous == signal.SIG_DFL:
+                    signal.signal(signum, signal.SIG_DFL)
+                    os.kill(os.getpid(), signum)
+
+            signal.signal(signal.SIGTERM, handle_sigterm)
+        except ValueError:
+            # Not the main thread: the atexit flush still applies
+            pass
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._counters) + len(self._distributions)
+        return {
+            'pending_series': pending,
+            'flushes': self.flushes,
+            'dropped_series': self.dropped,
+            'flush_interval_seconds': self.interval
+        }
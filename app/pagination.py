@@ -0,0 +1,66 @@
+"""Cursor-based pagination for GET /api/todos
+
+Cursors are todo ids. With order=asc the client passes the returned
+next_cursor as after_id, with order=desc as before_id.
+"""
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+
+MAX_PAGE_SIZE = 1000
+PAGE_ARGS = ('limit', 'after_id', 'before_id', 'order')
+
+_todo_id = attrgetter('id')
+
+
+def _int_arg(args, name, minimum):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if number < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return number
+
+
+def parse_page_args(args):
+    """Read pagination query parameters, None when the request has none"""
+    if not any(name in args for name in PAGE_ARGS):
+        return None
+
+    limit = _int_arg(args, 'limit', 1)
+    if limit is not None and limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit maximum {MAX_PAGE_SIZE}")
+
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+
+    return {
+        'limit': limit,
+        'after_id': _int_arg(args, 'after_id', 0),
+        'before_id': _int_arg(args, 'before_id', 1),
+        'order': order
+    }
+
+
+def page_of(todos, limit=None, after_id=None, before_id=None, order='asc'):
+    """Select one page from an id-ordered list without copying the list
+
+    Returns (page, next_cursor); next_cursor is None on the last page.
+    """
+    lo = 0 if after_id is None else bisect_right(todos, after_id, key=_todo_id)
+    hi = len(todos) if before_id is None else bisect_left(todos, before_id, key=_todo_id)
+    hi = max(lo, hi)
+
+    # Ranges slice in O(1), so only the selected items are ever touched
+    indices = range(hi - 1, lo - 1, -1) if order == 'desc' else range(lo, hi)
+
+    next_cursor = None
+    if limit is not None and len(indices) > limit:
+        indices = indices[:limit]
+        next_cursor = todos[indices[-1]].id
+
+    return [todos[i] for i in indices], next_cursor
@@ -0,0 +1,201 @@
+"""Bounded client partitions for the in-memory store
+
+Only the most recently used client partitions stay in memory. When the cap
+is reached the least recently used one is written to a spill directory and
+reloaded transparently on its next access. Reads for a client that never
+wrote anything allocate nothing.
+"""
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+
+from records import Todo
+
+# Window used for the eviction rate reported on /api/status
+EVICTION_RATE_WINDOW = 60
+
+
+class DiskSpillStore:
+    """One JSON file per evicted partition in a private directory"""
+
+    def __init__(self, base_dir=None):
+        # Each worker process gets its own directory, removed on exit
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='todo-spill-', dir=base_dir)
+        self._spilled = set()
+        atexit.register(self.close)
+
+    def close(self):
+        """Remove the directory and its exit hook"""
+        atexit.unregister(self.close)
+        shutil.rmtree(self.directory, True)
+        self._spilled.clear()
+
+    def _path(self, client_id):
+        digest = hashlib.sha256(client_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{digest}.json')
+
+    def __contains__(self, client_id):
+        return client_id in self._spilled
+
+    def __len__(self):
+        return len(self._spilled)
+
+    def client_ids(self):
+        return list(self._spilled)
+
+    def save(self, client_id, partition):
+        data = {
+            'client_id': client_id,
+            'next_id': partition['next_id'],
+            'version': partition['version'],
+            'todos': [[t.id, t.text, t.created_ms, t.encrypted] for t in partition['todos']]
+        }
+        path = self._path(client_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self._spilled.add(client_id)
+
+    def read(self, client_id):
+        """Return the spilled partition data without removing it"""
+        if client_id not in self._spilled:
+            return None
+        with open(self._path(client_id), encoding='utf-8') as f:
+            data = json.load(f)
+        return {
+            'next_id': data['next_id'],
+            'version': data['version'],
+            'todos': [Todo(text, created_ms, encrypted, todo_id)
+                      for todo_id, text, created_ms, encrypted in data['todos']]
+        }
+
+    def pop(self, client_id):
+        """Return the spilled partition data and forget it"""
+        data = self.read(client_id)
+        if data is not None:
+            os.remove(self._path(client_id))
+            self._spilled.discard(client_id)
+        return data
+
+
+class _Segment:
+    """One lock stripe: its own lock, LRU order and counters"""
+
+    def __init__(self):
+        # Re-entrant so the store can hold it across a whole write
+        self.lock = threading.RLock()
+        self.resident = OrderedDict()
+        self.evictions = 0
+        self.reloads = 0
+
+
+class PartitionManager:
+    """Lock-striped LRU map of client_id -> partition with spill-to-disk eviction
+
+    Clients are hashed onto independent segments, so unrelated clients
+    never wait on the same lock. Each segment keeps its own share of
+    max_resident and evicts its least recently used partition.
+    """
+
+    def __init__(self, new_partition, max_resident=10000, spill=None, stripes=16):
+        self._new_partition = new_partition
+        stripes = max(1, min(stripes, max_resident))
+        self._segments = [_Segment() for _ in range(stripes)]
+        self._segment_capacity = max(1, max_resident // stripes)
+        self.max_resident = self._segment_capacity * stripes
+        self.spill = spill if spill is not None else DiskSpillStore()
+        self._recent_evictions = deque(maxlen=100000)
+
+    def _segment(self, client_id):
+        return self._segments[hash(client_id) % len(self._segments)]
+
+    def lock(self, client_id):
+        """Lock guarding every partition that hashes to the same stripe"""
+        return self._segment(client_id).lock
+
+    def __len__(self):
+        return sum(len(segment.resident) for segment in self._segments) + len(self.spill)
+
+    def __contains__(self, client_id):
+        return client_id in self._segment(client_id).resident or client_id in self.spill
+
+    def get(self, client_id):
+        """Return the partition of a client, or None if it never wrote"""
+        segment = self._segment(client_id)
+        with segment.lock:
+            partition = segment.resident.get(client_id)
+            if partition is not None:
+                segment.resident.move_to_end(client_id)
+                return partition
+
+            data = self.spill.pop(client_id)
+            if data is None:
+                return None
+
+            # The change log is not spilled: clients behind it resync
+            partition = self._new_partition()
+            partition.update(data)
+            segment.reloads += 1
+            self._admit(segment, client_id, partition)
+            return partition
+
+    def client_ids(self):
+        """Resident and spilled client ids at this moment"""
+        ids = []
+        for segment in self._segments:
+            with segment.lock:
+                ids.extend(segment.resident)
+        return ids + self.spill.client_ids()
+
+    def peek(self, client_id):
+        """Partition data without loading or reordering it, None if unknown"""
+        segment = self._segment(client_id)
+        with segment.lock:
+            partition = segment.resident.get(client_id)
+            return partition if partition is not None else self.spill.read(client_id)
+
+    def remove(self, client_id):
+        """Forget the partition of a client, resident or spilled"""
+        segment = self._segment(client_id)
+        with segment.lock:
+            if segment.resident.pop(client_id, None) is None:
+                self.spill.pop(client_id)
+
+    def get_or_create(self, client_id):
+        segment = self._segment(client_id)
+        with segment.lock:
+            partition = self.get(client_id)
+            if partition is None:
+                partition = self._new_partition()
+                self._admit(segment, client_id, partition)
+            return partition
+
+    def _admit(self, segment, client_id, partition):
+        segment.resident[client_id] = partition
+        while len(segment.resident) > self._segment_capacity:
+            idle_id, idle = segment.resident.popitem(last=False)
+            self.spill.save(idle_id, idle)
+            segment.evictions += 1
+            self._recent_evictions.append(time.monotonic())
+
+    def stats(self):
+        cutoff = time.monotonic() - EVICTION_RATE_WINDOW
+        recent = sum(1 for evicted_at in list(self._recent_evictions) if evicted_at >= cutoff)
+        return {
+            'resident_clients': sum(len(segment.resident) for segment in self._segments),
+            'spilled_clients': len(self.spill),
+            'max_resident_clients': self.max_resident,
+            'lock_stripes': len(self._segments),
+            'evictions_total': sum(segment.evictions for segment in self._segments),
+            'reloads_total': sum(segment.reloads for segment in self._segments),
+            'evictions_per_minute': recent * 60 / EVICTION_RATE_WINDOW
+        }
@@ -0,0 +1,198 @@
+"""On-demand sampling profiler for production requests
+
+A profiled request gets a sampler thread that reads the handler thread's
+stack every PROFILE_INTERVAL_SECONDS (sys._current_frames, no tracing, so
+unprofiled code runs at full speed). Samples are saved as collapsed stacks,
+
+    main.py:get_todos;response_cache.py:list_body;records.py:to_dicts 12
+
+one line per distinct stack, ready for flamegraph.pl or speedscope.
+
+Requests are profiled when they carry X-Profile-Token equal to
+PROFILE_ADMIN_TOKEN, or once every PROFILE_SAMPLE_RATE requests (0 turns
+sampling off). Files go to a ring of at most PROFILE_MAX_FILES in
+PROFILE_DIR, the oldest is deleted first. The same token lists them at
+GET /admin/profiles and downloads one at GET /admin/profiles/<name>.
+"""
+import hmac
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import abort, g, jsonify, request, send_file
+
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_ADMIN_TOKEN = os.environ.get('PROFILE_ADMIN_TOKEN', '')
+# /tmp is the only writable directory on App Engine standard
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/profiles')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '50'))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL_SECONDS', '0.001'))
+
+TOKEN_HEADER = 'X-Profile-Token'
+FILE_NAME = re.compile(r'^[0-9]+-[0-9]+-[0-9]+-[A-Za-z0-9_.-]*\.folded$')
+
+
+class StackSampler:
+    """Collects the stacks of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return {collapsed stack: samples}"""
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class ProfileRing:
+    """Directory keeping the newest max_files profiles"""
+
+    def __init__(self, directory=PROFILE_DIR, max_files=PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def write(self, label, stacks):
+        """Save collapsed stacks and return the file name"""
+        label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_')[:60]
+        name = f'{int(time.time() * 1000)}-{os.getpid()}-{next(self._seq)}-{label}.folded'
+        lines = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+                f.write(lines)
+            self._prune()
+        return name
+
+    def _prune(self):
+        for name in self.names()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def names(self):
+        """Profile file names, newest first"""
+        try:
+            names = [name for name in os.listdir(self.directory) if FILE_NAME.match(name)]
+        except OSError:
+            return []
+        return sorted(names, key=lambda name: tuple(int(part) for part in name.split('-', 3)[:3]), reverse=True)
+
+    def list(self):
+        profiles = []
+        for name in self.names():
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            profiles.append({'name': name, 'bytes': info.st_size, 'modified': int(info.st_mtime)})
+        return profiles
+
+    def path(self, name):
+        """Full path of a profile, None for unknown or malformed names"""
+        if not FILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+class Profiler:
+    """Flask hooks that profile sampled or token-bearing requests"""
+
+    def __init__(self, ring=None, sample_rate=PROFILE_SAMPLE_RATE, token=PROFILE_ADMIN_TOKEN,
+                 interval=PROFILE_INTERVAL_SECONDS):
+        self.ring = ring or ProfileRing()
+        self.sample_rate = sample_rate
+        self.token = token
+        self.interval = interval
+        self._requests = itertools.count(1)
+        self.profiled = 0
+
+    def has_token(self):
+        supplied = request.headers.get(TOKEN_HEADER)
+        return bool(self.token and supplied and hmac.compare_digest(supplied, self.token))
+
+    def wanted(self):
+        if self.has_token():
+            return True
+        return bool(self.sample_rate) and next(self._requests) % self.sample_rate == 0
+
+    def install(self, app):
+        def start():
+            if request.path.startswith('/admin/profiles') or not self.wanted():
+                return
+            g.profile_sampler = StackSampler(threading.get_ident(), self.interval).start()
+
+        def finish(response):
+            sampler = g.pop('profile_sampler', None)
+            if sampler is None:
+                return response
+            rule = request.url_rule
+            try:
+                name = self.ring.write(f'{request.method}_{rule.rule if rule else "unmatched"}', sampler.stop())
+                response.headers['X-Profile'] = name
+                self.profiled += 1
+            except OSError as e:
+                print(f"Failed to save profile: {e}")
+            return response
+
+        def cleanup(exc):
+            sampler = g.pop('profile_sampler', None)
+            if sampler is not None:
+                sampler.stop()
+
+        def list_profiles():
+            if not self.has_token():
+                abort(403)
+            return jsonify({'profiles': self.ring.list()})
+
+        def download_profile(name):
+            if not self.has_token():
+                abort(403)
+            path = self.ring.path(name)
+            if path is None:
+                abort(404)
+            return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+
+        app.before_request_funcs.setdefault(None, []).insert(0, start)
+        app.after_request(finish)
+        app.teardown_request(cleanup)
+        app.add_url_rule('/admin/profiles', 'list_profiles', list_profiles)
+        app.add_url_rule('/admin/profiles/<name>', 'download_profile', download_profile)
+
+    def stats(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'token_configured': bool(self.token),
+            'profiled': self.profiled,
+            'stored': len(self.ring.names())
+        }
@@ -0,0 +1,66 @@
+"""Compact todo records
+
+Millions of todos live in memory, so each one is a __slots__ object with
+the creation time kept as integer epoch milliseconds. The ISO string the
+API returns is only built while serializing.
+"""
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+
+def now_ms():
+    """Current time as integer epoch milliseconds"""
+    return time.time_ns() // 1_000_000
+
+
+def format_timestamp(ms):
+    """Epoch milliseconds to the API's ISO format, e.g. 2025-10-15T10:30:00.123Z"""
+    seconds, millis = divmod(ms, 1000)
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)) + f'.{millis:03d}Z'
+
+
+class Todo:
+    """A single todo item"""
+
+    __slots__ = ('id', 'text', 'created_ms', 'encrypted')
+
+    def __init__(self, text, created_ms=None, encrypted=None, id=0):
+        self.id = id
+        self.text = text
+        self.created_ms = now_ms() if created_ms is None else created_ms
+        # None for apps without encryption, so the field is left out
+        self.encrypted = encrypted
+
+    @property
+    def created_at(self):
+        return format_timestamp(self.created_ms)
+
+    def to_dict(self, text=None):
+        """API representation, optionally with replacement (decrypted) text"""
+        data = {
+            'id': self.id,
+            'text': self.text if text is None else text,
+            'created_at': format_timestamp(self.created_ms)
+        }
+        if self.encrypted is not None:
+            data['encrypted'] = self.encrypted
+        return data
+
+    def __repr__(self):
+        return f'Todo(id={self.id!r}, text={self.text!r}, created_ms={self.created_ms!r})'
+
+
+def to_dicts(todos):
+    """API representation of several todos"""
+    return [todo.to_dict() for todo in todos]
+
+
+class TodoJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes Todo records"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Todo):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
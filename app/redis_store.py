@@ -0,0 +1,299 @@
+"""Redis storage backend, shared by every pod of a deployment
+
+Select it with TODO_STORE_BACKEND=redis and point REDIS_URL at the server.
+Each todo list is a Redis list of compact JSON rows [id, text, created_ms,
+encrypted] in id order, next to a hash holding its id counter and version:
+
+    todo:todos:<client_id>   RPUSHed rows, the global list uses client_id ''
+    todo:meta:<client_id>    {'last_id': n, 'version': n}
+    todo:clients             set of client ids that wrote something
+    todo:data_keys           {key_version: wrapped data key}
+    todo:epoch               shared by every worker, see http_cache.py
+
+A write is one EVALSHA: the script reserves the ids with HINCRBY (INCR on a
+hash field) and appends the rows atomically, so list order always matches
+id order. Todos are never removed, so the todo with id n sits at index
+n - 1 and a page is a single LRANGE (a small script for descending pages,
+which must clamp to the list end). Every read is one round trip: a full
+list and its version, or the version and the rows after a cached one (delta
+reads, response cache splices), come from one MULTI/EXEC pipeline.
+Conditional GETs only read the version.
+"""
+import json
+import os
+import secrets
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+from records import Todo
+from storage import CHANGE_LOG_SIZE, GLOBAL_SCOPE
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+TODO_REDIS_POOL_SIZE = int(os.environ.get('TODO_REDIS_POOL_SIZE', '16'))
+TODO_REDIS_PREFIX = os.environ.get('TODO_REDIS_PREFIX', 'todo:')
+# Comma-separated URLs of the shards of a sharded store, see sharding.py.
+# Without it shard n uses database n of REDIS_URL
+TODO_REDIS_SHARD_URLS = os.environ.get('TODO_REDIS_SHARD_URLS', '')
+# Seconds a request waits for a free pooled connection
+TODO_REDIS_POOL_TIMEOUT = float(os.environ.get('TODO_REDIS_POOL_TIMEOUT', '5'))
+
+# KEYS: todo list, meta hash, clients set
+# ARGV: client id ('' for the global list), then one row per todo without
+# its leading '[id,' which only the script knows
+_ADD_TODOS = """
+local count = #ARGV - 1
+local last_id = redis.call('HINCRBY', KEYS[2], 'last_id', count)
+redis.call('HINCRBY', KEYS[2], 'version', count)
+local first_id = last_id - count + 1
+for i = 2, #ARGV do
+    redis.call('RPUSH', KEYS[1], '[' .. (first_id + i - 2) .. ',' .. ARGV[i])
+end
+if ARGV[1] ~= '' then
+    redis.call('SADD', KEYS[3], ARGV[1])
+end
+return {first_id, redis.call('LLEN', KEYS[1])}
+"""
+# Rows of a descending page in list order, clamped to the list end which
+# the caller does not know. KEYS: todo list. ARGV: lowest index, highest
+# index (-1 for the end), row count (-1 for all)
+_PAGE_DESC = """
+local length = redis.call('LLEN', KEYS[1])
+local high = tonumber(ARGV[2])
+if high < 0 or high >= length then
+    high = length - 1
+end
+local low = tonumber(ARGV[1])
+local count = tonumber(ARGV[3])
+if count >= 0 and high - count + 1 > low then
+    low = high - count + 1
+end
+if high < low then
+    return {}
+end
+return redis.call('LRANGE', KEYS[1], low, high)
+"""
+
+
+def shard_url(index):
+    """URL of the Redis database holding shard index"""
+    urls = [url.strip() for url in TODO_REDIS_SHARD_URLS.split(',') if url.strip()]
+    if urls:
+        return urls[index]
+    return urlunsplit(urlsplit(REDIS_URL)._replace(path=f'/{index}'))
+
+
+def _encode_tail(todo):
+    """Row of todo without its id, e.g. '"text",1760524200000,null]'"""
+    row = json.dumps([todo.text, todo.created_ms, todo.encrypted], separators=(',', ':'), ensure_ascii=False)
+    return row[1:]
+
+
+def _encode_row(todo):
+    return json.dumps([todo.id, todo.text, todo.created_ms, todo.encrypted], separators=(',', ':'), ensure_ascii=False)
+
+
+def _decode(row):
+    todo_id, text, created_ms, encrypted = json.loads(row)
+    return Todo(text, created_ms, encrypted, todo_id)
+
+
+class RedisStore:
+    """Redis storage shared by every worker and pod, see the module docstring"""
+
+    name = 'redis'
+
+    def __init__(self, url=REDIS_URL, pool_size=TODO_REDIS_POOL_SIZE, prefix=TODO_REDIS_PREFIX,
+                 client_factory=None):
+        if redis is None and client_factory is None:
+            raise RuntimeError("TODO_STORE_BACKEND=redis needs the redis package")
+        self.url = url
+        self.pool_size = pool_size
+        self.prefix = prefix
+        # Builds a client with decode_responses=True, e.g. a fakeredis one in tests
+        self._client_factory = client_factory
+        self._pid = None
+        self._client = None
+        self._add_script = None
+        self._page_desc_script = None
+        self._lock = threading.Lock()
+
+        pipe = self._redis().pipeline()
+        pipe.setnx(prefix + 'epoch', secrets.token_hex(4))
+        pipe.get(prefix + 'epoch')
+        self.epoch = pipe.execute()[1]
+
+    def _connect(self):
+        if self._client_factory is not None:
+            return self._client_factory()
+        # Blocking, so a burst beyond pool_size waits instead of failing
+        pool = redis.BlockingConnectionPool.from_url(
+            self.url, max_connections=self.pool_size, timeout=TODO_REDIS_POOL_TIMEOUT, decode_responses=True
+        )
+        return redis.Redis(connection_pool=pool)
+
+    def _redis(self):
+        # gunicorn forks workers after the app module is imported, so each
+        # worker builds its own client and connection pool on first use
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._client = self._connect()
+                    self._add_script = self._client.register_script(_ADD_TODOS)
+                    self._page_desc_script = self._client.register_script(_PAGE_DESC)
+                    self._pid = pid
+        return self._client
+
+    def _key(self, kind, client_id):
+        return f'{self.prefix}{kind}:{client_id or GLOBAL_SCOPE}'
+
+    def version(self, client_id=None):
+        """Return the list version, bumped on every write"""
+        version = self._redis().hget(self._key('meta', client_id), 'version')
+        return int(version) if version else 0
+
+    def list_todos(self, client_id=None):
+        """Return the todos of a client, or the global list"""
+        return [_decode(row) for row in self._redis().lrange(self._key('todos', client_id), 0, -1)]
+
+    def list_with_version(self, client_id=None):
+        """Return (version, todos) of a list, one MULTI/EXEC round trip"""
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.hget(self._key('meta', client_id), 'version')
+        pipe.lrange(self._key('todos', client_id), 0, -1)
+        version, rows = pipe.execute()
+        return (int(version) if version else 0), [_decode(row) for row in rows]
+
+    def page_todos(self, client_id=None, limit=None, after_id=None, before_id=None, order='asc'):
+        """Return (page, next_cursor) for a cursor-paginated listing"""
+        # List indexes: ids after after_id start at index after_id, ids
+        # before before_id end at index before_id - 2
+        low = max(after_id or 0, 0)
+        high = None if before_id is None else before_id - 2
+        if high is not None and high < low:
+            return [], None
+
+        # Fetch one extra row to learn whether another page exists
+        key = self._key('todos', client_id)
+        if order == 'desc':
+            self._redis()
+            rows = self._page_desc_script(keys=[key], args=[
+                low, -1 if high is None else high, -1 if limit is None else limit + 1
+            ])
+            rows.reverse()
+        else:
+            end = -1 if high is None else high
+            if limit is not None:
+                end = low + limit if high is None else min(high, low + limit)
+            rows = self._redis().lrange(key, low, end)
+        todos = [_decode(row) for row in rows]
+
+        next_cursor = None
+        if limit is not None and len(todos) > limit:
+            todos = todos[:limit]
+            next_cursor = todos[-1].id
+        return todos, next_cursor
+
+    def changes_since(self, client_id, since):
+        """Return (version, changes) after version since, changes is None if too old"""
+        # Only creates exist, so the changes after since are the todos with
+        # ids above it. One transaction so the version and the rows agree
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.hget(self._key('meta', client_id), 'version')
+        pipe.lrange(self._key('todos', client_id), max(since, 0), since + CHANGE_LOG_SIZE - 1)
+        version, rows = pipe.execute()
+        version = int(version) if version else 0
+
+        missing = version - since
+        if missing == 0:
+            return version, []
+        # Negative means a version from another epoch, too many means too old
+        if since < 0 or missing < 0 or missing > CHANGE_LOG_SIZE:
+            return version, None
+        return version, [
+            {'version': since + offset + 1, 'op': 'create', 'todo': _decode(row)}
+            for offset, row in enumerate(rows[:missing])
+        ]
+
+    def add_todo(self, client_id, todo):
+        """Assign the next id to todo, store it and return the new list size"""
+        return self.add_todos(client_id, [todo])
+
+    def add_todos(self, client_id, todos):
+        """Store todos under a contiguous id range and return the new list size"""
+        self._redis()
+        scope = client_id or GLOBAL_SCOPE
+        first_id, count = self._add_script(
+            keys=[self._key('todos', scope), self._key('meta', scope), self.prefix + 'clients'],
+            args=[scope] + [_encode_tail(todo) for todo in todos]
+        )
+        for offset, todo in enumerate(todos):
+            todo.id = first_id + offset
+        return count
+
+    def users_count(self):
+        return self._redis().scard(self.prefix + 'clients')
+
+    def global_count(self):
+        return self.count_todos(None)
+
+    def count_todos(self, client_id=None):
+        return self._redis().llen(self._key('todos', client_id))
+
+    def save_data_key(self, key_version, wrapped_key):
+        """Keep a KMS-wrapped data key, see envelope.py"""
+        self._redis().hsetnx(self.prefix + 'data_keys', key_version, wrapped_key)
+
+    def load_data_key(self, key_version):
+        return self._redis().hget(self.prefix + 'data_keys', key_version)
+
+    def data_key_versions(self):
+        return self._redis().hkeys(self.prefix + 'data_keys')
+
+    def client_ids(self):
+        """Ids of every client with todos, without the global list"""
+        return list(self._redis().smembers(self.prefix + 'clients'))
+
+    def export_partition(self, client_id):
+        """Return (next_id, version, todos) of a client, None if unknown"""
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.hmget(self._key('meta', client_id), 'last_id', 'version')
+        pipe.lrange(self._key('todos', client_id), 0, -1)
+        (last_id, version), rows = pipe.execute()
+        if version is None:
+            return None
+        return int(last_id) + 1, int(version), [_decode(row) for row in rows]
+
+    def restore_partition(self, client_id, next_id, version, todos):
+        """Replace the partition of a client, e.g. one moved from another shard"""
+        scope = client_id or GLOBAL_SCOPE
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.delete(self._key('todos', scope), self._key('meta', scope))
+        if todos:
+            pipe.rpush(self._key('todos', scope), *[_encode_row(todo) for todo in todos])
+        pipe.hset(self._key('meta', scope), mapping={'last_id': next_id - 1, 'version': version})
+        if scope:
+            pipe.sadd(self.prefix + 'clients', scope)
+        pipe.execute()
+
+    def drop_partition(self, client_id):
+        scope = client_id or GLOBAL_SCOPE
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.delete(self._key('todos', scope), self._key('meta', scope))
+        pipe.srem(self.prefix + 'clients', scope)
+        pipe.execute()
+
+    def warm(self):
+        """Open a connection and load the scripts on the server"""
+        client = self._redis()
+        client.ping()
+        client.script_load(_ADD_TODOS)
+        client.script_load(_PAGE_DESC)
+
+    def stats(self):
+        return {'prefix': self.prefix, 'pool_size': self.pool_size}
@@ -0,0 +1,395 @@
+"""Leader/follower log shipping between app instances
+
+With TODO_REPLICATION_ROLE=leader the instance numbers every write into an
+in-memory log of the last TODO_REPLICATION_LOG_SIZE records (the journal's
+record format, see journal.py). Followers (TODO_REPLICATION_ROLE=follower,
+TODO_REPLICATION_LEADER_URL) tail it over HTTP and replay it into their own
+in-memory store:
+
+    GET /_replication/log?after=<seq>   records after seq, long-polled for up
+                                        to TODO_REPLICATION_POLL_WAIT seconds
+    GET /_replication/snapshot          the full state as JSON lines and the
+                                        seq it includes
+
+A follower starts from a snapshot, and takes a new one when the records it
+needs have left the log (410) or the leader restarted (new epoch). Both
+endpoints need X-Replication-Token equal to TODO_REPLICATION_TOKEN.
+
+A follower answers GET /api/todos* itself while it is at most
+TODO_REPLICATION_MAX_STALENESS_MS behind the leader, and says how far
+behind in X-Replica-Staleness-Ms. Staler reads and every write are
+forwarded to the leader and answered with its response (clients may not
+reach the leader's internal URL, so there is no redirect). Staleness is
+measured from the start of the last poll that returned everything the
+leader had, plus the time the leader held that poll, so it never
+understates the lag.
+
+The leader keeps its log in memory, so it runs as a single worker process
+(with threads); followers may run several workers, each tails the leader.
+"""
+import hmac
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from itertools import islice
+
+from flask import Response, g, jsonify, request
+
+from journal import apply_record, load_snapshot, snapshot_lines, todo_row
+from storage import GLOBAL_SCOPE, InMemoryStore
+
+TODO_REPLICATION_ROLE = os.environ.get('TODO_REPLICATION_ROLE', '')
+TODO_REPLICATION_LEADER_URL = os.environ.get('TODO_REPLICATION_LEADER_URL', '')
+TODO_REPLICATION_TOKEN = os.environ.get('TODO_REPLICATION_TOKEN', '')
+TODO_REPLICATION_LOG_SIZE = int(os.environ.get('TODO_REPLICATION_LOG_SIZE', '10000'))
+# Records per poll, and how long the leader holds a poll with nothing new
+TODO_REPLICATION_BATCH = int(os.environ.get('TODO_REPLICATION_BATCH', '1000'))
+TODO_REPLICATION_POLL_WAIT = float(os.environ.get('TODO_REPLICATION_POLL_WAIT', '1'))
+TODO_REPLICATION_MAX_STALENESS_MS = float(os.environ.get('TODO_REPLICATION_MAX_STALENESS_MS', '2000'))
+
+TOKEN_HEADER = 'X-Replication-Token'
+ROLE_HEADER = 'X-Replica-Role'
+STALENESS_HEADER = 'X-Replica-Staleness-Ms'
+_LOCK_STRIPES = 64
+# Request and response headers passed through when forwarding to the leader
+_FORWARDED_REQUEST_HEADERS = ('Content-Type', 'If-None-Match', 'User-Agent')
+_FORWARDED_RESPONSE_HEADERS = (
+    'Content-Type', 'Cache-Control', 'ETag', 'X-Todos-Epoch', 'X-Todos-Version',
+    'X-Todos-Truncated', 'X-Next-Cursor', ROLE_HEADER, STALENESS_HEADER
+)
+_FORWARD_TIMEOUT = 10
+# Pause after a failed poll, so a missing leader is not hammered
+_RETRY_SECONDS = 1
+
+
+class ReadOnlyReplica(Exception):
+    """Writes must go to the leader"""
+
+
+class ReplicationLog:
+    """Numbered ring buffer of the latest writes, tailed by followers"""
+
+    def __init__(self, size=TODO_REPLICATION_LOG_SIZE):
+        self.size = size
+        self.seq = 0
+        self._records = deque(maxlen=size)
+        self._changed = threading.Condition()
+
+    def append(self, record):
+        with self._changed:
+            self.seq += 1
+            self._records.append(record)
+            self._changed.notify_all()
+            return self.seq
+
+    def read(self, after, limit=TODO_REPLICATION_BATCH, wait=0):
+        """Return ([[seq, record], ...], leader seq) after seq after, None if no longer in the log"""
+        with self._changed:
+            if after == self.seq and wait > 0:
+                self._changed.wait_for(lambda: self.seq > after, wait)
+            first = self.seq - len(self._records) + 1
+            # Evicted already, or a seq from before a restart
+            if after < first - 1 or after > self.seq:
+                return None
+            records = list(islice(self._records, after - first + 1, after - first + 1 + limit))
+            return [[after + 1 + offset, record] for offset, record in enumerate(records)], self.seq
+
+    def stats(self):
+        return {'seq': self.seq, 'records': len(self._records), 'size': self.size}
+
+
+class LeaderStore:
+    """Store wrapper that numbers every write into a ReplicationLog"""
+
+    def __init__(self, store, log):
+        if not hasattr(store, 'export_partitions'):
+            raise ValueError(f"Replication needs the memory backend, not {store.name}")
+        self._store = store
+        self.log = log
+        # Writes of one client reach the log in id order
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+    def add_todo(self, client_id, todo):
+        """Assign the next id to todo, store it and return the new list size"""
+        return self.add_todos(client_id, [todo])
+
+    def add_todos(self, client_id, todos):
+        """Store todos under a contiguous id range and return the new list size"""
+        scope = client_id or GLOBAL_SCOPE
+        with self._locks[hash(scope) % _LOCK_STRIPES]:
+            count = self._store.add_todos(client_id, todos)
+            self.log.append(['t', scope, [todo_row(todo) for todo in todos]])
+        return count
+
+    def save_data_key(self, key_version, wrapped_key):
+        """Keep a KMS-wrapped data key, see envelope.py"""
+        self._store.save_data_key(key_version, wrapped_key)
+        self.log.append(['k', key_version, wrapped_key])
+
+
+class FollowerStore:
+    """Read-only replica of the leader's store, kept current by a log-tailing thread"""
+
+    def __init__(self, leader_url, token=TODO_REPLICATION_TOKEN, batch=TODO_REPLICATION_BATCH,
+                 poll_wait=TODO_REPLICATION_POLL_WAIT, new_store=InMemoryStore):
+        self.leader_url = leader_url.rstrip('/')
+        self.token = token
+        self.batch = batch
+        self.poll_wait = poll_wait
+        self._new_store = new_store
+        self._store = new_store()
+        self._retired = None
+        # The leader's epoch, so versions and ETags match on every instance
+        self.epoch = None
+        self.applied = 0
+        self.synced_at = None
+        self.snapshots = 0
+        self.records = 0
+        self.failures = 0
+        self.last_error = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+    def add_todo(self, client_id, todo):
+        raise ReadOnlyReplica(self.leader_url)
+
+    def add_todos(self, client_id, todos):
+        raise ReadOnlyReplica(self.leader_url)
+
+    def save_data_key(self, key_version, wrapped_key):
+        raise ReadOnlyReplica(self.leader_url)
+
+    def staleness_ms(self):
+        """How far behind the leader reads may be, None before the first sync"""
+        if self.synced_at is None:
+            return None
+        return (time.monotonic() - self.synced_at) * 1000
+
+    def start(self):
+        """Start tailing the leader from this process"""
+        pid = os.getpid()
+        # gunicorn may fork after the app is built, threads do not follow
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    threading.Thread(target=self._run, name='replication-follower', daemon=True).start()
+                    self._pid = pid
+
+    def _get(self, path, timeout):
+        req = urllib.request.Request(self.leader_url + path, headers={TOKEN_HEADER: self.token})
+        return urllib.request.urlopen(req, timeout=timeout)
+
+    def catch_up(self):
+        """Replace the local state with a snapshot of the leader"""
+        store = self._new_store()
+        try:
+            with self._get('/_replication/snapshot', timeout=60) as response:
+                header, _ = load_snapshot(store, (line.decode('utf-8') for line in response))
+        except BaseException:
+            store.close()
+            raise
+        # Reads still running on the replaced store finish before the
+        # next snapshot, only then is it closed
+        retired, self._retired = self._retired, self._store
+        self._store = store
+        if retired is not None:
+            retired.close()
+        self.epoch = header['epoch']
+        self.applied = header['seq']
+        self.snapshots += 1
+
+    def poll(self):
+        """Apply the next batch of the leader's log, returns whether more is waiting"""
+        started = time.monotonic()
+        query = urllib.parse.urlencode({'after': self.applied, 'limit': self.batch, 'wait': self.poll_wait})
+        try:
+            with self._get(f'/_replication/log?{query}', timeout=self.poll_wait + 10) as response:
+                body = json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code != 410:
+                raise
+            self.catch_up()
+            return True
+
+        if body['epoch'] != self.epoch:
+            self.catch_up()
+            return True
+        for seq, record in body['records']:
+            apply_record(self._store, record)
+            self.applied = seq
+            self.records += 1
+        if self.applied < body['seq']:
+            return True
+        # Everything the leader had when it answered is applied
+        self.synced_at = started + body['waited']
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                if self.epoch is None:
+                    self.catch_up()
+                self.poll()
+                self.last_error = None
+            except (OSError, ValueError, KeyError) as e:
+                self.failures += 1
+                if self.last_error is None:
+                    print(f"Failed to replicate from {self.leader_url}: {e}")
+                self.last_error = str(e)
+                time.sleep(_RETRY_SECONDS)
+
+    def stats(self):
+        staleness = self.staleness_ms()
+        return {
+            'leader_url': self.leader_url,
+            'applied_seq': self.applied,
+            'staleness_ms': None if staleness is None else round(staleness, 1),
+            'records': self.records,
+            'snapshots': self.snapshots,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'store': self._store.stats()
+        }
+
+
+class Replication:
+    """Wraps the store for TODO_REPLICATION_ROLE and installs its endpoints"""
+
+    def __init__(self, store, role=TODO_REPLICATION_ROLE, leader_url=TODO_REPLICATION_LEADER_URL,
+                 token=TODO_REPLICATION_TOKEN, max_staleness_ms=TODO_REPLICATION_MAX_STALENESS_MS,
+                 log_size=TODO_REPLICATION_LOG_SIZE):
+        self.role = role or 'off'
+        self.token = token
+        self.max_staleness_ms = max_staleness_ms
+        self.log = None
+        if self.role == 'off':
+            self.store = store
+        elif self.role == 'leader':
+            self.log = ReplicationLog(log_size)
+            self.store = LeaderStore(store, self.log)
+        elif self.role == 'follower':
+            if not leader_url:
+                raise ValueError("TODO_REPLICATION_LEADER_URL is required for a follower")
+            self.store = FollowerStore(leader_url, token)
+        else:
+            raise ValueError(f"Unknown replication role: {role}")
+
+    def has_token(self):
+        supplied = request.headers.get(TOKEN_HEADER, '')
+        return bool(self.token and supplied and hmac.compare_digest(supplied, self.token))
+
+    def install(self, app):
+        if self.role == 'leader':
+            self._install_leader(app)
+        elif self.role == 'follower':
+            self._install_follower(app)
+
+    def _install_leader(self, app):
+        @app.route('/_replication/log')
+        def replication_log():
+            if not self.has_token():
+                return jsonify({'error': 'replication token required'}), 403
+            try:
+                after = int(request.args.get('after', '0'))
+                limit = min(int(request.args.get('limit', TODO_REPLICATION_BATCH)), TODO_REPLICATION_BATCH)
+                wait = min(float(request.args.get('wait', '0')), TODO_REPLICATION_POLL_WAIT)
+            except ValueError:
+                return jsonify({'error': 'after, limit and wait must be numbers'}), 400
+
+            started = time.monotonic()
+            result = self.log.read(after, limit, wait)
+            if result is None:
+                return jsonify({'error': 'snapshot required', 'epoch': self.store.epoch, 'seq': self.log.seq}), 410
+            records, seq = result
+            return jsonify({
+                'epoch': self.store.epoch,
+                'seq': seq,
+                'records': records,
+                'waited': time.monotonic() - started
+            })
+
+        @app.route('/_replication/snapshot')
+        def replication_snapshot():
+            if not self.has_token():
+                return jsonify({'error': 'replication token required'}), 403
+            # The header is built before any partition is copied, so the
+            # snapshot holds at least every record up to its seq
+            lines = snapshot_lines(self.store, epoch=self.store.epoch, seq=self.log.seq)
+            return Response(lines, mimetype='application/x-ndjson')
+
+        @app.after_request
+        def add_leader_headers(response):
+            if request.path.startswith('/api/todos'):
+                response.headers[ROLE_HEADER] = 'leader'
+                response.headers[STALENESS_HEADER] = '0'
+            return response
+
+    def _forward(self):
+        """Send the current request to the leader and relay its answer"""
+        headers = {name: request.headers[name] for name in _FORWARDED_REQUEST_HEADERS if name in request.headers}
+        req = urllib.request.Request(
+            self.store.leader_url + request.full_path.rstrip('?'),
+            data=request.get_data() or None, method=request.method, headers=headers
+        )
+        try:
+            response = urllib.request.urlopen(req, timeout=_FORWARD_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            # 304 and error statuses are answers too
+            response = e
+        except OSError as e:
+            print(f"Failed to forward {request.method} {request.path} to the leader: {e}")
+            return jsonify({'error': 'leader unavailable'}), 503
+        with response:
+            body = response.read()
+            relayed = [(name, value) for name, value in response.headers.items()
+                       if name in _FORWARDED_RESPONSE_HEADERS]
+        return Response(body, status=response.status, headers=relayed)
+
+    def _install_follower(self, app):
+        follower = self.store
+        follower.start()
+
+        @app.before_request
+        def serve_or_forward():
+            follower.start()
+            if not request.path.startswith('/api/todos') or request.method == 'OPTIONS':
+                return None
+            if request.method != 'GET':
+                return self._forward()
+            staleness = follower.staleness_ms()
+            if staleness is None or staleness > self.max_staleness_ms:
+                return self._forward()
+            g.replica_staleness_ms = staleness
+            return None
+
+        @app.errorhandler(ReadOnlyReplica)
+        def write_on_follower(e):
+            return self._forward()
+
+        @app.after_request
+        def add_follower_headers(response):
+            staleness = g.get('replica_staleness_ms')
+            if staleness is not None:
+                response.headers[ROLE_HEADER] = 'follower'
+                response.headers[STALENESS_HEADER] = str(int(staleness))
+            return response
+
+    def stats(self):
+        stats = {'role': self.role}
+        if self.role == 'leader':
+            stats['log'] = self.log.stats()
+        elif self.role == 'follower':
+            stats.update(self.store.stats())
+            stats['max_staleness_ms'] = self.max_staleness_ms
+        return stats
@@ -0,0 +1,170 @@
+"""Per-route request metrics exposed at /metrics in Prometheus text format
+
+Every request is timed with time.perf_counter and counted in a fixed-bucket
+histogram labelled by route template (e.g. /api/todos, never the raw URL),
+method and status code. That covers rate (_count), errors (status 5xx) and
+duration (_bucket / _sum).
+
+Gunicorn workers are separate processes. With PROMETHEUS_MULTIPROC_DIR set,
+each worker writes its totals to metrics-<pid>.json in that directory every
+METRICS_SNAPSHOT_SECONDS, and /metrics adds up the files of all workers.
+Files of exited workers are kept so counters never go backwards; clear the
+directory when the server is (re)started.
+
+Phases timed by server_timing.py can be added as a second histogram,
+app_phase_duration_seconds, labelled by route and phase.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+METRICS_SNAPSHOT_SECONDS = float(os.environ.get('METRICS_SNAPSHOT_SECONDS', '5'))
+
+# Upper bounds in seconds, +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_NAME = 'http_request_duration_seconds'
+PHASE_METRIC_NAME = 'app_phase_duration_seconds'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestMetrics:
+    """Request latency histograms of one worker process"""
+
+    def __init__(self, directory=PROMETHEUS_MULTIPROC_DIR, snapshot_seconds=METRICS_SNAPSHOT_SECONDS, pid=None):
+        self.directory = directory
+        self.snapshot_seconds = snapshot_seconds
+        self.pid = pid or os.getpid()
+        # {(route, method, status): [bucket counts..., +Inf count, sum]}
+        self._series = {}
+        # {(route, phase): same layout}
+        self._phases = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def observe(self, route, method, status, seconds):
+        self._add(self._series, (route, method, status), seconds)
+
+    def observe_phase(self, route, phase, seconds):
+        self._add(self._phases, (route, phase), seconds)
+
+    def _add(self, histograms, key, seconds):
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = histograms.get(key)
+            if series is None:
+                series = histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        """Copies of (request histograms, phase histograms)"""
+        with self._lock:
+            return ({key: list(series) for key, series in self._series.items()},
+                    {key: list(series) for key, series in self._phases.items()})
+
+    def write_snapshot(self):
+        """Store this worker's totals for the other workers' /metrics"""
+        if not self.directory:
+            return
+        requests, phases = self.snapshot()
+        data = {
+            'requests': [[*key, series] for key, series in requests.items()],
+            'phases': [[*key, series] for key, series in phases.items()]
+        }
+        path = os.path.join(self.directory, f'metrics-{self.pid}.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Totals of every worker as (request histograms, phase histograms)"""
+        if not self.directory:
+            return self.snapshot()
+
+        self.write_snapshot()
+        requests, phases = {}, {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for totals, rows in ((requests, data['requests']), (phases, data['phases'])):
+                for *key, series in rows:
+                    key = tuple(key)
+                    total = totals.get(key)
+                    totals[key] = series if total is None else [a + b for a, b in zip(total, series)]
+        return requests, phases
+
+    def render(self):
+        """Prometheus text exposition format"""
+        requests, phases = self.collect()
+        lines = [
+            f'# HELP {METRIC_NAME} Request duration by route, method and status code',
+            f'# TYPE {METRIC_NAME} histogram'
+        ]
+        for (route, method, status), series in sorted(requests.items()):
+            _histogram_lines(lines, METRIC_NAME, f'route="{_escape(route)}",method="{method}",status="{status}"', series)
+        if phases:
+            lines.append(f'# HELP {PHASE_METRIC_NAME} Time spent in named phases of a request')
+            lines.append(f'# TYPE {PHASE_METRIC_NAME} histogram')
+            for (route, phase), series in sorted(phases.items()):
+                _histogram_lines(lines, PHASE_METRIC_NAME, f'route="{_escape(route)}",phase="{_escape(phase)}"', series)
+        return '\n'.join(lines) + '\n'
+
+    def start(self):
+        """Write snapshots from a daemon thread while the worker runs"""
+        if not self.directory or self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+        self._thread.start()
+        atexit.register(self.write_snapshot)
+
+    def _run(self):
+        while True:
+            time.sleep(self.snapshot_seconds)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                print(f"Failed to write metrics snapshot: {e}")
+
+    def install(self, app):
+        """Time every request of app and serve /metrics"""
+        def start_timer():
+            g.request_started = time.perf_counter()
+
+        def record(response):
+            started = g.get('request_started')
+            if started is not None:
+                rule = request.url_rule
+                self.observe(rule.rule if rule else 'unmatched', request.method, response.status_code,
+                             time.perf_counter() - started)
+            return response
+
+        # First in line, so requests refused by other hooks are timed too
+        app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+        app.after_request(record)
+        app.add_url_rule('/metrics', 'metrics', lambda: Response(self.render(), content_type=CONTENT_TYPE))
+        self.start()
+
+
+def _histogram_lines(lines, name, labels, series):
+    cumulative = 0
+    for bound, count in zip(BUCKETS + ('+Inf',), series):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {series[-1]}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
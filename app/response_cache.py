@@ -0,0 +1,162 @@
+"""Encoded response bodies for GET /api/todos
+
+Lists only change on POST, so the JSON body of an unpaginated list is kept
+per client together with the list version it was built from. A request at
+the same version reuses the bytes. When todos were only appended since, the
+new items are encoded on their own and spliced in before the closing
+bracket instead of re-encoding the whole list.
+
+read_list serves requests that have no version yet (no If-None-Match): the
+version is read together with the list or with its changes.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Upper bound for all cached bodies of one worker
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+_EMPTY_LIST = b'[]\n'
+# Rough bytes held per entry besides its body: the dict slot, key and tuple
+_ENTRY_OVERHEAD = 200
+
+
+def encode_json(obj):
+    """Compact JSON bytes, the same output as jsonify outside debug mode"""
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode('ascii')
+
+
+def _size(key, entry):
+    """Bytes charged to the budget for one entry"""
+    return len(key) + len(entry[3]) + _ENTRY_OVERHEAD
+
+
+class ResponseCache:
+    """Size-bounded LRU of encoded todo lists, keyed by client_id"""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # {client_id: (epoch, version, last_id, body)}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.splices = 0
+        self.evictions = 0
+
+    def list_body(self, store, client_id, list_ver, encode_all):
+        """Return the JSON body of a full list, encode_all(todos) gives the item dicts"""
+        key = client_id or ''
+        epoch, version = list_ver
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == epoch and entry[1] >= version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[3]
+
+        if entry is not None and entry[0] == epoch:
+            body = self._splice(store, client_id, key, entry, encode_all)
+            if body is not None:
+                return body
+
+        # A store restart, a change log overrun or nothing cached yet
+        return self._encode(key, epoch, version, store.list_todos(client_id), encode_all)
+
+    def read_list(self, store, client_id, encode_all):
+        """Return (list_ver, body) of a full list whose version was not read yet
+
+        The version comes from the same store read as the list, or as the
+        changes since the cached body, so Redis answers in one round trip.
+        """
+        key = client_id or ''
+        epoch = store.epoch
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None and entry[0] == epoch:
+            version, changes = store.changes_since(client_id, entry[1])
+            if version == entry[1]:
+                with self._lock:
+                    self.hits += 1
+                return (epoch, version), entry[3]
+            body = self._apply_changes(key, entry, version, changes, encode_all)
+            if body is not None:
+                return (epoch, version), body
+
+        version, todos = store.list_with_version(client_id)
+        return (epoch, version), self._encode(key, epoch, version, todos, encode_all)
+
+    def _encode(self, key, epoch, version, todos, encode_all):
+        todos = list(todos)
+        body = encode_json(encode_all(todos)) + b'\n'
+        with self._lock:
+            self.misses += 1
+        # Unknown client ids would each keep an entry for an empty list
+        if version and todos:
+            self._put(key, (epoch, version, todos[-1].id, body))
+        return body
+
+    def _splice(self, store, client_id, key, entry, encode_all):
+        """Append the todos created after the cached version, None if not possible"""
+        version, changes = store.changes_since(client_id, entry[1])
+        return self._apply_changes(key, entry, version, changes, encode_all)
+
+    def _apply_changes(self, key, entry, version, changes, encode_all):
+        epoch, _, last_id, body = entry
+        if changes is None:
+            return None
+
+        new_todos = []
+        for change in changes:
+            if change['op'] != 'create' or change['todo'] is None:
+                return None
+            # The cached body may already be newer than its version
+            if change['todo'].id > last_id:
+                new_todos.append(change['todo'])
+
+        if new_todos:
+            fragment = b','.join(encode_json(item) for item in encode_all(new_todos))
+            separator = b'' if body == _EMPTY_LIST else b','
+            body = b''.join((body[:-2], separator, fragment, b']\n'))
+            last_id = new_todos[-1].id
+
+        with self._lock:
+            self.splices += 1
+        self._put(key, (epoch, version, last_id, body))
+        return body
+
+    def _put(self, key, entry):
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                # Concurrent requests may finish out of order
+                if old[0] == entry[0] and old[1] > entry[1]:
+                    return
+                del self._entries[key]
+                self._bytes -= _size(key, old)
+
+            size = _size(key, entry)
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                idle_key, idle = self._entries.popitem(last=False)
+                self._bytes -= _size(idle_key, idle)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'splices': self.splices,
+                'evictions': self.evictions
+            }
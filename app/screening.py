@@ -0,0 +1,164 @@
+"""Content screening for todo texts and User-Agent headers
+
+All patterns of a target are compiled into one Aho-Corasick automaton, so a
+check walks the input once no matter how many rules there are. Rules come
+from a JSON file (SCREENING_RULES_FILE) and are reloaded when its mtime
+changes, without a restart:
+
+    {"rules": [
+        {"pattern": "<script", "target": "text", "action": "reject"},
+        {"pattern": "bot", "target": "user_agent", "action": "log"},
+        {"pattern": "curl/", "target": "user_agent", "action": "tag", "tag": "cli"}
+    ]}
+
+Matching is case-insensitive. reject refuses the input, log records a
+security event and lets it through, tag only labels the request.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+SCREENING_RULES_FILE = os.environ.get(
+    'SCREENING_RULES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'screening_rules.json')
+)
+# How often the rules file mtime is checked
+SCREENING_RELOAD_SECONDS = float(os.environ.get('SCREENING_RELOAD_SECONDS', '2'))
+
+ACTIONS = ('reject', 'log', 'tag')
+TARGETS = ('text', 'user_agent')
+
+
+class Rule:
+    """One pattern and what to do when it matches"""
+
+    __slots__ = ('pattern', 'target', 'action', 'tag')
+
+    def __init__(self, pattern, target='text', action='reject', tag=None):
+        if not pattern:
+            raise ValueError("pattern cannot be empty")
+        if target not in TARGETS:
+            raise ValueError(f"target must be one of {', '.join(TARGETS)}")
+        if action not in ACTIONS:
+            raise ValueError(f"action must be one of {', '.join(ACTIONS)}")
+        self.pattern = pattern.lower()
+        self.target = target
+        self.action = action
+        self.tag = tag or pattern.lower()
+
+    def __repr__(self):
+        return f'Rule({self.pattern!r}, {self.target!r}, {self.action!r})'
+
+
+class Automaton:
+    """Aho-Corasick automaton over the patterns of a list of rules"""
+
+    def __init__(self, rules):
+        # Node 0 is the root; goto[n] maps a character to the next node
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for rule in rules:
+            node = 0
+            for char in rule.pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                node = next_node
+            self._output[node] += (rule,)
+
+        # Breadth-first, so a node's fail link is final before its children's
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                # Patterns ending inside this one match here as well
+                self._output[child] += self._output[self._fail[child]]
+                pending.append(child)
+
+    def search(self, text):
+        """Return the rules whose pattern occurs in text, in order of first match"""
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = {}
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for rule in output[node]:
+                matches.setdefault(id(rule), rule)
+        return list(matches.values())
+
+
+class Verdict:
+    """Result of screening one input"""
+
+    __slots__ = ('rejected_by', 'logged_by', 'tags')
+
+    def __init__(self, matches):
+        rejected = [rule for rule in matches if rule.action == 'reject']
+        self.rejected_by = rejected[0] if rejected else None
+        self.logged_by = [rule for rule in matches if rule.action == 'log']
+        self.tags = sorted({rule.tag for rule in matches if rule.action == 'tag'})
+
+
+def load_rules(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return [Rule(**entry) for entry in data['rules']]
+
+
+class ScreeningEngine:
+    """Compiled rules that follow changes to the rules file"""
+
+    def __init__(self, path=SCREENING_RULES_FILE, reload_seconds=SCREENING_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._next_check = 0
+        self.reloads = 0
+        # A broken file at startup is an error, later ones keep the old rules
+        self._mtime = os.stat(path).st_mtime_ns
+        self._install(load_rules(path))
+
+    def _install(self, rules):
+        # One tuple, swapped atomically, so readers never see a mix
+        self._compiled = (len(rules), {target: Automaton([rule for rule in rules if rule.target == target])
+                                       for target in TARGETS})
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        with self._lock:
+            if now < self._next_check:
+                return False
+            self._next_check = now + self.reload_seconds
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return False
+                self._install(load_rules(self.path))
+                self._mtime = mtime
+                self.reloads += 1
+                return True
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Keeping previous screening rules, reload failed: {e}")
+                return False
+
+    def screen(self, target, text):
+        """Return the Verdict for text checked against the rules of target"""
+        self.reload_if_changed()
+        return Verdict(self._compiled[1][target].search(text or ''))
+
+    def stats(self):
+        return {'rules': self._compiled[0], 'reloads': self.reloads, 'path': self.path}
@@ -1,14 +1,47 @@
-from flask import Flask, jsonify, request
+from flask import Flask, g, has_request_context, jsonify, request
 from datetime import datetime
 import os
 import json
 import base64
-from google.cloud import kms_v1
-from google.cloud import monitoring_v3
-from google.cloud import logging
 import hashlib
+from storage import create_store
+from replication import Replication
+from pagination import parse_page_args
+from http_cache import list_version, not_modified, with_cache_headers
+from response_cache import ResponseCache
+from streaming import stream_items, stream_list, wants_stream
+from envelope import EnvelopeCipher, is_envelope
+from decryption import DecryptTimeout, DecryptUnavailable, ParallelDecryptor
+from metrics import MetricsAggregator
+from security_log import AsyncEventLogger, create_sinks
+from screening import ScreeningEngine
+from breaker import CircuitBreaker, GuardedClient, is_client_error
+from lazy import READY, LazyClient
+from request_metrics import RequestMetrics
+from server_timing import SERVER_TIMING_HISTOGRAMS, ServerTiming, span
+from profiling import Profiler
+from warmup import Warmup, import_modules
+from records import Todo, TodoJSONProvider, now_ms, to_dicts
 
 app = Flask(__name__)
+app.json = TodoJSONProvider(app)
+
+# Per-route latency histograms, served at /metrics
+request_metrics = RequestMetrics()
+request_metrics.install(app)
+
+# Server-Timing header with the phases of a request (see server_timing.py).
+# Off unless SERVER_TIMING is set: decrypt and KMS timings tell key cache
+# hits from misses, so header mode is opted into, ideally with a token
+server_timing = ServerTiming(
+    mode=os.environ.get('SERVER_TIMING', 'off'),
+    metrics=request_metrics if SERVER_TIMING_HISTOGRAMS else None
+)
+server_timing.install(app)
+
+# Sampled or admin-requested profiles, listed at /admin/profiles
+profiler = Profiler()
+profiler.install(app)
 
 # Configuration
 PROJECT_ID = os.environ.get('GOOGLE_CLOUD_PROJECT', 'gcp-as3-assignment')
@@ -16,131 +49,226 @@ LOCATION = os.environ.get('KMS_LOCATION', 'us-central1')
 KEY_RING = os.environ.get('KMS_KEY_RING', 'flask-keyring')
 KEY_ID = os.environ.get('KMS_KEY_ID', 'flask-encryption-key')
 
-# Initialize Google Cloud clients
-try:
-    kms_client = kms_v1.KeyManagementServiceClient()
-    logging_client = logging.Client()
-    logger = logging_client.logger('flask-app-security')
-    monitoring_client = monitoring_v3.MetricServiceClient()
-
-    # Security features status
-    KMS_ENABLED = True
-    LOGGING_ENABLED = True
-    MONITORING_ENABLED = True
-except Exception as e:
-    print(f"Security features disabled: {e}")
-    KMS_ENABLED = False
-    LOGGING_ENABLED = False
-    MONITORING_ENABLED = False
-
-# In-memory storage with encryption support
-user_data = {}
-todos = []
+# Each Google API gets a circuit breaker with a per-call deadline. An open
+# breaker fails fast into the existing plaintext / no-op fallbacks
+breakers = {name: CircuitBreaker.from_env(name) for name in ('kms', 'logging', 'monitoring')}
+
+# The Google Cloud libraries are imported and their clients built on first
+# use, so cold starts and requests like / and /api/status don't wait for them.
+# A client that cannot be built (no credentials) disables its feature
+def create_kms_client():
+    from google.cloud import kms_v1
+    return GuardedClient(kms_v1.KeyManagementServiceClient(), breakers['kms'], ('encrypt', 'decrypt'))
+
+def create_logger():
+    from google.cloud import logging
+    return logging.Client().logger('flask-app-security')
+
+def create_monitoring_client():
+    from google.cloud import monitoring_v3
+    return GuardedClient(monitoring_v3.MetricServiceClient(), breakers['monitoring'], ('create_time_series',))
+
+kms_client = LazyClient('kms', create_kms_client)
+logger = LazyClient('logging', create_logger)
+monitoring_client = LazyClient('monitoring', create_monitoring_client)
+
+def kms_enabled():
+    """Whether todos are encrypted, builds the KMS client on the first call"""
+    return kms_client.available()
+
+def feature_status(client):
+    return {True: "Enabled", False: "Disabled", None: "Not loaded yet"}[client.enabled]
+
+# Security events are queued and written in batches by a background thread,
+# which is also where the Cloud Logging client gets built
+security_log = None
+security_log_sinks = create_sinks(os.environ.get('SECURITY_LOG_SINKS', 'cloud'), logger, breakers['logging'])
+if security_log_sinks:
+    security_log = AsyncEventLogger(security_log_sinks)
+
+# Compiled content rules for todo texts and User-Agents (screening_rules.json)
+screening = ScreeningEngine()
+
+# Metrics are aggregated in process and flushed in batches by a background
+# thread, the first flush builds the Monitoring client
+metrics = MetricsAggregator(monitoring_client, PROJECT_ID, "gae_app", {
+    "project_id": PROJECT_ID,
+    "module_id": os.environ.get("GAE_MODULE_ID", "default")
+})
+metrics.start()
+
+# Todo storage, holds encrypted text (see storage.py for backends)
+store = create_store()
+
+# Leader/follower log shipping between instances (see replication.py)
+replication = Replication(store)
+store = replication.store
+replication.install(app)
+
+# Todos are encrypted locally with a data key that KMS wraps once
+cipher = LazyClient('cipher', lambda: EnvelopeCipher(
+    kms_client, kms_client.crypto_key_path(PROJECT_ID, LOCATION, KEY_RING, KEY_ID), store
+))
+lazy_clients = {'kms': kms_client, 'logging': logger, 'monitoring': monitoring_client, 'cipher': cipher}
+
+# Encoded bodies of full decrypted lists, reused until the list changes
+response_cache = ResponseCache()
+
+# Everything the first request would otherwise build, run by /_ah/warmup
+# (App Engine) or at start for the GKE readiness probe
+warmup = Warmup()
+
+@warmup.phase('modules')
+def warm_modules():
+    import_modules('google.cloud.kms_v1', 'google.cloud.logging', 'google.cloud.monitoring_v3',
+                   'google.api.distribution_pb2')
+
+@warmup.phase('clients')
+def warm_clients():
+    for holder in (kms_client, logger, monitoring_client):
+        holder.get()
+
+@warmup.phase('store')
+def warm_store():
+    store.warm()
+
+@warmup.phase('encryption_keys')
+def warm_encryption_keys():
+    if kms_enabled():
+        cipher.preload()
+
+warmup.install(app)
+
+# Maximum number of texts accepted by POST /api/todos/batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '50'))
+
+# Most items a single GET may decrypt, 0 for no limit. Longer lists are
+# truncated and the X-Next-Cursor header tells where to continue
+MAX_DECRYPT_PER_GET = int(os.environ.get('MAX_DECRYPT_PER_GET', '1000'))
 
 def log_security_event(event_type, details):
-    """Log security events to Cloud Logging"""
-    if not LOGGING_ENABLED:
+    """Queue a security event for the configured sinks, never blocks"""
+    if security_log is None:
         return
 
-    try:
-        logger.log_text(
-            f"SECURITY_EVENT: {event_type}",
-            severity="INFO",
-            http_request={
-                "requestMethod": request.method,
-                "requestUrl": request.url,
-                "userAgent": request.headers.get("User-Agent", ""),
-                "remoteIp": request.remote_addr
-            },
-            json_payload=details
-        )
-    except Exception as e:
-        print(f"Failed to log security event: {e}")
+    # The request is gone by the time the event is written, copy what we need
+    http_request = None
+    if has_request_context():
+        http_request = {
+            "requestMethod": request.method,
+            "requestUrl": request.url,
+            "userAgent": request.headers.get("User-Agent", ""),
+            "remoteIp": request.remote_addr
+        }
+
+    # Tags set by screening rules label every event of the request
+    tags = g.get("screening_tags") if has_request_context() else None
+    if tags:
+        details = dict(details, screening_tags=tags)
+
+    with span("log"):
+        security_log.log({
+            "event_type": event_type,
+            "severity": "INFO",
+            "time": datetime.utcnow().isoformat() + "Z",
+            "http_request": http_request,
+            "details": details
+        })
 
 def record_metric(metric_type, value, labels=None):
-    """Record custom metrics to Cloud Monitoring"""
-    if not MONITORING_ENABLED:
+    """Add a value to a Cloud Monitoring distribution, sent with the next flush"""
+    if monitoring_client.enabled is False:
         return
+    with span("metrics"):
+        metrics.observe(metric_type, value, labels)
 
-    try:
-        series = monitoring_v3.TimeSeries()
-        series.metric.type = f"custom.googleapis.com/flask_app/{metric_type}"
-        series.resource.type = "gae_app"
-        series.resource.labels["project_id"] = PROJECT_ID
-        series.resource.labels["module_id"] = os.environ.get("GAE_MODULE_ID", "default")
-
-        if labels:
-            series.metric.labels.update(labels)
-
-        point = series.points.add()
-        point.value.double_value = value
-        point.interval.end_time = {"seconds": int(datetime.utcnow().timestamp())}
-
-        monitoring_client.create_time_series(name=f"projects/{PROJECT_ID}", time_series=[series])
-    except Exception as e:
-        print(f"Failed to record metric: {e}")
+def count_metric(metric_type, value=1, labels=None):
+    """Add to a Cloud Monitoring counter, sent with the next flush"""
+    if monitoring_client.enabled is False:
+        return
+    with span("metrics"):
+        metrics.count(metric_type, value, labels)
 
 def encrypt_text(text):
-    """Encrypt text using Cloud KMS"""
-    if not KMS_ENABLED or not text:
+    """Encrypt text with the KMS-wrapped data key"""
+    if not text or not kms_enabled():
         return text
 
     try:
-        key_name = kms_client.crypto_key_path(PROJECT_ID, LOCATION, KEY_RING, KEY_ID)
-
-        # Encrypt the text
-        response = kms_client.encrypt(
-            request={"name": key_name, "plaintext": text.encode("utf-8")}
-        )
-
-        # Return base64 encoded ciphertext
-        return base64.b64encode(response.ciphertext).decode('utf-8')
+        with span("encrypt"):
+            return cipher.encrypt(text)
     except Exception as e:
         print(f"Encryption failed, using plaintext: {e}")
         return text
 
 def decrypt_text(ciphertext):
-    """Decrypt text using Cloud KMS"""
-    if not KMS_ENABLED or not ciphertext:
+    """Decrypt text, envelope ciphertexts locally and older ones with Cloud KMS"""
+    if not ciphertext or not kms_enabled():
         return ciphertext
 
-    try:
-        # Check if it's base64 encoded (encrypted)
+    if is_envelope(ciphertext):
         try:
-            decoded = base64.b64decode(ciphertext)
-            key_name = kms_client.crypto_key_path(PROJECT_ID, LOCATION, KEY_RING, KEY_ID)
+            return cipher.decrypt(ciphertext)
+        except Exception as e:
+            print(f"Decryption failed, returning original: {e}")
+            raise DecryptUnavailable(str(e))
 
-            response = kms_client.decrypt(
-                request={"name": key_name, "ciphertext": decoded}
-            )
+    # Older todos were encrypted directly by KMS and stored base64 encoded.
+    # Anything else is a todo stored in plaintext after encryption failed
+    try:
+        decoded = base64.b64decode(ciphertext, validate=True)
+    except ValueError:
+        return ciphertext
 
-            return response.plaintext.decode("utf-8")
-        except:
-            # Not encrypted, return as-is
-            return ciphertext
+    try:
+        key_name = kms_client.crypto_key_path(PROJECT_ID, LOCATION, KEY_RING, KEY_ID)
+        response = kms_client.decrypt(
+            request={"name": key_name, "ciphertext": decoded}
+        )
+        return response.plaintext.decode("utf-8")
+    except UnicodeDecodeError:
+        return ciphertext
     except Exception as e:
+        # KMS rejecting the bytes means they never were a ciphertext
+        if is_client_error(e):
+            return ciphertext
         print(f"Decryption failed, returning original: {e}")
-        return ciphertext
+        raise DecryptUnavailable(str(e))
+
+# Plaintexts are cached by ciphertext digest, misses decrypted on a thread pool
+decryptor = ParallelDecryptor(decrypt_text)
+
+def decrypted_dicts(todos):
+    """API representation of todos with their text decrypted"""
+    if not kms_enabled():
+        return to_dicts(todos)
+
+    with span("decrypt"):
+        plaintexts = decryptor.decrypt_all([todo.text for todo in todos])
+    return [todo.to_dict(text=plaintext) for todo, plaintext in zip(todos, plaintexts)]
 
 def validate_todo_text(text):
     """Additional security validation for todo text"""
     if not text:
         return False, "Text cannot be empty"
 
-    # Check for suspicious patterns
-    suspicious_patterns = [
-        '<script', 'javascript:', 'vbscript:', 'onload=', 'onerror=',
-        'eval(', 'alert(', 'document.cookie', 'localStorage', 'sessionStorage'
-    ]
+    # All patterns are checked in a single pass over the text
+    with span("validate"):
+        verdict = screening.screen('text', text)
+    for rule in verdict.logged_by:
+        log_security_event("SUSPICIOUS_INPUT_LOGGED", {
+            "input_text": text[:100],  # Log first 100 chars
+            "suspicious_pattern": rule.pattern
+        })
+    if verdict.tags and has_request_context():
+        g.screening_tags = sorted(set(g.get("screening_tags", [])) | set(verdict.tags))
 
-    text_lower = text.lower()
-    for pattern in suspicious_patterns:
-        if pattern in text_lower:
-            log_security_event("SUSPICIOUS_INPUT_DETECTED", {
-                "input_text": text[:100],  # Log first 100 chars
-                "suspicious_pattern": pattern
-            })
-            return False, "Invalid characters detected"
+    if verdict.rejected_by:
+        log_security_event("SUSPICIOUS_INPUT_DETECTED", {
+            "input_text": text[:100],  # Log first 100 chars
+            "suspicious_pattern": verdict.rejected_by.pattern
+        })
+        return False, "Invalid characters detected"
 
     return True, None
 
@@ -152,17 +280,21 @@ def before_request():
     user_agent = request.headers.get('User-Agent', '')
 
     # Record request metric
-    record_metric("incoming_requests", 1, {
+    count_metric("incoming_requests", 1, {
         "method": request.method,
         "endpoint": request.endpoint or "unknown"
     })
 
-    # Log suspicious user agents
-    if any(pattern in user_agent.lower() for pattern in ['bot', 'crawler', 'scanner']):
+    # Screen the User-Agent: tag the request, log or refuse it
+    verdict = screening.screen('user_agent', user_agent)
+    g.screening_tags = verdict.tags
+    if verdict.logged_by or verdict.rejected_by:
         log_security_event("SUSPICIOUS_USER_AGENT", {
             "user_agent": user_agent,
             "client_ip": client_ip
         })
+    if verdict.rejected_by:
+        return jsonify({'error': 'Forbidden'}), 403
 
 @app.after_request
 def add_security_headers(response):
@@ -183,7 +315,9 @@ def add_security_headers(response):
     if origin in allowed_origins:
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS, PUT, DELETE'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, If-None-Match, X-Server-Timing'
+        response.headers['Access-Control-Expose-Headers'] = 'ETag, X-Todos-Epoch, X-Todos-Version, X-Todos-Truncated, X-Next-Cursor, X-Replica-Role, X-Replica-Staleness-Ms'
+        response.headers['Timing-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Credentials'] = 'true'
 
     return response
@@ -200,9 +334,9 @@ def home():
         <p><a href="/api/status">Check API Status</a></p>
     </body></html>
     '''.format(
-        "Enabled" if KMS_ENABLED else "Disabled",
-        "Enabled" if LOGGING_ENABLED else "Disabled",
-        "Enabled" if MONITORING_ENABLED else "Disabled"
+        feature_status(kms_client),
+        feature_status(logger),
+        feature_status(monitoring_client)
     )
 
 @app.route('/api/status')
@@ -211,13 +345,27 @@ def status():
     status_info = {
         'status': 'operational',
         'security_features': {
-            'kms_encryption': KMS_ENABLED,
-            'security_logging': LOGGING_ENABLED,
-            'performance_monitoring': MONITORING_ENABLED
+            'kms_encryption': kms_client.enabled,
+            'security_logging': logger.enabled,
+            'performance_monitoring': monitoring_client.enabled
         },
         'features': ['user_separation', 'cors_support', 'encryption', 'security_monitoring'],
-        'users_count': len(user_data),
-        'global_todos_count': len(todos),
+        'users_count': store.users_count(),
+        'global_todos_count': store.global_count(),
+        'storage_backend': store.name,
+        'storage': store.stats(),
+        'response_cache': response_cache.stats(),
+        'encryption': cipher.stats() if cipher.state == READY else None,
+        'decryption': decryptor.stats(),
+        'metrics': metrics.stats(),
+        'security_log': security_log.stats() if security_log else None,
+        'screening': screening.stats(),
+        'circuit_breakers': {name: breaker.stats() for name, breaker in breakers.items()},
+        'clients': {name: holder.describe() for name, holder in lazy_clients.items()},
+        'server_timing': server_timing.stats(),
+        'profiler': profiler.stats(),
+        'warmup': warmup.report(),
+        'replication': replication.stats(),
         'version': '3.0-security'
     }
 
@@ -225,6 +373,7 @@ def status():
     return jsonify(status_info)
 
 @app.route('/api/todos', methods=['OPTIONS'])
+@app.route('/api/todos/batch', methods=['OPTIONS'])
 def handle_options():
     """Handle CORS preflight requests"""
     return '', 200
@@ -236,27 +385,54 @@ def get_todos():
     client_id = request.args.get('client_id')
 
     try:
-        if client_id:
-            if client_id not in user_data:
-                user_data[client_id] = {'todos': [], 'next_id': 1}
+        page_args = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-            # Decrypt todos before returning
-            decrypted_todos = []
-            for todo in user_data[client_id]['todos']:
-                decrypted_todo = todo.copy()
-                decrypted_todo['text'] = decrypt_text(todo.get('text', ''))
-                decrypted_todos.append(decrypted_todo)
-
-            response = jsonify(decrypted_todos)
+    try:
+        # Answer conditional requests before any decryption
+        list_ver = list_version(store, client_id)
+        cached = not_modified(list_ver, client_id)
+        if cached:
+            return cached
+
+        if page_args is not None and MAX_DECRYPT_PER_GET:
+            page_args['limit'] = min(page_args['limit'] or MAX_DECRYPT_PER_GET, MAX_DECRYPT_PER_GET)
+        truncated = (page_args is None and MAX_DECRYPT_PER_GET
+                     and store.count_todos(client_id) > MAX_DECRYPT_PER_GET)
+
+        if truncated:
+            # Too long for one request: the first items and where to continue
+            with span("store"):
+                page, next_cursor = store.page_todos(client_id, limit=MAX_DECRYPT_PER_GET)
+            items = decrypted_dicts(page)
+            with span("serialize"):
+                response = jsonify(items)
+            response.headers['X-Todos-Truncated'] = 'true'
+            response.headers['X-Next-Cursor'] = str(next_cursor)
+        elif page_args is None and wants_stream(request.args) and not kms_enabled():
+            # Nothing to decrypt, read and encoded chunk by chunk while the body is sent
+            response = app.response_class(stream_list(store, client_id, to_dicts), mimetype='application/json')
+        elif page_args is None and wants_stream(request.args) and MAX_DECRYPT_PER_GET:
+            # Decrypted before the 200 goes out, so a timeout is still a 503.
+            # Not truncated, so at most MAX_DECRYPT_PER_GET items
+            with span("store"):
+                todos = store.list_todos(client_id)
+            items = decrypted_dicts(todos)
+            response = app.response_class(stream_items(items), mimetype='application/json')
+        elif page_args is None:
+            # Full lists are decrypted once and then only for new todos
+            with span("serialize"):
+                body = response_cache.list_body(store, client_id, list_ver, decrypted_dicts)
+            response = app.response_class(body, mimetype='application/json')
         else:
-            # Decrypt global todos
-            decrypted_todos = []
-            for todo in todos:
-                decrypted_todo = todo.copy()
-                decrypted_todo['text'] = decrypt_text(todo.get('text', ''))
-                decrypted_todos.append(decrypted_todo)
-
-            response = jsonify(decrypted_todos)
+            # Only the requested page is decrypted
+            with span("store"):
+                page, next_cursor = store.page_todos(client_id, **page_args)
+            items = decrypted_dicts(page)
+            with span("serialize"):
+                response = jsonify({'todos': items, 'next_cursor': next_cursor})
+        with_cache_headers(response, list_ver, client_id)
 
         # Record performance metric
         response_time = (datetime.utcnow() - start_time).total_seconds() * 1000
@@ -269,6 +445,14 @@ def get_todos():
 
         return response
 
+    except DecryptTimeout as e:
+        log_security_event("GET_TODOS_TIMEOUT", {
+            "error": str(e),
+            "client_id": client_id
+        })
+        # Finished items are cached, so a retry has less left to decrypt
+        return jsonify({'error': 'Decryption timed out'}), 503, {'Retry-After': '1'}
+
     except Exception as e:
         log_security_event("GET_TODOS_ERROR", {
             "error": str(e),
@@ -276,6 +460,41 @@ def get_todos():
         })
         return jsonify({'error': 'Failed to retrieve todos'}), 500
 
+@app.route('/api/todos/changes', methods=['GET'])
+def get_todo_changes():
+    """Get the changes since a list version, decrypting created todos"""
+    client_id = request.args.get('client_id')
+
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer version'}), 400
+
+    try:
+        version, changes = store.changes_since(client_id, since)
+
+        # Too far behind, or a version from a restarted store: reload everything
+        epoch = request.args.get('epoch')
+        if changes is None or (epoch and epoch != store.epoch):
+            return jsonify({'epoch': store.epoch, 'version': version, 'resync': True})
+
+        created = iter(decrypted_dicts([change['todo'] for change in changes if isinstance(change['todo'], Todo)]))
+        decrypted_changes = []
+        for change in changes:
+            todo = change['todo']
+            if isinstance(todo, Todo):
+                todo = next(created)
+            decrypted_changes.append(dict(change, todo=todo))
+
+        return jsonify({'epoch': store.epoch, 'version': version, 'changes': decrypted_changes})
+
+    except Exception as e:
+        log_security_event("GET_CHANGES_ERROR", {
+            "error": str(e),
+            "client_id": client_id
+        })
+        return jsonify({'error': 'Failed to retrieve changes'}), 500
+
 @app.route('/api/todos', methods=['POST'])
 def create_todo():
     """Create todo with encryption and validation"""
@@ -301,52 +520,39 @@ def create_todo():
 
         # Encrypt the todo text
         encrypted_text = encrypt_text(text)
+        encrypted = kms_enabled()
 
-        todo = {
-            'id': 0,
-            'text': encrypted_text,  # Store encrypted text
-            'created_at': datetime.utcnow().isoformat() + 'Z',
-            'encrypted': KMS_ENABLED
-        }
-
-        if client_id:
-            if client_id not in user_data:
-                user_data[client_id] = {'todos': [], 'next_id': 1}
+        # Store encrypted text
+        todo = Todo(encrypted_text, encrypted=encrypted)
 
-            user_todo_data = user_data[client_id]
-            todo['id'] = user_todo_data['next_id']
-            user_todo_data['todos'].append(todo)
-            user_todo_data['next_id'] += 1
+        with span("store"):
+            count = store.add_todo(client_id, todo)
 
+        if client_id:
             response_data = {
-                'count': len(user_todo_data['todos']),
+                'count': count,
                 'user_id': client_id,
-                'todos_count': len(user_todo_data['todos']),
-                'encrypted': KMS_ENABLED
+                'todos_count': count,
+                'encrypted': encrypted
             }
         else:
-            global next_id
-            todo['id'] = next_id
-            todos.append(todo)
-            next_id += 1
-
             response_data = {
-                'count': len(todos),
-                'global_todos': len(todos),
-                'encrypted': KMS_ENABLED
+                'count': count,
+                'global_todos': count,
+                'encrypted': encrypted
             }
 
         # Record metrics
         response_time = (datetime.utcnow() - start_time).total_seconds() * 1000
         record_metric("create_todo_response_time", response_time)
-        record_metric("todos_created", 1, {
+        count_metric("todos_created", 1, {
             "client_specific": str(bool(client_id))
         })
 
         log_security_event("CREATE_TODO", {
             "client_id": client_id,
             "text_length": len(text),
-            "encrypted": KMS_ENABLED,
+            "encrypted": encrypted,
             "response_time_ms": response_time
         })
 
@@ -359,7 +565,78 @@ def create_todo():
         })
         return jsonify({'error': 'Failed to create todo'}), 500
 
+@app.route('/api/todos/batch', methods=['POST'])
+def create_todos_batch():
+    """Create several todos with one metric and one log entry per batch"""
+    start_time = datetime.utcnow()
+    client_id = request.args.get('client_id')
+
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get('texts'), list) or not data['texts']:
+            return jsonify({'error': 'texts field is required'}), 400
+
+        if len(data['texts']) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'texts maximum {MAX_BATCH_SIZE} items'}), 400
+
+        # Validate everything before encrypting or storing anything
+        texts = []
+        for index, raw_text in enumerate(data['texts']):
+            text = raw_text.strip() if isinstance(raw_text, str) else ''
+            if not text:
+                return jsonify({'error': f'texts[{index}]: text cannot be empty'}), 400
+
+            if len(text) > 255:
+                return jsonify({'error': f'texts[{index}]: text maximum 255 characters'}), 400
+
+            is_valid, error_message = validate_todo_text(text)
+            if not is_valid:
+                return jsonify({'error': f'texts[{index}]: {error_message}'}), 400
+            texts.append(text)
+
+        # Store encrypted text
+        created_ms = now_ms()
+        encrypted = kms_enabled()
+        new_todos = [Todo(encrypt_text(text), created_ms, encrypted) for text in texts]
+
+        with span("store"):
+            count = store.add_todos(client_id, new_todos)
+
+        response_data = {
+            'count': count,
+            'created': len(new_todos),
+            'first_id': new_todos[0].id,
+            'last_id': new_todos[-1].id,
+            'encrypted': encrypted
+        }
+        if client_id:
+            response_data['user_id'] = client_id
+
+        # One aggregated metric and log entry for the whole batch
+        response_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+        record_metric("create_todo_batch_response_time", response_time)
+        count_metric("todos_created", len(new_todos), {
+            "client_specific": str(bool(client_id))
+        })
+
+        log_security_event("CREATE_TODO_BATCH", {
+            "client_id": client_id,
+            "batch_size": len(new_todos),
+            "total_text_length": sum(len(text) for text in texts),
+            "encrypted": encrypted,
+            "response_time_ms": response_time
+        })
+
+        return jsonify(response_data), 201
+
+    except Exception as e:
+        log_security_event("CREATE_TODO_BATCH_ERROR", {
+            "error": str(e),
+            "client_id": client_id
+        })
+        return jsonify({'error': 'Failed to create todos'}), 500
+
 if __name__ == '__main__':
     # Only enable debug in development
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
-    app.run(host='0.0.0.0', port=8080, debug=debug_mode)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '8080')), debug=debug_mode)
\ No newline at end of file
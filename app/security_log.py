@@ -0,0 +1,214 @@
+"""Asynchronous security event logging for secure_main
+
+log_security_event only puts the event on a bounded queue. A background
+thread takes up to SECURITY_LOG_BATCH_SIZE events at a time and writes them
+to every configured sink in one call per sink, so a slow logging backend
+never adds latency to a request. When the queue is full, events are dropped
+according to SECURITY_LOG_OVERFLOW.
+
+Sinks (SECURITY_LOG_SINKS, comma separated):
+    cloud   Cloud Logging, one batch commit per write
+    stdout  structured JSON lines, ingested by App Engine without API calls
+    file    JSON lines appended to SECURITY_LOG_FILE
+"""
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+
+from lazy import ClientUnavailable
+
+SECURITY_LOG_BATCH_SIZE = int(os.environ.get('SECURITY_LOG_BATCH_SIZE', '50'))
+SECURITY_LOG_QUEUE_SIZE = int(os.environ.get('SECURITY_LOG_QUEUE_SIZE', '10000'))
+# drop_newest keeps what is queued, drop_oldest makes room for the new event
+SECURITY_LOG_OVERFLOW = os.environ.get('SECURITY_LOG_OVERFLOW', 'drop_newest')
+SECURITY_LOG_FILE = os.environ.get('SECURITY_LOG_FILE', 'security-events.log')
+# Longest a partial batch waits for more events
+SECURITY_LOG_FLUSH_SECONDS = float(os.environ.get('SECURITY_LOG_FLUSH_SECONDS', '1.0'))
+
+OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest')
+
+
+def _json_line(event):
+    # Field names understood by the App Engine / Cloud Logging agent
+    entry = {
+        'severity': event['severity'],
+        'message': f"SECURITY_EVENT: {event['event_type']}",
+        'event_type': event['event_type'],
+        'time': event['time'],
+        'details': event['details']
+    }
+    if event['http_request']:
+        entry['httpRequest'] = event['http_request']
+    return json.dumps(entry, default=str)
+
+
+class CloudLoggingSink:
+    """Writes a batch as one Cloud Logging entries.write call"""
+
+    name = 'cloud'
+
+    def __init__(self, logger, breaker=None):
+        # A Cloud Logging logger, or a lazy.LazyClient that builds one
+        self.logger = logger
+        # Optional breaker.CircuitBreaker bounding the write
+        self.breaker = breaker
+
+    def write(self, events):
+        try:
+            batch = self.logger.batch()
+        except ClientUnavailable:
+            # Cloud Logging could not be set up, the events are not sent
+            return
+        for event in events:
+            batch.log_struct(
+                {'message': f"SECURITY_EVENT: {event['event_type']}", 'details': event['details']},
+                severity=event['severity'],
+                http_request=event['http_request']
+            )
+        if self.breaker is None:
+            batch.commit()
+        else:
+            self.breaker.call(batch.commit)
+
+
+class StdoutJSONSink:
+    """One structured JSON line per event on stdout"""
+
+    name = 'stdout'
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, events):
+        stream = self.stream or sys.stdout
+        stream.write(''.join(_json_line(event) + '\n' for event in events))
+        stream.flush()
+
+
+class FileSink:
+    """JSON lines appended to a local file"""
+
+    name = 'file'
+
+    def __init__(self, path=SECURITY_LOG_FILE):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, events):
+        self._file.write(''.join(_json_line(event) + '\n' for event in events))
+        self._file.flush()
+
+
+class AsyncEventLogger:
+    """Bounded queue of events drained in batches by a background thread"""
+
+    def __init__(self, sinks, batch_size=SECURITY_LOG_BATCH_SIZE, queue_size=SECURITY_LOG_QUEUE_SIZE,
+                 overflow=SECURITY_LOG_OVERFLOW, flush_seconds=SECURITY_LOG_FLUSH_SECONDS):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._write_lock = threading.Lock()
+        self._stopped = False
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.sink_errors = 0
+        self._thread = threading.Thread(target=self._run, name='security-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, event):
+        """Queue an event without blocking"""
+        try:
+            self._queue.put_nowait(event)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+    def _take_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped:
+            batch = self._take_batch(self.flush_seconds)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        with self._write_lock:
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                except Exception as e:
+                    self.sink_errors += 1
+                    print(f"Failed to log security events to {sink.name}: {e}")
+            self.written += len(batch)
+            self.batches += 1
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        self._stopped = True
+        self.flush()
+
+    def stats(self):
+        return {
+            'sinks': [sink.name for sink in self.sinks],
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'sink_errors': self.sink_errors,
+            'overflow_policy': self.overflow
+        }
+
+
+def create_sinks(names, cloud_logger=None, cloud_breaker=None):
+    """Build the sinks listed in SECURITY_LOG_SINKS"""
+    sinks = []
+    for name in (part.strip() for part in names.split(',')):
+        if not name:
+            continue
+        if name == 'cloud':
+            if cloud_logger is not None:
+                sinks.append(CloudLoggingSink(cloud_logger, cloud_breaker))
+        elif name == 'stdout':
+            sinks.append(StdoutJSONSink())
+        elif name == 'file':
+            sinks.append(FileSink())
+        else:
+            raise ValueError(f"Unknown security log sink: {name}")
+    return sinks
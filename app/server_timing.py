@@ -0,0 +1,137 @@
+"""Per-request phase timings reported in the Server-Timing header
+
+Code marks a phase with a span:
+
+    with span('encrypt'):
+        ciphertext = encrypt_text(text)
+
+Spans of the same name add up (every decrypt of a request counts towards
+one 'decrypt' entry) and may nest, 'serialize' of a cached list includes
+the 'decrypt' of its new items. The response then carries
+
+    Server-Timing: validate;dur=0.041, encrypt;dur=1.203, store;dur=0.012, total;dur=1.9
+
+in milliseconds, which browser dev tools show next to the network timings.
+
+SERVER_TIMING selects which requests are timed: off, header (only requests
+sent with X-Server-Timing: 1, or with the value of SERVER_TIMING_TOKEN when
+that is set) or always. For requests that are not timed span() returns a
+shared no-op context manager, so instrumented code costs one context
+variable lookup. With SERVER_TIMING_HISTOGRAMS=true the phases of timed
+requests are also added to app_phase_duration_seconds at /metrics.
+"""
+import os
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from flask import g, request
+
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'header')
+SERVER_TIMING_TOKEN = os.environ.get('SERVER_TIMING_TOKEN', '')
+SERVER_TIMING_HISTOGRAMS = os.environ.get('SERVER_TIMING_HISTOGRAMS', 'false').lower() == 'true'
+
+MODES = ('off', 'header', 'always')
+HEADER = 'X-Server-Timing'
+
+# {phase: [seconds, calls]} of the current request, None when not timed
+_timings = ContextVar('server_timings', default=None)
+_NO_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ('timings', 'name', 'started')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        entry = self.timings.get(self.name)
+        if entry is None:
+            self.timings[self.name] = [elapsed, 1]
+        else:
+            entry[0] += elapsed
+            entry[1] += 1
+        return False
+
+
+def span(name):
+    """Context manager timing a phase of the current request"""
+    timings = _timings.get()
+    if timings is None:
+        return _NO_SPAN
+    return _Span(timings, name)
+
+
+def header_value(timings, total=None):
+    """Server-Timing header for {phase: [seconds, calls]}"""
+    parts = []
+    for name, (seconds, calls) in timings.items():
+        part = f'{name};dur={seconds * 1000:.3f}'
+        if calls > 1:
+            part += f';desc="{calls} calls"'
+        parts.append(part)
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.3f}')
+    return ', '.join(parts)
+
+
+class ServerTiming:
+    """Flask hooks that enable spans per request and report them"""
+
+    def __init__(self, mode=SERVER_TIMING, token=SERVER_TIMING_TOKEN, metrics=None):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.token = token
+        # Optional request_metrics.RequestMetrics receiving the phases
+        self.metrics = metrics
+        self.timed_requests = 0
+
+    def wanted(self):
+        if self.mode == 'always':
+            return True
+        if self.mode == 'off':
+            return False
+        value = request.headers.get(HEADER)
+        if value is None:
+            return False
+        return value == self.token if self.token else value == '1'
+
+    def install(self, app):
+        def start():
+            if self.wanted():
+                g.server_timing_token = _timings.set({})
+                g.server_timing_started = time.perf_counter()
+
+        def report(response):
+            timings = _timings.get()
+            if timings is None or 'server_timing_token' not in g:
+                return response
+            total = time.perf_counter() - g.server_timing_started
+            response.headers['Server-Timing'] = header_value(timings, total)
+            if self.metrics is not None:
+                rule = request.url_rule
+                route = rule.rule if rule else 'unmatched'
+                for name, (seconds, _) in timings.items():
+                    self.metrics.observe_phase(route, name, seconds)
+            self.timed_requests += 1
+            return response
+
+        def finish(exc):
+            token = g.pop('server_timing_token', None)
+            if token is not None:
+                _timings.reset(token)
+
+        app.before_request_funcs.setdefault(None, []).insert(0, start)
+        app.after_request(report)
+        app.teardown_request(finish)
+
+    def stats(self):
+        return {'mode': self.mode, 'timed_requests': self.timed_requests, 'histograms': self.metrics is not None}
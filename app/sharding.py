@@ -0,0 +1,381 @@
+"""Consistent-hash sharding of client partitions across several stores
+
+TODO_STORE_BACKEND=sharded spreads the clients over TODO_SHARDS stores of
+kind TODO_SHARD_BACKEND (memory, sqlite or redis; each shard gets its own
+journal directory, SQLite file or Redis database, see storage.create_store).
+A client is owned by the shard that follows the hash of its id on a ring
+where every shard holds TODO_SHARD_VNODES virtual nodes, so adding or
+removing one of N shards only moves about 1/N of the clients.
+
+Clients that are not on their owner (after add_shard / remove_shard, or
+after a restart with a different shard count) keep being served from the
+shard holding them while a background rebalancer moves them over,
+TODO_REBALANCE_BATCH clients at a time. A move copies the partition to
+the owner and drops it from the source before routing switches, so a crash
+in between leaves two identical copies and the move is simply redone.
+
+Moves are coordinated inside one process. When sqlite or redis shards are
+shared by several workers, change the shard count while a single worker
+runs and wait for /api/status to report no pending moves before scaling
+out again.
+"""
+import bisect
+import hashlib
+import os
+import threading
+import time
+from itertools import islice
+
+from storage import GLOBAL_SCOPE
+
+TODO_SHARD_VNODES = int(os.environ.get('TODO_SHARD_VNODES', '64'))
+TODO_REBALANCE_BATCH = int(os.environ.get('TODO_REBALANCE_BATCH', '100'))
+# Pause between batches, so moving clients does not starve requests
+TODO_REBALANCE_PAUSE_MS = float(os.environ.get('TODO_REBALANCE_PAUSE_MS', '10'))
+TODO_REBALANCE = os.environ.get('TODO_REBALANCE', 'true').lower() == 'true'
+
+_LOCK_STRIPES = 64
+_RING_SIZE = 2 ** 64
+
+
+def _point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes, treated as immutable once shared"""
+
+    def __init__(self, names=(), vnodes=TODO_SHARD_VNODES):
+        self.vnodes = vnodes
+        self._points = []
+        self._owners = []
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        for replica in range(self.vnodes):
+            point = _point(f'{name}#{replica}')
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, name)
+
+    def remove(self, name):
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != name]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def names(self):
+        return sorted(set(self._owners))
+
+    def without(self, name):
+        ring = HashRing(self.names(), self.vnodes)
+        ring.remove(name)
+        return ring
+
+    def plus(self, name):
+        ring = HashRing(self.names(), self.vnodes)
+        ring.add(name)
+        return ring
+
+    def shard_for(self, key):
+        """Name of the shard owning key"""
+        if not self._points:
+            raise LookupError('The hash ring has no shards')
+        index = bisect.bisect(self._points, _point(key))
+        return self._owners[index % len(self._owners)]
+
+    def shares(self):
+        """Fraction of the hash space owned by each shard"""
+        shares = dict.fromkeys(self.names(), 0.0)
+        previous = self._points[-1] - _RING_SIZE if self._points else 0
+        for point, owner in zip(self._points, self._owners):
+            # A point owns the arc that ends at it
+            shares[owner] += (point - previous) / _RING_SIZE
+            previous = point
+        return shares
+
+
+class ShardedStore:
+    """Store interface over several shard stores, see the module docstring"""
+
+    name = 'sharded'
+
+    def __init__(self, shards, vnodes=TODO_SHARD_VNODES, rebalance_batch=TODO_REBALANCE_BATCH,
+                 rebalance_pause_ms=TODO_REBALANCE_PAUSE_MS, background=TODO_REBALANCE):
+        self.shards = dict(shards)
+        ring = HashRing(self.shards, vnodes)
+        self.rebalance_batch = rebalance_batch
+        self.rebalance_pause_ms = rebalance_pause_ms
+        self.background = background
+        # Versions restart whenever a shard restarts
+        epochs = ':'.join(f'{name}={self.shards[name].epoch}' for name in sorted(self.shards))
+        self.epoch = hashlib.blake2b(epochs.encode('utf-8'), digest_size=4).hexdigest()
+
+        # Writes and moves of a client hold its stripe; topology changes hold all
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._topology_lock = threading.Lock()
+        self._rebalance_lock = threading.Lock()
+        # (generation, ring, moves), replaced as a whole so unlocked readers
+        # never see a ring without its moves. The generation is bumped by
+        # every move and topology change, see _read. Moves are the clients
+        # not on their ring owner yet: {key: name of the shard holding it}
+        self._routing = (0, ring, self._plan(ring))
+        self._wakeup = threading.Event()
+        self._rebalancer_pid = None
+        self.moved_clients = 0
+        self.last_rebalance_seconds = None
+
+        self._load_lock = threading.Lock()
+        self._reads = dict.fromkeys(self.shards, 0)
+        self._writes = dict.fromkeys(self.shards, 0)
+        self._wake()
+
+    # Routing
+
+    @property
+    def ring(self):
+        return self._routing[1]
+
+    @property
+    def _moves(self):
+        return self._routing[2]
+
+    def _lock(self, key):
+        return self._locks[hash(key) % _LOCK_STRIPES]
+
+    def _route(self, key):
+        return self._moves.get(key) or self.ring.shard_for(key)
+
+    def _count(self, counters, name):
+        with self._load_lock:
+            counters[name] = counters.get(name, 0) + 1
+
+    def _read(self, client_id, read):
+        """Run read(shard) on the shard holding client_id"""
+        key = client_id or GLOBAL_SCOPE
+        while True:
+            generation, ring, moves = self._routing
+            if key in moves:
+                with self._lock(key):
+                    name = self._route(key)
+                    result = read(self.shards[name])
+                break
+            name = ring.shard_for(key)
+            result = read(self.shards[name])
+            # A move that started meanwhile may have dropped what was read
+            if generation == self._routing[0]:
+                break
+        self._count(self._reads, name)
+        return result
+
+    def _write(self, client_id, write):
+        """Run write(shard) on the shard holding client_id"""
+        key = client_id or GLOBAL_SCOPE
+        if self._moves and self._rebalancer_pid != os.getpid():
+            self._wake()
+        with self._lock(key):
+            name = self._route(key)
+            result = write(self.shards[name])
+        self._count(self._writes, name)
+        return result
+
+    # Store interface
+
+    def version(self, client_id=None):
+        """Return the list version, bumped on every write"""
+        return self._read(client_id, lambda shard: shard.version(client_id))
+
+    def list_todos(self, client_id=None):
+        """Return the todos of a client, or the global list"""
+        return self._read(client_id, lambda shard: shard.list_todos(client_id))
+
+    def list_with_version(self, client_id=None):
+        """Return (version, todos) of a list, read together"""
+        return self._read(client_id, lambda shard: shard.list_with_version(client_id))
+
+    def page_todos(self, client_id=None, limit=None, after_id=None, before_id=None, order='asc'):
+        """Return (page, next_cursor) for a cursor-paginated listing"""
+        return self._read(client_id, lambda shard: shard.page_todos(client_id, limit, after_id, before_id, order))
+
+    def changes_since(self, client_id, since):
+        """Return (version, changes) after version since, changes is None if too old"""
+        return self._read(client_id, lambda shard: shard.changes_since(client_id, since))
+
+    def add_todo(self, client_id, todo):
+        """Assign the next id to todo, store it and return the new list size"""
+        return self.add_todos(client_id, [todo])
+
+    def add_todos(self, client_id, todos):
+        """Store todos under a contiguous id range and return the new list size"""
+        return self._write(client_id, lambda shard: shard.add_todos(client_id, todos))
+
+    def users_count(self):
+        return sum(shard.users_count() for shard in list(self.shards.values()))
+
+    def global_count(self):
+        return self._read(None, lambda shard: shard.global_count())
+
+    def count_todos(self, client_id=None):
+        return self._read(client_id, lambda shard: shard.count_todos(client_id))
+
+    def save_data_key(self, key_version, wrapped_key):
+        """Keep a KMS-wrapped data key on every shard, see envelope.py"""
+        for shard in list(self.shards.values()):
+            shard.save_data_key(key_version, wrapped_key)
+
+    def load_data_key(self, key_version):
+        for shard in list(self.shards.values()):
+            wrapped_key = shard.load_data_key(key_version)
+            if wrapped_key is not None:
+                return wrapped_key
+        return None
+
+    def data_key_versions(self):
+        versions = {}
+        for shard in list(self.shards.values()):
+            versions.update(dict.fromkeys(shard.data_key_versions()))
+        return list(versions)
+
+    def warm(self):
+        """Warm every shard"""
+        for shard in list(self.shards.values()):
+            shard.warm()
+
+    def stats(self):
+        shares = self.ring.shares()
+        pending = {}
+        for source in list(self._moves.values()):
+            pending[source] = pending.get(source, 0) + 1
+        with self._load_lock:
+            reads, writes = dict(self._reads), dict(self._writes)
+
+        shards = {}
+        for name, shard in sorted(self.shards.items()):
+            shards[name] = {
+                'backend': shard.name,
+                'ring_share': round(shares.get(name, 0.0), 4),
+                'clients': shard.users_count(),
+                'reads': reads.get(name, 0),
+                'writes': writes.get(name, 0),
+                'moves_pending': pending.get(name, 0),
+                'store': shard.stats()
+            }
+        return {
+            'shards': shards,
+            'vnodes': self.ring.vnodes,
+            'moves_pending': len(self._moves),
+            'moved_clients': self.moved_clients,
+            'last_rebalance_seconds': self.last_rebalance_seconds
+        }
+
+    # Topology changes and rebalancing
+
+    def _plan(self, ring):
+        """Clients not held by their owner in ring: {key: name of the shard holding it}"""
+        moves = {}
+        for name, shard in self.shards.items():
+            keys = shard.client_ids()
+            if shard.version(None):
+                keys.append(GLOBAL_SCOPE)
+            for key in keys:
+                if ring.shard_for(key) != name:
+                    moves[key] = name
+        return moves
+
+    def _change(self, ring, shards):
+        """Switch to ring and shards with every write paused"""
+        with self._topology_lock:
+            for lock in self._locks:
+                lock.acquire()
+            try:
+                self.shards = shards
+                self._routing = (self._routing[0] + 1, ring, self._plan(ring))
+            finally:
+                for lock in self._locks:
+                    lock.release()
+        self._wake()
+
+    def add_shard(self, name, shard):
+        """Add a shard, the clients it now owns move to it in the background"""
+        if name in self.shards:
+            raise ValueError(f"Shard {name} already exists")
+        for key_version in self.data_key_versions():
+            shard.save_data_key(key_version, self.load_data_key(key_version))
+        with self._load_lock:
+            self._reads.setdefault(name, 0)
+            self._writes.setdefault(name, 0)
+        self._change(self.ring.plus(name), dict(self.shards, **{name: shard}))
+
+    def remove_shard(self, name):
+        """Drain a shard in the background, it is dropped once empty"""
+        ring = self.ring.without(name)
+        if not ring.names():
+            raise ValueError("Cannot remove the last shard")
+        self._change(ring, self.shards)
+
+    def _move(self, key):
+        with self._lock(key):
+            generation, ring, moves = self._routing
+            source = moves.get(key)
+            if source is None:
+                return
+            self._routing = (generation + 1, ring, moves)
+            target = ring.shard_for(key)
+            data = self.shards[source].export_partition(key)
+            if data is not None:
+                # Copy, then drop: a crash in between leaves two equal copies
+                self.shards[target].restore_partition(key, *data)
+                self.shards[source].drop_partition(key)
+            del moves[key]
+            self.moved_clients += 1
+
+    def _retire_drained(self):
+        with self._topology_lock:
+            holding = set(self._moves.values())
+            owners = set(self.ring.names())
+            drained = [name for name in self.shards if name not in owners and name not in holding]
+            if drained:
+                self.shards = {name: shard for name, shard in self.shards.items() if name not in drained}
+
+    def rebalance_step(self, batch=None):
+        """Move up to batch clients to their owner, returns whether moves remain"""
+        with self._rebalance_lock:
+            for key in list(islice(self._moves, batch or self.rebalance_batch)):
+                self._move(key)
+            self._retire_drained()
+            return bool(self._moves)
+
+    def rebalance(self):
+        """Move every misplaced client now"""
+        started = time.perf_counter()
+        while self.rebalance_step():
+            pass
+        self.last_rebalance_seconds = time.perf_counter() - started
+
+    def _wake(self):
+        if not self.background:
+            return
+        pid = os.getpid()
+        # gunicorn forks workers after the store is built, threads do not follow
+        if self._rebalancer_pid != pid:
+            with self._topology_lock:
+                if self._rebalancer_pid != pid:
+                    self._wakeup = threading.Event()
+                    threading.Thread(target=self._rebalance_loop, name='shard-rebalancer', daemon=True).start()
+                    self._rebalancer_pid = pid
+        self._wakeup.set()
+
+    def _rebalance_loop(self):
+        wakeup = self._wakeup
+        while True:
+            wakeup.wait()
+            wakeup.clear()
+            if not self._moves:
+                continue
+            started = time.perf_counter()
+            try:
+                while self.rebalance_step():
+                    time.sleep(self.rebalance_pause_ms / 1000)
+                self.last_rebalance_seconds = time.perf_counter() - started
+            except Exception as e:
+                print(f"Failed to rebalance the shards: {e}")
@@ -0,0 +1,637 @@
+"""Storage backends for the todo API
+
+Both apps talk to a store object instead of module globals so the data can
+live outside a single gunicorn worker. Select the backend with the
+TODO_STORE_BACKEND environment variable ("memory", "sqlite", "redis", see
+redis_store.py, or "sharded", see sharding.py).
+"""
+import os
+import queue
+import secrets
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+
+from journal import Journal
+from pagination import page_of
+from partitions import DiskSpillStore, PartitionManager
+from records import Todo
+
+# Scope used for the global (non client-specific) todo list
+GLOBAL_SCOPE = ''
+# Events kept per list for GET /api/todos/changes before a full resync is needed
+CHANGE_LOG_SIZE = int(os.environ.get('CHANGE_LOG_SIZE', '256'))
+
+
+class InMemoryStore:
+    """Process-local storage, fast but not shared between workers"""
+
+    name = 'memory'
+
+    def __init__(self, max_resident_clients=10000, spill_dir=None, lock_stripes=16, journal=None):
+        # User-specific storage: {client_id: partition}, see _new_partition.
+        # Idle partitions are spilled to disk past max_resident_clients.
+        # Todos are records.Todo objects in id order
+        self.user_data = PartitionManager(
+            _new_partition, max_resident_clients, DiskSpillStore(spill_dir), lock_stripes
+        )
+        # Global storage for backward compatibility, with its own lock
+        self.global_partition = _new_partition()
+        self._global_lock = threading.RLock()
+        # Wrapped data keys of envelope encryption: {key_version: wrapped}
+        self.data_keys = {}
+        # Versions restart with the process, the epoch tells them apart
+        self.epoch = secrets.token_hex(4)
+        # Optional journal.Journal: todos survive restarts, see journal.py.
+        # Recovery runs before it is attached, so replay is not logged again
+        self.journal = None
+        if journal is not None:
+            journal.recover(self)
+            self.journal = journal
+            journal.start(self)
+
+    def close(self):
+        """Remove the spill directory of a store that is no longer used"""
+        self.user_data.spill.close()
+
+    def _partition(self, client_id):
+        if not client_id:
+            return self.global_partition
+        return self.user_data.get_or_create(client_id)
+
+    def _lock(self, client_id):
+        if not client_id:
+            return self._global_lock
+        return self.user_data.lock(client_id)
+
+    def _existing_partition(self, client_id):
+        # Reads never allocate a partition for an unknown client
+        if not client_id:
+            return self.global_partition
+        return self.user_data.get(client_id)
+
+    def version(self, client_id=None):
+        """Return the list version, bumped on every write"""
+        partition = self._existing_partition(client_id)
+        return partition['version'] if partition else 0
+
+    def list_todos(self, client_id=None):
+        """Return the todos of a client, or the global list"""
+        partition = self._existing_partition(client_id)
+        return partition['todos'] if partition else ()
+
+    def list_with_version(self, client_id=None):
+        """Return (version, todos) of a list, read together"""
+        with self._lock(client_id):
+            partition = self._existing_partition(client_id)
+            if partition is None:
+                return 0, []
+            return partition['version'], list(partition['todos'])
+
+    def page_todos(self, client_id=None, limit=None, after_id=None, before_id=None, order='asc'):
+        """Return (page, next_cursor) for a cursor-paginated listing"""
+        return page_of(self.list_todos(client_id), limit, after_id, before_id, order)
+
+    def changes_since(self, client_id, since):
+        """Return (version, changes) after version since, changes is None if too old"""
+        with self._lock(client_id):
+            partition = self._existing_partition(client_id)
+            if partition is None:
+                return 0, ([] if since == 0 else None)
+            return partition['version'], _changes_after(partition['changes'], partition['version'], since)
+
+    def add_todo(self, client_id, todo):
+        """Assign the next id to todo, store it and return the new list size"""
+        return self.add_todos(client_id, [todo])
+
+    def add_todos(self, client_id, todos):
+        """Store todos under a contiguous id range and return the new list size"""
+        # Id allocation and append happen under one lock, so ids stay
+        # unique, gap-free and in list order with threaded workers
+        with self._lock(client_id):
+            partition = self._partition(client_id)
+            for offset, todo in enumerate(todos):
+                todo.id = partition['next_id'] + offset
+            # Logged before it is applied, a failed write changes nothing
+            if self.journal is not None:
+                self.journal.log_todos(client_id or GLOBAL_SCOPE, todos)
+            for todo in todos:
+                partition['todos'].append(todo)
+                partition['next_id'] += 1
+                partition['version'] += 1
+                partition['changes'].append({'version': partition['version'], 'op': 'create', 'todo': todo})
+            return len(partition['todos'])
+
+    def users_count(self):
+        return len(self.user_data)
+
+    def global_count(self):
+        return len(self.global_partition['todos'])
+
+    def count_todos(self, client_id=None):
+        return len(self.list_todos(client_id))
+
+    def save_data_key(self, key_version, wrapped_key):
+        """Keep a KMS-wrapped data key, see envelope.py"""
+        if key_version in self.data_keys:
+            return
+        if self.journal is not None:
+            self.journal.log_data_key(key_version, wrapped_key)
+        self.data_keys.setdefault(key_version, wrapped_key)
+
+    def load_data_key(self, key_version):
+        return self.data_keys.get(key_version)
+
+    def data_key_versions(self):
+        return list(self.data_keys)
+
+    def warm(self):
+        """Nothing to open, the journal was replayed at construction"""
+
+    def stats(self):
+        stats = self.user_data.stats()
+        if self.journal is not None:
+            stats['journal'] = self.journal.stats()
+        return stats
+
+    # Used by sharding.ShardedStore to move clients between shards
+
+    def client_ids(self):
+        """Ids of every client with a partition, without the global list"""
+        return self.user_data.client_ids()
+
+    def export_partition(self, client_id):
+        """Return (next_id, version, todos) copied under the partition lock, None if unknown"""
+        with self._lock(client_id):
+            partition = self.global_partition if not client_id else self.user_data.peek(client_id)
+            if partition is None or partition['version'] == 0:
+                return None
+            return partition['next_id'], partition['version'], list(partition['todos'])
+
+    def drop_partition(self, client_id):
+        with self._lock(client_id):
+            if self.journal is not None:
+                self.journal.log_drop(client_id or GLOBAL_SCOPE)
+            if client_id:
+                self.user_data.remove(client_id)
+            else:
+                self.global_partition = _new_partition()
+
+    # Used by journal.Journal to snapshot and recover the store
+
+    def export_partitions(self):
+        """Yield (client_id, next_id, version, todos) with todos copied under the partition lock"""
+        with self._global_lock:
+            partition = self.global_partition
+            copy = (GLOBAL_SCOPE, partition['next_id'], partition['version'], list(partition['todos']))
+        yield copy
+        for client_id in self.user_data.client_ids():
+            with self._lock(client_id):
+                data = self.user_data.peek(client_id)
+                if data is None:
+                    continue
+                copy = (client_id, data['next_id'], data['version'], list(data['todos']))
+            yield copy
+
+    def export_data_keys(self):
+        return dict(self.data_keys)
+
+    def restore_partition(self, client_id, next_id, version, todos):
+        """Replace the partition of a client, e.g. one moved from another shard"""
+        with self._lock(client_id):
+            if self.journal is not None:
+                self.journal.log_partition(client_id or GLOBAL_SCOPE, next_id, version, todos)
+            partition = self._partition(client_id)
+            partition['todos'] = todos
+            partition['next_id'] = next_id
+            partition['version'] = version
+            # The old events no longer describe this list
+            partition['changes'].clear()
+
+    def replay_todos(self, client_id, todos):
+        """Append logged todos that are not there yet, returns how many"""
+        # Locked, as replicas replay while serving reads
+        with self._lock(client_id):
+            partition = self._partition(client_id)
+            added = 0
+            for todo in todos:
+                # Already in the snapshot, or logged twice
+                if todo.id < partition['next_id']:
+                    continue
+                partition['todos'].append(todo)
+                partition['next_id'] = todo.id + 1
+                partition['version'] += 1
+                # Replicas answer delta polls from this log too
+                partition['changes'].append({'version': partition['version'], 'op': 'create', 'todo': todo})
+                added += 1
+            return added
+
+    def restore_data_key(self, key_version, wrapped_key):
+        self.data_keys.setdefault(key_version, wrapped_key)
+
+
+def _new_partition():
+    return {
+        'todos': [],
+        'next_id': 1,
+        # Bumped on every write, drives ETags and delta sync
+        'version': 0,
+        # Ring buffer of the latest create/update/delete events
+        'changes': deque(maxlen=CHANGE_LOG_SIZE)
+    }
+
+
+def _changes_after(changes, version, since):
+    """Select the events newer than since from a version-ordered ring buffer"""
+    missing = version - since
+    if missing == 0:
+        return []
+    # Negative means a version from another epoch, too many means evicted
+    if missing < 0 or missing > len(changes):
+        return None
+    # Walk back from the newest event, so only the missing ones are visited
+    newest = list(islice(reversed(changes), missing))
+    newest.reverse()
+    return newest
+
+
+# Statements are kept as module constants so every connection's statement
+# cache (cached_statements) reuses the compiled form.
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS clients (
+        client_id TEXT PRIMARY KEY,
+        next_id INTEGER NOT NULL,
+        todo_count INTEGER NOT NULL,
+        version INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+    # The (client_id, id) primary key is the clustered index every lookup uses
+    """CREATE TABLE IF NOT EXISTS todos (
+        client_id TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        created_ms INTEGER NOT NULL,
+        encrypted INTEGER,
+        PRIMARY KEY (client_id, id)
+    ) WITHOUT ROWID""",
+    # Change log, trimmed to the last CHANGE_LOG_SIZE versions per client
+    """CREATE TABLE IF NOT EXISTS changes (
+        client_id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        todo_id INTEGER NOT NULL,
+        PRIMARY KEY (client_id, version)
+    ) WITHOUT ROWID""",
+)
+# Reserves n ids and n versions in one statement: (?, n, n, n, n, n, n)
+_ALLOCATE_IDS = """
+    INSERT INTO clients (client_id, next_id, todo_count, version) VALUES (?, 1 + ?, ?, ?)
+    ON CONFLICT (client_id) DO UPDATE
+        SET next_id = next_id + ?, todo_count = todo_count + ?, version = version + ?
+    RETURNING next_id, todo_count, version
+"""
+_INSERT_CHANGE = "INSERT INTO changes (client_id, version, op, todo_id) VALUES (?, ?, ?, ?)"
+_TRIM_CHANGES = "DELETE FROM changes WHERE client_id = ? AND version <= ?"
+_SELECT_CHANGES = """
+    SELECT c.version, c.op, c.todo_id, t.text, t.created_ms, t.encrypted
+    FROM changes c LEFT JOIN todos t ON t.client_id = c.client_id AND t.id = c.todo_id
+    WHERE c.client_id = ? AND c.version > ? ORDER BY c.version
+"""
+_SELECT_VERSION = "SELECT version FROM clients WHERE client_id = ?"
+_INIT_EPOCH = "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)"
+_SELECT_EPOCH = "SELECT value FROM meta WHERE key = 'epoch'"
+_INSERT_DATA_KEY = "INSERT OR IGNORE INTO meta (key, value) VALUES ('data_key:' || ?, ?)"
+_SELECT_DATA_KEY = "SELECT value FROM meta WHERE key = 'data_key:' || ?"
+_SELECT_DATA_KEY_VERSIONS = "SELECT substr(key, 10) FROM meta WHERE key LIKE 'data_key:%'"
+_INSERT_TODO = "INSERT INTO todos (client_id, id, text, created_ms, encrypted) VALUES (?, ?, ?, ?, ?)"
+_SELECT_TODOS = "SELECT id, text, created_ms, encrypted FROM todos WHERE client_id = ? ORDER BY id"
+_PAGE_ASC = """
+    SELECT id, text, created_ms, encrypted FROM todos
+    WHERE client_id = ? AND id > ? AND id < ? ORDER BY id ASC LIMIT ?
+"""
+_PAGE_DESC = """
+    SELECT id, text, created_ms, encrypted FROM todos
+    WHERE client_id = ? AND id > ? AND id < ? ORDER BY id DESC LIMIT ?
+"""
+_MAX_ID = 2 ** 63 - 1
+_SELECT_CLIENT_IDS = "SELECT client_id FROM clients WHERE client_id != ''"
+_SELECT_PARTITION = "SELECT next_id, version FROM clients WHERE client_id = ?"
+_INSERT_CLIENT = "INSERT INTO clients (client_id, next_id, todo_count, version) VALUES (?, ?, ?, ?)"
+_DELETE_PARTITION = (
+    "DELETE FROM todos WHERE client_id = ?",
+    "DELETE FROM changes WHERE client_id = ?",
+    "DELETE FROM clients WHERE client_id = ?",
+)
+_COUNT_USERS = "SELECT COUNT(*) FROM clients WHERE client_id != ''"
+_COUNT_GLOBAL = "SELECT todo_count FROM clients WHERE client_id = ''"
+_COUNT_TODOS = "SELECT todo_count FROM clients WHERE client_id = ?"
+
+
+class _ConnectionPool:
+    """Pool of SQLite connections owned by a single worker process
+
+    gunicorn forks workers after the app module is imported, so the pool is
+    rebuilt lazily whenever it is used from a new pid.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._pid = None
+        self._idle = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=10,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=64
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _idle_connections(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._idle = queue.LifoQueue()
+                    self._pid = pid
+        return self._idle
+
+    def fill(self):
+        """Open connections until the pool is full"""
+        idle = self._idle_connections()
+        while idle.qsize() < self.size:
+            idle.put(self._connect())
+
+    @contextmanager
+    def connection(self):
+        idle = self._idle_connections()
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if idle.qsize() < self.size:
+                idle.put(conn)
+            else:
+                conn.close()
+
+
+class SQLiteStore:
+    """SQLite storage in WAL mode, shared by every worker on the instance"""
+
+    name = 'sqlite'
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self._pool = _ConnectionPool(path, pool_size)
+        with self._pool.connection() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            # The epoch lives in the database so every worker agrees on it
+            conn.execute(_INIT_EPOCH, (secrets.token_hex(4),))
+            self.epoch = conn.execute(_SELECT_EPOCH).fetchone()[0]
+
+    @contextmanager
+    def _transaction(self):
+        with self._pool.connection() as conn:
+            # IMMEDIATE takes the write lock up front so id allocation
+            # cannot race with another worker
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    @staticmethod
+    def _row_to_todo(row):
+        todo_id, text, created_ms, encrypted = row
+        return Todo(text, created_ms, None if encrypted is None else bool(encrypted), todo_id)
+
+    def version(self, client_id=None):
+        """Return the list version, bumped on every write"""
+        with self._pool.connection() as conn:
+            row = conn.execute(_SELECT_VERSION, (client_id or GLOBAL_SCOPE,)).fetchone()
+        return row[0] if row else 0
+
+    def list_todos(self, client_id=None):
+        """Return the todos of a client, or the global list"""
+        with self._pool.connection() as conn:
+            rows = conn.execute(_SELECT_TODOS, (client_id or GLOBAL_SCOPE,)).fetchall()
+        return [self._row_to_todo(row) for row in rows]
+
+    def list_with_version(self, client_id=None):
+        """Return (version, todos) of a list, read together"""
+        scope = client_id or GLOBAL_SCOPE
+        with self._pool.connection() as conn:
+            # One read transaction so the version and the rows agree
+            conn.execute('BEGIN')
+            try:
+                row = conn.execute(_SELECT_VERSION, (scope,)).fetchone()
+                rows = conn.execute(_SELECT_TODOS, (scope,)).fetchall()
+            finally:
+                conn.execute('COMMIT')
+        return (row[0] if row else 0), [self._row_to_todo(row) for row in rows]
+
+    def page_todos(self, client_id=None, limit=None, after_id=None, before_id=None, order='asc'):
+        """Return (page, next_cursor) for a cursor-paginated listing"""
+        params = (
+            client_id or GLOBAL_SCOPE,
+            0 if after_id is None else after_id,
+            _MAX_ID if before_id is None else before_id,
+            # Fetch one extra row to learn whether another page exists
+            -1 if limit is None else limit + 1
+        )
+        with self._pool.connection() as conn:
+            rows = conn.execute(_PAGE_DESC if order == 'desc' else _PAGE_ASC, params).fetchall()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+        return [self._row_to_todo(row) for row in rows], next_cursor
+
+    def changes_since(self, client_id, since):
+        """Return (version, changes) after version since, changes is None if too old"""
+        scope = client_id or GLOBAL_SCOPE
+        with self._pool.connection() as conn:
+            # One read transaction so the version and the log agree
+            conn.execute('BEGIN')
+            try:
+                row = conn.execute(_SELECT_VERSION, (scope,)).fetchone()
+                version = row[0] if row else 0
+                missing = version - since
+                rows = []
+                if 0 < missing <= CHANGE_LOG_SIZE:
+                    rows = conn.execute(_SELECT_CHANGES, (scope, since)).fetchall()
+            finally:
+                conn.execute('COMMIT')
+
+        if missing == 0:
+            return version, []
+        if len(rows) != missing:
+            return version, None
+
+        changes = []
+        for change_version, op, todo_id, text, created_ms, encrypted in rows:
+            # Deleted todos only keep their id
+            todo = {'id': todo_id}
+            if text is not None:
+                todo = self._row_to_todo((todo_id, text, created_ms, encrypted))
+            changes.append({'version': change_version, 'op': op, 'todo': todo})
+        return version, changes
+
+    def add_todo(self, client_id, todo):
+        """Assign the next id to todo, store it and return the new list size"""
+        return self.add_todos(client_id, [todo])
+
+    def add_todos(self, client_id, todos):
+        """Store todos under a contiguous id range and return the new list size"""
+        scope = client_id or GLOBAL_SCOPE
+        n = len(todos)
+        with self._transaction() as conn:
+            next_id, count, version = conn.execute(_ALLOCATE_IDS, (scope,) + (n,) * 6).fetchone()
+            first_id, first_version = next_id - n, version - n + 1
+            for offset, todo in enumerate(todos):
+                todo.id = first_id + offset
+            conn.executemany(_INSERT_TODO, [
+                (scope, todo.id, todo.text, todo.created_ms,
+                 None if todo.encrypted is None else int(todo.encrypted))
+                for todo in todos
+            ])
+            conn.executemany(_INSERT_CHANGE, [
+                (scope, first_version + offset, 'create', todo.id)
+                for offset, todo in enumerate(todos)
+            ])
+            conn.execute(_TRIM_CHANGES, (scope, version - CHANGE_LOG_SIZE))
+        return count
+
+    def users_count(self):
+        with self._pool.connection() as conn:
+            return conn.execute(_COUNT_USERS).fetchone()[0]
+
+    def global_count(self):
+        with self._pool.connection() as conn:
+            row = conn.execute(_COUNT_GLOBAL).fetchone()
+        return row[0] if row else 0
+
+    def count_todos(self, client_id=None):
+        with self._pool.connection() as conn:
+            row = conn.execute(_COUNT_TODOS, (client_id or GLOBAL_SCOPE,)).fetchone()
+        return row[0] if row else 0
+
+    def save_data_key(self, key_version, wrapped_key):
+        """Keep a KMS-wrapped data key, see envelope.py"""
+        with self._pool.connection() as conn:
+            conn.execute(_INSERT_DATA_KEY, (key_version, wrapped_key))
+
+    def load_data_key(self, key_version):
+        with self._pool.connection() as conn:
+            row = conn.execute(_SELECT_DATA_KEY, (key_version,)).fetchone()
+        return row[0] if row else None
+
+    def data_key_versions(self):
+        with self._pool.connection() as conn:
+            return [row[0] for row in conn.execute(_SELECT_DATA_KEY_VERSIONS)]
+
+    def client_ids(self):
+        """Ids of every client with todos, without the global list"""
+        with self._pool.connection() as conn:
+            return [row[0] for row in conn.execute(_SELECT_CLIENT_IDS)]
+
+    def export_partition(self, client_id):
+        """Return (next_id, version, todos) of a client, None if unknown"""
+        scope = client_id or GLOBAL_SCOPE
+        with self._pool.connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                row = conn.execute(_SELECT_PARTITION, (scope,)).fetchone()
+                rows = conn.execute(_SELECT_TODOS, (scope,)).fetchall() if row else []
+            finally:
+                conn.execute('COMMIT')
+        if row is None:
+            return None
+        return row[0], row[1], [self._row_to_todo(todo) for todo in rows]
+
+    def restore_partition(self, client_id, next_id, version, todos):
+        """Replace the partition of a client, e.g. one moved from another shard"""
+        scope = client_id or GLOBAL_SCOPE
+        with self._transaction() as conn:
+            for statement in _DELETE_PARTITION:
+                conn.execute(statement, (scope,))
+            conn.execute(_INSERT_CLIENT, (scope, next_id, len(todos), version))
+            conn.executemany(_INSERT_TODO, [
+                (scope, todo.id, todo.text, todo.created_ms,
+                 None if todo.encrypted is None else int(todo.encrypted))
+                for todo in todos
+            ])
+
+    def drop_partition(self, client_id):
+        with self._transaction() as conn:
+            for statement in _DELETE_PARTITION:
+                conn.execute(statement, (client_id or GLOBAL_SCOPE,))
+
+    def warm(self):
+        """Open the whole connection pool and read the counters once"""
+        self._pool.fill()
+        self.users_count()
+
+    def stats(self):
+        return {'path': self.path}
+
+
+def create_store(backend=None, shard=None):
+    """Build the store selected by TODO_STORE_BACKEND
+
+    shard is the index of a sharding.ShardedStore shard, which gets its own
+    journal directory, SQLite file or Redis database.
+    """
+    backend = backend or os.environ.get('TODO_STORE_BACKEND', 'memory')
+
+    if backend == 'memory':
+        # Durable when TODO_WAL_DIR is set, see journal.py
+        wal_dir = os.environ.get('TODO_WAL_DIR')
+        if wal_dir and shard is not None:
+            wal_dir = os.path.join(wal_dir, f'shard-{shard}')
+        return InMemoryStore(
+            max_resident_clients=int(os.environ.get('TODO_MAX_RESIDENT_CLIENTS', '10000')),
+            spill_dir=os.environ.get('TODO_SPILL_DIR'),
+            lock_stripes=int(os.environ.get('TODO_LOCK_STRIPES', '16')),
+            journal=Journal(wal_dir) if wal_dir else None
+        )
+    if backend == 'sqlite':
+        # App Engine only allows writes under /tmp
+        path = os.environ.get('TODO_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'todos.db'))
+        if shard is not None:
+            root, ext = os.path.splitext(path)
+            path = f'{root}-{shard}{ext}'
+        pool_size = int(os.environ.get('TODO_SQLITE_POOL_SIZE', '4'))
+        return SQLiteStore(path, pool_size=pool_size)
+    if backend == 'redis':
+        # Imported here so the other backends do not need the redis package
+        from redis_store import RedisStore, shard_url
+        return RedisStore() if shard is None else RedisStore(shard_url(shard))
+    if backend == 'sharded':
+        from sharding import ShardedStore
+        kind = os.environ.get('TODO_SHARD_BACKEND', 'memory')
+        if kind == 'sharded':
+            raise ValueError("TODO_SHARD_BACKEND cannot be sharded")
+        count = int(os.environ.get('TODO_SHARDS', '4'))
+        return ShardedStore({f'shard-{index}': create_store(kind, index) for index in range(count)})
+
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,44 @@
+"""Streamed JSON bodies for very large todo lists
+
+With ?stream=1 the full list is sent as a JSON array built chunk by chunk
+from a generator. The list is walked with the store's cursor pagination, so
+only one chunk of todos and its encoded bytes are held at a time and worker
+memory stays flat however long the list is.
+
+stream_items sends item dicts that are already built, for callers that must
+finish fallible work (decryption) before the status line goes out.
+"""
+import os
+
+from response_cache import encode_json
+
+# Todos read from the store and encoded per yielded chunk
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '500'))
+
+
+def wants_stream(args):
+    """True when the request opted into a streamed response"""
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_list(store, client_id, encode_all, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the JSON array of a full list, encode_all(todos) gives the item dicts"""
+    yield b'['
+    separator = b''
+    cursor = None
+    while True:
+        page, cursor = store.page_todos(client_id, limit=chunk_size, after_id=cursor)
+        if page:
+            yield separator + b','.join(encode_json(item) for item in encode_all(page))
+            separator = b','
+        if cursor is None:
+            break
+    yield b']\n'
+
+
+def stream_items(items, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the JSON array of item dicts built beforehand, encoded chunk by chunk"""
+    yield b'['
+    for start in range(0, len(items), chunk_size):
+        yield (b',' if start else b'') + b','.join(encode_json(item) for item in items[start:start + chunk_size])
+    yield b']\n'
@@ -0,0 +1,83 @@
+"""Instance warmup before the first real request
+
+App Engine sends GET /_ah/warmup to a new instance before routing traffic
+to it (inbound_services: warmup in app.yaml). The handler runs the app's
+warmup phases (importing heavy modules, building clients, opening store
+connections, unwrapping data keys) and answers with how long each took.
+
+GKE has no warmup request. With WARMUP_ON_START=true the phases run on a
+background thread as soon as the app is imported, and GET /_ah/ready, the
+readiness probe in deployment.yaml, answers 503 until they are done.
+
+A failing phase is reported and does not keep the instance out of service;
+the feature it prepares falls back exactly as it would without warmup.
+"""
+import importlib
+import os
+import threading
+import time
+
+from flask import jsonify
+
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'false').lower() == 'true'
+
+
+def import_modules(*names):
+    """Import modules now so the first request does not"""
+    for name in names:
+        importlib.import_module(name)
+
+
+class Warmup:
+    """Named phases run once before the instance takes traffic"""
+
+    def __init__(self):
+        self.phases = []
+        self.results = {}
+        self.ready = False
+        self.total_seconds = None
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        """Decorator adding a function as the next phase"""
+        def register(fn):
+            self.phases.append((name, fn))
+            return fn
+        return register
+
+    def run(self):
+        """Run every phase once, later calls wait for and return the same report"""
+        with self._lock:
+            if not self.ready:
+                started = time.perf_counter()
+                for name, fn in self.phases:
+                    phase_started = time.perf_counter()
+                    error = None
+                    try:
+                        fn()
+                    except Exception as e:
+                        error = str(e)
+                        print(f"Warmup phase {name} failed: {e}")
+                    self.results[name] = {'seconds': round(time.perf_counter() - phase_started, 4), 'error': error}
+                self.total_seconds = round(time.perf_counter() - started, 4)
+                self.ready = True
+        return self.report()
+
+    def start(self):
+        """Run the phases on a background thread"""
+        threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    def report(self):
+        return {'ready': self.ready, 'total_seconds': self.total_seconds, 'phases': dict(self.results)}
+
+    def install(self, app, on_start=WARMUP_ON_START):
+        def warmup():
+            return jsonify(self.run())
+
+        def ready():
+            return jsonify(self.report()), 200 if self.ready else 503
+
+        app.add_url_rule('/_ah/warmup', 'warmup', warmup)
+        app.add_url_rule('/_ah/ready', 'ready', ready)
+        if on_start:
+            self.start()
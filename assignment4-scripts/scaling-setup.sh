@@ -78,6 +78,8 @@ spec:
             cpu: "500m"
             memory: "512Mi"
         env:
+        - name: TODO_STORE_BACKEND
+          value: "redis"
         - name: REDIS_URL
           value: "redis://redis-service:6379"
         livenessProbe:
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark
+Starts each app in a fresh interpreter and measures the module import time
+and the time to the first response of /, /api/status and POST /api/todos,
+either through the Flask test client (in-process) or a real gunicorn worker
+polled over HTTP (--gunicorn)
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+# Runs in the child interpreter, prints one JSON line of millisecond timings
+IN_PROCESS = '''
+import json, sys, time
+started = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+client = module.app.test_client()
+timings = {'import': (imported - started) * 1000}
+for label, call in (('/', lambda: client.get('/')),
+                    ('/api/status', lambda: client.get('/api/status')),
+                    ('POST /api/todos', lambda: client.post('/api/todos?client_id=cold', json={'text': 'first'}))):
+    before = time.perf_counter()
+    call()
+    timings[label] = (time.perf_counter() - before) * 1000
+timings['google modules'] = len([name for name in sys.modules if name.startswith('google.cloud')])
+print(json.dumps(timings))
+'''
+
+
+def in_process(module):
+    env = dict(os.environ, SECURITY_LOG_SINKS='', NO_GCE_CHECK='True')
+    output = subprocess.run([sys.executable, '-c', IN_PROCESS, module], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    # Shutdown hooks may print after the timings
+    return json.loads(next(line for line in output.splitlines() if line.startswith('{')))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def gunicorn(module):
+    """Milliseconds from spawning gunicorn to the first 200 from /"""
+    port = free_port()
+    env = dict(os.environ, SECURITY_LOG_SINKS='', NO_GCE_CHECK='True')
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', '1', '-b', f'127.0.0.1:{port}', f'{module}:app'],
+                               cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                time.sleep(0.01)
+        first = (time.perf_counter() - started) * 1000
+        before = time.perf_counter()
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/status', timeout=30):
+            pass
+        return {'first /': first, '/api/status': (time.perf_counter() - before) * 1000}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--gunicorn', action='store_true', help='time a real gunicorn worker over HTTP')
+    args = parser.parse_args()
+
+    measure = gunicorn if args.gunicorn else in_process
+    for module in ('main', 'secure_main'):
+        runs = [measure(module) for _ in range(args.runs)]
+        print(f"{module} (median of {args.runs} runs)")
+        for label in runs[0]:
+            median = statistics.median(run[label] for run in runs)
+            unit = '' if label == 'google modules' else ' ms'
+            print(f"  {label:<20} {median:>8.1f}{unit}")
+
+
+if __name__ == '__main__':
+    main()
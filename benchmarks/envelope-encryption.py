@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Envelope encryption benchmark
+Compares GET decryption time against list size for the original scheme
+(one KMS call per todo) and envelope encryption (local AES-GCM with a
+KMS-wrapped data key), using a fake KMS client with configurable latency
+"""
+
+import argparse
+import base64
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from envelope import EnvelopeCipher  # noqa: E402
+from storage import InMemoryStore  # noqa: E402
+
+KEY_NAME = 'projects/bench/locations/us-central1/keyRings/bench/cryptoKeys/bench'
+
+
+class FakeKMS:
+    """KMS stand-in: real AES-GCM under a master key plus a fixed network delay"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._master = AESGCM(AESGCM.generate_key(bit_length=256))
+
+    def crypto_key_path(self, *parts):
+        return KEY_NAME
+
+    def encrypt(self, request):
+        self.calls += 1
+        time.sleep(self.latency)
+        nonce = os.urandom(12)
+        return SimpleNamespace(ciphertext=nonce + self._master.encrypt(nonce, request['plaintext'], None))
+
+    def decrypt(self, request):
+        self.calls += 1
+        time.sleep(self.latency)
+        data = request['ciphertext']
+        return SimpleNamespace(plaintext=self._master.decrypt(data[:12], data[12:], None))
+
+
+def kms_encrypt(kms, text):
+    """Original secure_main.encrypt_text: one KMS call per todo"""
+    response = kms.encrypt(request={'name': KEY_NAME, 'plaintext': text.encode('utf-8')})
+    return base64.b64encode(response.ciphertext).decode('utf-8')
+
+
+def kms_decrypt(kms, ciphertext):
+    """Original secure_main.decrypt_text: one KMS call per todo"""
+    response = kms.decrypt(request={'name': KEY_NAME, 'ciphertext': base64.b64decode(ciphertext)})
+    return response.plaintext.decode('utf-8')
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='fake KMS round trip')
+    parser.add_argument('--sizes', default='10,50,200', help='comma separated list sizes')
+    args = parser.parse_args()
+
+    texts_for = {size: [f'todo item number {i}' for i in range(size)] for size in map(int, args.sizes.split(','))}
+    latency = args.latency_ms / 1000
+
+    print(f"fake KMS latency {args.latency_ms:.1f} ms\n")
+    print(f"{'list size':>9} {'per-todo KMS GET ms':>20} {'envelope cold ms':>17} {'envelope warm ms':>17} {'KMS calls':>10}")
+    for size, texts in texts_for.items():
+        kms = FakeKMS(latency)
+        legacy = [kms_encrypt(kms, text) for text in texts]
+        kms.calls = 0
+        legacy_ms = timed(lambda token: kms_decrypt(kms, token), legacy)
+        legacy_calls = kms.calls
+
+        kms = FakeKMS(latency)
+        key_store = InMemoryStore()
+        writer = EnvelopeCipher(kms, KEY_NAME, key_store)
+        tokens = [writer.encrypt(text) for text in texts]
+
+        # A fresh worker unwraps the data key once, later GETs never call KMS
+        kms.calls = 0
+        reader = EnvelopeCipher(kms, KEY_NAME, key_store)
+        cold_ms = timed(reader.decrypt, tokens)
+        warm_ms = timed(reader.decrypt, tokens)
+
+        print(f"{size:>9} {legacy_ms:>20.1f} {cold_ms:>17.1f} {warm_ms:>17.2f} {legacy_calls:>5} vs {kms.calls}")
+
+
+if __name__ == '__main__':
+    main()
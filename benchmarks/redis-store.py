@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Redis store benchmark
+Drives the in-memory and Redis stores directly from several threads with the
+store calls of the API (GET: version then list or page, POST: add_todo) and
+reports operations/sec. Point --url at a redis-server, or pass --fake to run
+against an in-process fakeredis when no server is available (that measures
+the client code path, not the network)
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from records import Todo  # noqa: E402
+from redis_store import RedisStore  # noqa: E402
+from storage import InMemoryStore  # noqa: E402
+
+
+def build_redis(args):
+    prefix = f'bench:{uuid.uuid4().hex}:'
+    if args.fake:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        return RedisStore(prefix=prefix, client_factory=lambda: fakeredis.FakeRedis(
+            server=server, decode_responses=True))
+    return RedisStore(args.url, pool_size=max(args.threads), prefix=prefix)
+
+
+def cleanup(store):
+    if store.name == 'redis':
+        client = store._redis()
+        for key in client.scan_iter(store.prefix + '*'):
+            client.delete(key)
+
+
+def run(store, duration, threads, clients, write_ratio):
+    """Returns (reads, writes) done in duration seconds"""
+    deadline = time.perf_counter() + duration
+    totals = {'reads': 0, 'writes': 0}
+    lock = threading.Lock()
+
+    def worker():
+        reads = writes = 0
+        rng = random.Random()
+        while time.perf_counter() < deadline:
+            client_id = f'bench_{rng.randrange(clients)}'
+            if rng.random() < write_ratio:
+                store.add_todo(client_id, Todo('benchmark todo'))
+                writes += 1
+            else:
+                store.version(client_id)
+                if rng.random() < 0.5:
+                    store.list_todos(client_id)
+                else:
+                    store.page_todos(client_id, limit=20, order='desc')
+                reads += 1
+        with lock:
+            totals['reads'] += reads
+            totals['writes'] += writes
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return totals['reads'], totals['writes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    parser.add_argument('--fake', action='store_true', help='use fakeredis instead of --url')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per run')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--clients', type=int, default=200, help='distinct client ids')
+    parser.add_argument('--prefill', type=int, default=50, help='todos per client before measuring')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of add_todo calls')
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'threads':>7} {'ops/s':>10} {'reads/s':>10} {'writes/s':>10}")
+    for name in ('memory', 'redis'):
+        for threads in args.threads:
+            store = InMemoryStore() if name == 'memory' else build_redis(args)
+            try:
+                for i in range(args.clients):
+                    store.add_todos(f'bench_{i}', [Todo(f'prefill {n}') for n in range(args.prefill)])
+                reads, writes = run(store, args.duration, threads, args.clients, args.write_ratio)
+            finally:
+                cleanup(store)
+            print(f"{name:<8} {threads:>7} {(reads + writes) / args.duration:>10.0f} "
+                  f"{reads / args.duration:>10.0f} {writes / args.duration:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Read-scaling benchmark for log-shipping replication
+Starts a leader and 0 to 3 followers of main:app under gunicorn on local
+ports, spreads GET /api/todos over all of them while a share of writes goes
+to the leader, and reports aggregate reads/sec and the staleness the
+followers reported in X-Replica-Staleness-Ms
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+TOKEN = 'benchmark-replication-token'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_instance(role, workers, leader_port=None):
+    """Start gunicorn for main:app in its own process group, returns (proc, port)"""
+    port = free_port()
+    env = dict(os.environ, TODO_REPLICATION_ROLE=role, TODO_REPLICATION_TOKEN=TOKEN)
+    if leader_port:
+        env['TODO_REPLICATION_LEADER_URL'] = f'http://127.0.0.1:{leader_port}'
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '-w', str(workers), '--threads', '4',
+         'main:app'], cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    for _ in range(100):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return proc, port
+        except OSError:
+            time.sleep(0.1)
+    os.killpg(proc.pid, signal.SIGKILL)
+    raise RuntimeError(f"gunicorn did not start for the {role}")
+
+
+def run_load(leader, ports, duration, threads, clients, write_ratio):
+    """Returns (reads, writes, errors, staleness samples in ms)"""
+    deadline = time.perf_counter() + duration
+    totals = {'reads': 0, 'writes': 0, 'errors': 0}
+    staleness = []
+    lock = threading.Lock()
+
+    def worker():
+        reads = writes = errors = 0
+        seen = []
+        rng = random.Random()
+        body = json.dumps({'text': 'benchmark todo'})
+        while time.perf_counter() < deadline:
+            client_id = f'bench_{rng.randrange(clients)}'
+            write = rng.random() < write_ratio
+            conn = http.client.HTTPConnection('127.0.0.1', leader if write else rng.choice(ports), timeout=10)
+            try:
+                if write:
+                    conn.request('POST', f'/api/todos?client_id={client_id}', body,
+                                 {'Content-Type': 'application/json'})
+                else:
+                    conn.request('GET', f'/api/todos?client_id={client_id}')
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors += 1
+                elif write:
+                    writes += 1
+                else:
+                    reads += 1
+                    if response.getheader('X-Replica-Role') == 'follower':
+                        seen.append(int(response.getheader('X-Replica-Staleness-Ms')))
+            except OSError:
+                errors += 1
+            finally:
+                conn.close()
+        with lock:
+            totals['reads'] += reads
+            totals['writes'] += writes
+            totals['errors'] += errors
+            staleness.extend(seen)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return totals['reads'], totals['writes'], totals['errors'], staleness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--followers', type=int, nargs='+', default=[0, 1, 2, 3])
+    parser.add_argument('--follower-workers', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent load threads')
+    parser.add_argument('--clients', type=int, default=50, help='distinct client ids')
+    parser.add_argument('--write-ratio', type=float, default=0.05, help='share of POST requests')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'followers':>9} {'reads/s':>10} {'writes/s':>9} {'errors':>7} {'staleness ms p50/max':>21}")
+    for followers in args.followers:
+        procs = []
+        try:
+            proc, leader = start_instance('leader', 1)
+            procs.append(proc)
+            ports = [leader]
+            for _ in range(followers):
+                proc, port = start_instance('follower', args.follower_workers, leader)
+                procs.append(proc)
+                ports.append(port)
+            # Let the followers take their first snapshot
+            time.sleep(1)
+            reads, writes, errors, staleness = run_load(
+                leader, ports, args.duration, args.threads, args.clients, args.write_ratio
+            )
+        finally:
+            for proc in procs:
+                os.killpg(proc.pid, signal.SIGTERM)
+                proc.wait()
+        staleness.sort()
+        lag = f"{staleness[len(staleness) // 2]}/{staleness[-1]}" if staleness else '-'
+        print(f"{followers:>9} {reads / args.duration:>10.1f} {writes / args.duration:>9.1f} "
+              f"{errors:>7} {lag:>21}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Content screening microbenchmark
+Compares the original per-pattern `in` loop with the compiled Aho-Corasick
+automaton and a single combined regex at 10, 100 and 1000 rules
+"""
+
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from screening import Automaton, Rule  # noqa: E402
+
+
+def random_words(rng, count, low, high):
+    return [''.join(rng.choices(string.ascii_lowercase + '(<:=.', k=rng.randint(low, high))) for _ in range(count)]
+
+
+def naive(patterns):
+    """Original validate_todo_text: lowercase, then one `in` per pattern"""
+    def check(text):
+        text_lower = text.lower()
+        return [pattern for pattern in patterns if pattern in text_lower]
+    return check
+
+
+def combined_regex(patterns):
+    regex = re.compile('|'.join(re.escape(p) for p in sorted(patterns, key=len, reverse=True)))
+    return lambda text: regex.findall(text.lower())
+
+
+def automaton(patterns):
+    return Automaton([Rule(p) for p in patterns]).search
+
+
+def time_per_check(check, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            check(text)
+    return (time.perf_counter() - start) / (rounds * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--texts', type=int, default=200, help='texts checked per round')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    # Todo-sized inputs (up to 255 characters), mostly clean
+    texts = [' '.join(random_words(rng, rng.randint(3, 40), 2, 8))[:255] for _ in range(args.texts)]
+
+    print(f"{'rules':>6} {'in-loop us':>11} {'regex us':>9} {'automaton us':>13} {'build ms':>9}")
+    for count in (10, 100, 1000):
+        patterns = random_words(rng, count, 5, 14)
+        start = time.perf_counter()
+        compiled = automaton(patterns)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        results = [time_per_check(check, texts, args.rounds)
+                   for check in (naive(patterns), combined_regex(patterns), compiled)]
+        print(f"{count:>6} {results[0]:>11.1f} {results[1]:>9.1f} {results[2]:>13.1f} {build_ms:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
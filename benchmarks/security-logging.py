@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Security logging benchmark
+Measures p50/p99 request latency of secure_main with a deliberately slow
+logging backend, once writing each event inside the request (the original
+behaviour) and once through the asynchronous batched logger
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+os.environ.setdefault('NO_GCE_CHECK', 'True')
+os.environ.setdefault('SECURITY_LOG_SINKS', '')
+
+import secure_main  # noqa: E402
+from security_log import AsyncEventLogger  # noqa: E402
+from storage import InMemoryStore  # noqa: E402
+
+
+class SlowSink:
+    """Stands in for Cloud Logging: every write costs one round trip"""
+
+    name = 'slow'
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.writes = 0
+
+    def write(self, events):
+        self.writes += 1
+        time.sleep(self.latency)
+
+
+class SyncLogger:
+    """Original behaviour: the request waits for each write"""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def log(self, event):
+        self.sink.write([event])
+
+    def stats(self):
+        return {}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(client, requests):
+    latencies = []
+    for i in range(requests):
+        path = '/api/status' if i % 10 == 0 else '/api/todos?client_id=bench&limit=20'
+        start = time.perf_counter()
+        client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='logging backend round trip')
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    secure_main.store = InMemoryStore()
+    secure_main.store.add_todos('bench', [secure_main.Todo(f'todo {i}') for i in range(50)])
+    client = secure_main.app.test_client()
+
+    print(f"logging backend latency {args.latency_ms:.1f} ms, {args.requests} requests\n")
+    print(f"{'mode':<22} {'p50 ms':>8} {'p99 ms':>8} {'backend writes':>15}")
+    for mode in ('synchronous', 'async batched'):
+        sink = SlowSink(args.latency_ms / 1000)
+        if mode == 'synchronous':
+            secure_main.security_log = SyncLogger(sink)
+        else:
+            secure_main.security_log = AsyncEventLogger([sink])
+
+        latencies = run(client, args.requests)
+        if mode != 'synchronous':
+            secure_main.security_log.close()
+        print(f"{mode:<22} {percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} {sink.writes:>15}")
+
+
+if __name__ == '__main__':
+    main()
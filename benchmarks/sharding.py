@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Sharding benchmark
+Runs the todo API under gunicorn with TODO_STORE_BACKEND=sharded over 1, 2,
+4 and 8 shards of --backend (sqlite by default: one file per shard, so
+writers to different shards no longer queue on one database lock) and
+reports aggregate requests/sec for a write-heavy load, then the time the
+rebalancer needs to move clients onto an added shard
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'app'))
+
+from records import Todo  # noqa: E402
+from sharding import ShardedStore  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+# Reuse the gunicorn runner and load generator of the backend benchmark
+_spec = importlib.util.spec_from_file_location('storage_backends', os.path.join(BENCH_DIR, 'storage-backends.py'))
+storage_backends = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(storage_backends)
+
+
+def serve_and_load(args, shards, tmp):
+    os.environ.update(TODO_SHARDS=str(shards), TODO_SHARD_BACKEND=args.backend)
+    port = storage_backends.free_port()
+    proc = storage_backends.start_server('sharded', args.workers, port, os.path.join(tmp, 'todos.db'))
+    try:
+        return storage_backends.run_load(port, args.duration, args.threads, args.clients, args.write_ratio)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def time_rebalance(tmp, clients, todos):
+    """Seconds to move the clients of 4 SQLite shards onto a 5th one"""
+    shards = {f'shard-{i}': SQLiteStore(os.path.join(tmp, f'rebalance-{i}.db')) for i in range(4)}
+    store = ShardedStore(shards, background=False)
+    for i in range(clients):
+        store.add_todos(f'client_{i}', [Todo(f'todo {n}') for n in range(todos)])
+    store.add_shard('shard-4', SQLiteStore(os.path.join(tmp, 'rebalance-4.db')))
+    pending = store.stats()['moves_pending']
+    started = time.perf_counter()
+    store.rebalance()
+    return pending, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backend', default='sqlite', choices=['memory', 'sqlite', 'redis'])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent load threads')
+    parser.add_argument('--clients', type=int, default=200, help='distinct client ids')
+    parser.add_argument('--write-ratio', type=float, default=0.5, help='share of POST requests')
+    args = parser.parse_args()
+
+    print(f"{args.backend} shards, {args.workers} gunicorn workers, {os.cpu_count()} CPUs")
+    print(f"{'shards':>6} {'req/s':>10} {'errors':>7}")
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            requests_done, errors = serve_and_load(args, shards, tmp)
+        print(f"{shards:>6} {requests_done / args.duration:>10.1f} {errors:>7}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        moved, seconds = time_rebalance(tmp, clients=2000, todos=10)
+    print(f"\nadding a 5th SQLite shard to 2000 clients: {moved} moved in {seconds:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
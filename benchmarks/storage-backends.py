@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Storage backend benchmark
+Runs the todo API under gunicorn with the memory and SQLite backends at
+1, 4 and 8 workers and reports requests/sec for a mixed GET/POST load
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(backend, workers, port, db_path):
+    """Start gunicorn for main:app and wait until it answers"""
+    env = dict(os.environ, TODO_STORE_BACKEND=backend, TODO_SQLITE_PATH=db_path)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '-w', str(workers), 'main:app'],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"gunicorn did not start for backend={backend} workers={workers}")
+
+
+def run_load(port, duration, threads, clients, write_ratio):
+    """Hammer the API from several threads and return (requests, errors)"""
+    deadline = time.perf_counter() + duration
+    totals = {'requests': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker():
+        done = errors = 0
+        rng = random.Random()
+        body = json.dumps({'text': 'benchmark todo'})
+        while time.perf_counter() < deadline:
+            client_id = f'bench_{rng.randrange(clients)}'
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            try:
+                if rng.random() < write_ratio:
+                    conn.request('POST', f'/api/todos?client_id={client_id}', body,
+                                 {'Content-Type': 'application/json'})
+                else:
+                    conn.request('GET', f'/api/todos?client_id={client_id}')
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors += 1
+            except OSError:
+                errors += 1
+            finally:
+                conn.close()
+            done += 1
+        with lock:
+            totals['requests'] += done
+            totals['errors'] += errors
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return totals['requests'], totals['errors']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent load threads')
+    parser.add_argument('--clients', type=int, default=50, help='distinct client ids')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of POST requests')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'workers':>7} {'req/s':>10} {'errors':>7}")
+    for backend in ('memory', 'sqlite'):
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                port = free_port()
+                proc = start_server(backend, workers, port, os.path.join(tmp, 'todos.db'))
+                try:
+                    requests_done, errors = run_load(
+                        port, args.duration, args.threads, args.clients, args.write_ratio
+                    )
+                finally:
+                    proc.terminate()
+                    proc.wait()
+            print(f"{backend:<8} {workers:>7} {requests_done / args.duration:>10.1f} {errors:>7}")
+
+    print("\nNote: the memory backend keeps a separate copy per worker, so with more")
+    print("than one worker its lists are inconsistent between requests.")
+
+
+if __name__ == '__main__':
+    main()
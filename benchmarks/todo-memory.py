@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Todo record memory benchmark
+Measures bytes per todo with tracemalloc for the original dict records
+(ISO created_at string built up front) and the __slots__ Todo records
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from records import Todo, now_ms  # noqa: E402
+
+
+def dict_records(texts):
+    """Original layout: one dict per todo"""
+    return [{
+        'id': i + 1,
+        'text': text,
+        'created_at': datetime.utcnow().isoformat() + 'Z'
+    } for i, text in enumerate(texts)]
+
+
+def slot_records(texts):
+    """Compact layout: one __slots__ object per todo, epoch-ms timestamp"""
+    return [Todo(text, now_ms(), id=i + 1) for i, text in enumerate(texts)]
+
+
+def measure(build, texts):
+    """Return the bytes allocated by build(texts), excluding the texts"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = build(texts)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1_000_000, help='number of todos')
+    args = parser.parse_args()
+
+    # Texts are created beforehand: both layouts hold the same strings
+    texts = [f'todo item number {i}' for i in range(args.count)]
+
+    print(f"{'layout':<16} {'total MB':>10} {'bytes/todo':>11}")
+    results = {}
+    for name, build in (('dict + ISO str', dict_records), ('__slots__ Todo', slot_records)):
+        total = measure(build, texts)
+        results[name] = total
+        print(f"{name:<16} {total / 1e6:>10.1f} {total / args.count:>11.1f}")
+
+    saved = 1 - results['__slots__ Todo'] / results['dict + ISO str']
+    print(f"\n{args.count:,} todos: {saved:.0%} less memory per record (text excluded)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Durable in-memory store benchmark
+Writes --todos todos (default 1M) through a journaled InMemoryStore, then
+measures recovery time from the log alone and from a snapshot plus a short
+log tail, and the write latency cost of the journal
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from journal import Journal  # noqa: E402
+from records import Todo  # noqa: E402
+from storage import InMemoryStore  # noqa: E402
+
+# Resident capacity per client, so the numbers measure the journal and not
+# partitions spilling to disk
+HEADROOM = 4
+
+
+def directory_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+
+
+def fill(store, todos, clients, batch):
+    started = time.perf_counter()
+    for start in range(0, todos, batch):
+        client = f'client_{(start // batch) % clients}'
+        store.add_todos(client, [Todo(f'todo number {start + i} for {client}') for i in range(batch)])
+    return time.perf_counter() - started
+
+
+def recover(directory, clients):
+    """Open a store on directory, returns (seconds, todos recovered)"""
+    started = time.perf_counter()
+    store = InMemoryStore(max_resident_clients=clients * HEADROOM, journal=Journal(directory, snapshot_seconds=0))
+    seconds = time.perf_counter() - started
+    recovered = store.journal.recovered_todos
+    store.journal.close()
+    return seconds, recovered
+
+
+def single_writes(store, count):
+    started = time.perf_counter()
+    for i in range(count):
+        store.add_todo('latency', Todo(f'single {i}'))
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--todos', type=int, default=1_000_000)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=50, help='todos per add_todos call')
+    parser.add_argument('--tail', type=int, default=10_000, help='todos written after the snapshot')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='wal-bench-')
+    try:
+        store = InMemoryStore(max_resident_clients=args.clients * HEADROOM, journal=Journal(directory, snapshot_seconds=0))
+        print(f"write {args.todos} todos: {fill(store, args.todos, args.clients, args.batch):.1f} s")
+        store.journal.close()
+        print(f"log only: {directory_mb(directory):.0f} MB")
+        seconds, recovered = recover(directory, args.clients)
+        print(f"  recovery {seconds:.2f} s, {recovered} todos")
+
+        store = InMemoryStore(max_resident_clients=args.clients * HEADROOM, journal=Journal(directory, snapshot_seconds=0))
+        started = time.perf_counter()
+        store.journal.snapshot()
+        print(f"snapshot: {time.perf_counter() - started:.2f} s")
+        fill(store, args.tail, args.clients, args.batch)
+        store.journal.close()
+        print(f"snapshot + {args.tail} todo tail: {directory_mb(directory):.0f} MB")
+        seconds, recovered = recover(directory, args.clients)
+        print(f"  recovery {seconds:.2f} s, {recovered} todos")
+
+        print("single-todo write latency")
+        for label, journal in (('no journal', None), ('journal, group commit', Journal(directory + '-gc')),
+                               ('journal, fsync per write', Journal(directory + '-sync', sync_ms=0))):
+            store = InMemoryStore(journal=journal)
+            print(f"  {label:<26} {single_writes(store, 2000):>8.1f} us")
+            if journal is not None:
+                journal.close()
+    finally:
+        for path in (directory, directory + '-gc', directory + '-sync'):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
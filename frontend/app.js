@@ -9,6 +9,16 @@ class TodoApp {
         this.apiBaseUrl = this.API_BASE_URLS[0]; // Start with App Engine
         this.clientId = this.getOrCreateClientId();
         this.todos = [];
+        this.nextCursor = null;
+        this.etag = null;
+        this.epoch = null;
+        this.version = null;
+        this.PAGE_SIZE = 50;
+        this.POLL_INTERVAL_MS = 5000;
+        this.pendingTexts = [];
+        this.batchTimer = null;
+        this.BATCH_DELAY_MS = 150;
+        this.MAX_BATCH_SIZE = 50;
         this.isLoading = false;
 
         this.init();
@@ -34,6 +44,16 @@ class TodoApp {
         this.updateUI();
         this.checkBackendHealth();
         this.loadTodos();
+        this.startPolling();
+    }
+
+    // Cheap delta polling while the tab is visible
+    startPolling() {
+        setInterval(() => {
+            if (!document.hidden) {
+                this.syncChanges();
+            }
+        }, this.POLL_INTERVAL_MS);
     }
 
     // Event binding
@@ -42,6 +62,7 @@ class TodoApp {
         const todoInput = document.getElementById('todoInput');
         const refreshBtn = document.getElementById('refreshBtn');
         const retryBtn = document.getElementById('retryBtn');
+        const loadMoreBtn = document.getElementById('loadMoreBtn');
 
         todoForm.addEventListener('submit', (e) => {
             e.preventDefault();
@@ -53,12 +74,16 @@ class TodoApp {
         });
 
         refreshBtn.addEventListener('click', () => {
-            this.loadTodos();
+            this.syncChanges();
         });
 
         retryBtn.addEventListener('click', () => {
             this.loadTodos();
         });
+
+        loadMoreBtn.addEventListener('click', () => {
+            this.loadMoreTodos();
+        });
     }
 
     // UI Updates
@@ -126,21 +151,36 @@ class TodoApp {
         this.setLoading(true);
 
         try {
-            const url = `${this.apiBaseUrl}/api/todos?client_id=${this.clientId}`;
+            // Newest first, one page at a time
+            const url = `${this.apiBaseUrl}/api/todos?client_id=${this.clientId}&order=desc&limit=${this.PAGE_SIZE}`;
+            const headers = {
+                'Accept': 'application/json',
+                'Content-Type': 'application/json'
+            };
+            // Revalidate instead of downloading an unchanged list
+            if (this.etag) {
+                headers['If-None-Match'] = this.etag;
+            }
             const response = await fetch(url, {
                 method: 'GET',
-                headers: {
-                    'Accept': 'application/json',
-                    'Content-Type': 'application/json'
-                }
+                headers
             });
 
+            if (response.status === 304) {
+                this.renderTodos(false);
+                this.hideError();
+                return;
+            }
+
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
             }
 
             const data = await response.json();
-            this.todos = Array.isArray(data) ? data : [];
+            this.etag = response.headers.get('ETag');
+            this.epoch = response.headers.get('X-Todos-Epoch');
+            this.version = response.headers.get('X-Todos-Version');
+            this.applyPage(data, false);
             this.renderTodos();
             this.hideError();
 
@@ -154,7 +194,7 @@ class TodoApp {
                     const response = await fetch(fallbackUrl);
                     if (response.ok) {
                         const data = await response.json();
-                        this.todos = Array.isArray(data) ? data : [];
+                        this.applyPage(data, false);
                         this.renderTodos();
                         this.hideError();
                         return;
@@ -170,9 +210,101 @@ class TodoApp {
         }
     }
 
-    async addTodo() {
+    // Fetch only the changes since the loaded version, fall back to a full load
+    async syncChanges() {
+        if (this.isLoading) return;
+        if (this.version === null) {
+            return this.loadTodos();
+        }
+
+        try {
+            const url = `${this.apiBaseUrl}/api/todos/changes?client_id=${this.clientId}&since=${this.version}&epoch=${this.epoch}`;
+            const response = await fetch(url, {
+                headers: { 'Accept': 'application/json' }
+            });
+
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+
+            const data = await response.json();
+            if (data.resync) {
+                this.version = null;
+                return this.loadTodos();
+            }
+
+            this.version = String(data.version);
+            if (data.changes.length > 0) {
+                this.applyChanges(data.changes);
+                this.renderTodos();
+            }
+        } catch (error) {
+            console.error('Failed to sync todos:', error);
+        }
+    }
+
+    applyChanges(changes) {
+        for (const change of changes) {
+            const index = this.todos.findIndex(todo => todo.id === change.todo.id);
+            if (change.op === 'delete') {
+                if (index !== -1) this.todos.splice(index, 1);
+            } else if (index !== -1) {
+                this.todos[index] = change.todo;
+            } else {
+                // Newest first
+                this.todos.unshift(change.todo);
+            }
+        }
+        // The cached full list no longer matches what is on screen
+        this.etag = null;
+    }
+
+    async loadMoreTodos() {
+        if (this.isLoading || this.nextCursor === null) return;
+
+        const loadMoreBtn = document.getElementById('loadMoreBtn');
+        loadMoreBtn.disabled = true;
+
+        try {
+            const url = `${this.apiBaseUrl}/api/todos?client_id=${this.clientId}&order=desc&limit=${this.PAGE_SIZE}&before_id=${this.nextCursor}`;
+            const response = await fetch(url, {
+                headers: { 'Accept': 'application/json' }
+            });
+
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+
+            this.applyPage(await response.json(), true);
+            this.renderTodos();
+        } catch (error) {
+            console.error('Failed to load more todos:', error);
+            this.showError('Failed to load more todos');
+        } finally {
+            loadMoreBtn.disabled = false;
+        }
+    }
+
+    // Accepts a page envelope, or a plain ascending array from older backends
+    applyPage(data, append) {
+        let page;
+        if (Array.isArray(data)) {
+            page = data.reverse();
+            this.nextCursor = null;
+        } else {
+            page = Array.isArray(data.todos) ? data.todos : [];
+            this.nextCursor = data.next_cursor ?? null;
+        }
+
+        if (append) {
+            this.todos.push(...page);
+        } else {
+            this.todos = page;
+        }
+    }
+
+    addTodo() {
         const input = document.getElementById('todoInput');
-        const addBtn = document.getElementById('addBtn');
         const text = input.value.trim();
 
         if (!text) {
@@ -185,17 +317,36 @@ class TodoApp {
             return;
         }
 
+        // Coalesce rapid submissions into a single batch request
+        this.pendingTexts.push(text);
+        input.value = '';
+        this.updateCharCount();
+
+        if (this.pendingTexts.length >= this.MAX_BATCH_SIZE) {
+            clearTimeout(this.batchTimer);
+            this.flushPendingTodos();
+        } else if (!this.batchTimer) {
+            this.batchTimer = setTimeout(() => this.flushPendingTodos(), this.BATCH_DELAY_MS);
+        }
+    }
+
+    async flushPendingTodos() {
+        const addBtn = document.getElementById('addBtn');
+        const texts = this.pendingTexts;
+        this.pendingTexts = [];
+        this.batchTimer = null;
+
         this.setButtonLoading(addBtn, true);
 
         try {
-            const url = `${this.apiBaseUrl}/api/todos?client_id=${this.clientId}`;
+            const url = `${this.apiBaseUrl}/api/todos/batch?client_id=${this.clientId}`;
             const response = await fetch(url, {
                 method: 'POST',
                 headers: {
                     'Accept': 'application/json',
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({ text })
+                body: JSON.stringify({ texts })
             });
 
             if (!response.ok) {
@@ -205,22 +356,33 @@ class TodoApp {
 
             const result = await response.json();
 
-            // Clear input and reload todos
-            input.value = '';
-            this.updateCharCount();
-            this.loadTodos();
+            // Pull the new todos
+            this.syncChanges();
 
             // Show success feedback
-            this.showSuccess('Todo added successfully!');
+            this.showSuccess(result.created === 1 ? 'Todo added successfully!' : `${result.created} todos added successfully!`);
 
         } catch (error) {
-            console.error('Failed to add todo:', error);
+            console.error('Failed to add todos:', error);
+            this.restoreUnsavedTexts(texts);
             this.showError(error.message || 'Failed to add todo');
         } finally {
             this.setButtonLoading(addBtn, false);
         }
     }
 
+    // Nothing of a failed batch was stored: the first text goes back into
+    // an empty input to fix or resend, the rest wait for the next batch
+    restoreUnsavedTexts(texts) {
+        const input = document.getElementById('todoInput');
+        const unsaved = [...texts];
+        if (!input.value.trim()) {
+            input.value = unsaved.shift();
+            this.updateCharCount();
+        }
+        this.pendingTexts.unshift(...unsaved);
+    }
+
     // UI state management
     setLoading(isLoading) {
         this.isLoading = isLoading;
@@ -252,18 +414,22 @@ class TodoApp {
         }
     }
 
-    renderTodos() {
+    // rebuild=false only restores visibility, used when the list is unchanged
+    renderTodos(rebuild = true) {
         const emptyState = document.getElementById('emptyState');
         const errorState = document.getElementById('errorState');
         const todoList = document.getElementById('todoList');
         const todoCount = document.getElementById('todoCount');
         const loadingState = document.getElementById('loadingState');
+        const loadMoreBtn = document.getElementById('loadMoreBtn');
 
         // Hide loading state
         loadingState.style.display = 'none';
+        loadMoreBtn.style.display = this.nextCursor !== null ? 'block' : 'none';
 
-        // Update count
-        todoCount.textContent = `${this.todos.length} todo${this.todos.length !== 1 ? 's' : ''}`;
+        // Update count, only a lower bound while older pages are not loaded
+        const more = this.nextCursor !== null ? '+' : '';
+        todoCount.textContent = `${this.todos.length}${more} todo${this.todos.length !== 1 || more ? 's' : ''}`;
 
         if (this.todos.length === 0) {
             emptyState.style.display = 'block';
@@ -274,10 +440,12 @@ class TodoApp {
             errorState.style.display = 'none';
             todoList.style.display = 'flex';
 
-            // Sort todos by ID (most recent first)
-            const sortedTodos = [...this.todos].sort((a, b) => b.id - a.id);
+            if (!rebuild) {
+                return;
+            }
 
-            todoList.innerHTML = sortedTodos.map(todo => `
+            // The API already returns todos most recent first
+            todoList.innerHTML = this.todos.map(todo => `
                 <li class="todo-item">
                     <div class="todo-content">
                         <div class="todo-text">${this.escapeHtml(todo.text)}</div>
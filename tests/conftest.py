@@ -0,0 +1,36 @@
+import os
+import sys
+
+# Make the app modules (main, secure_main, storage, ...) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+# Skip the GCE metadata probe google-auth does when no credentials are set
+os.environ.setdefault('NO_GCE_CHECK', 'True')
+
+import pytest  # noqa: E402
+
+import storage  # noqa: E402
+from storage import InMemoryStore, SQLiteStore  # noqa: E402
+
+
+@pytest.fixture
+def store_options():
+    """Variants of the store fixture, overridden by the modules that need one
+
+    pool_size: SQLite connections; max_resident_clients: in-memory partitions
+    kept before spilling to tmp_path; change_log_size: storage.CHANGE_LOG_SIZE
+    """
+    return {}
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path, monkeypatch, store_options):
+    """An empty store of each backend in turn"""
+    if 'change_log_size' in store_options:
+        monkeypatch.setattr(storage, 'CHANGE_LOG_SIZE', store_options['change_log_size'])
+    if request.param == 'sqlite':
+        return SQLiteStore(str(tmp_path / 'todos.db'), pool_size=store_options.get('pool_size', 4))
+    if 'max_resident_clients' in store_options:
+        return InMemoryStore(max_resident_clients=store_options['max_resident_clients'],
+                             spill_dir=str(tmp_path / 'spill'))
+    return InMemoryStore()
@@ -0,0 +1,71 @@
+import pytest
+
+import main
+from records import Todo
+from storage import InMemoryStore, SQLiteStore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore())
+    return main.app.test_client()
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_batch_ids_are_contiguous(backend, tmp_path):
+    store = InMemoryStore() if backend == 'memory' else SQLiteStore(str(tmp_path / 'todos.db'))
+    store.add_todo('alice', Todo('single'))
+
+    batch = [Todo(f'b{i}') for i in range(3)]
+    assert store.add_todos('alice', batch) == 4
+    assert [todo.id for todo in batch] == [2, 3, 4]
+    assert store.version('alice') == 4
+    assert [c['todo'].id for c in store.changes_since('alice', 1)[1]] == [2, 3, 4]
+
+
+def test_batch_endpoint(client):
+    response = client.post('/api/todos/batch?client_id=batch', json={'texts': ['one', ' two ', 'three']})
+    assert response.status_code == 201
+    assert response.get_json() == {
+        'count': 3, 'created': 3, 'first_id': 1, 'last_id': 3, 'user_id': 'batch'
+    }
+    assert [t['text'] for t in client.get('/api/todos?client_id=batch').get_json()] == ['one', 'two', 'three']
+
+
+def test_batch_is_rejected_as_a_whole(client):
+    response = client.post('/api/todos/batch?client_id=batch', json={'texts': ['ok', '   ']})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'texts[1]: text cannot be empty'
+    assert client.get('/api/todos?client_id=batch').get_json() == []
+
+    too_many = ['x'] * (main.MAX_BATCH_SIZE + 1)
+    assert client.post('/api/todos/batch', json={'texts': too_many}).status_code == 400
+    assert client.post('/api/todos/batch', json={'texts': []}).status_code == 400
+
+
+@pytest.mark.parametrize('body', [['a', 'b'], 'a', 3])
+def test_batch_body_must_be_an_object(client, body):
+    import secure_main
+
+    for app_client in (client, secure_main.app.test_client()):
+        response = app_client.post('/api/todos/batch', json=body)
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'texts field is required'}
+
+
+def test_secure_batch_records_one_metric_and_log_entry(monkeypatch):
+    import secure_main
+
+    monkeypatch.setattr(secure_main, 'store', InMemoryStore())
+    metrics, events = [], []
+    monkeypatch.setattr(secure_main, 'record_metric', lambda name, value, labels=None: metrics.append((name, value)))
+    monkeypatch.setattr(secure_main, 'count_metric', lambda name, value=1, labels=None: metrics.append((name, value)))
+    monkeypatch.setattr(secure_main, 'log_security_event', lambda event, details: events.append(event))
+
+    client = secure_main.app.test_client()
+    response = client.post('/api/todos/batch?client_id=batch', json={'texts': ['a', 'b', 'c', 'd']})
+    assert response.status_code == 201
+
+    assert ('todos_created', 4) in metrics
+    assert [name for name, _ in metrics].count('todos_created') == 1
+    assert events.count('CREATE_TODO_BATCH') == 1
@@ -0,0 +1,159 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import secure_main
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, DeadlineExceeded, GuardedClient
+from envelope import EnvelopeCipher
+from lazy import LazyClient
+from security_log import CloudLoggingSink
+from storage import InMemoryStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class HangingKMS:
+    """Fake KMS whose calls block until released, or answer when healthy"""
+
+    def __init__(self):
+        self.healthy = False
+        self.calls = 0
+        self.release = threading.Event()
+
+    def crypto_key_path(self, *parts):
+        return 'key'
+
+    def encrypt(self, request):
+        self.calls += 1
+        if not self.healthy:
+            self.release.wait(5)
+        return SimpleNamespace(ciphertext=b'wrapped:' + request['plaintext'])
+
+
+@pytest.fixture
+def kms():
+    kms = HangingKMS()
+    yield kms
+    kms.release.set()
+
+
+def test_hangs_open_the_breaker_then_fail_fast(kms):
+    breaker = CircuitBreaker('kms', deadline=0.05, failure_threshold=2, reset_seconds=30, clock=Clock())
+    client = GuardedClient(kms, breaker, ('encrypt',))
+
+    for _ in range(2):
+        with pytest.raises(DeadlineExceeded):
+            client.encrypt(request={'plaintext': b'k'})
+    assert breaker.state == OPEN
+
+    start = time.perf_counter()
+    with pytest.raises(CircuitOpen):
+        client.encrypt(request={'plaintext': b'k'})
+    assert time.perf_counter() - start < 0.01
+    assert kms.calls == 2
+    assert client.crypto_key_path('p') == 'key'
+    assert breaker.stats()['timeouts_total'] == 2
+
+
+def test_half_open_probe(kms):
+    clock = Clock()
+    breaker = CircuitBreaker('kms', deadline=0.05, failure_threshold=1, reset_seconds=10, clock=clock)
+    client = GuardedClient(kms, breaker, ('encrypt',))
+    with pytest.raises(DeadlineExceeded):
+        client.encrypt(request={'plaintext': b'k'})
+
+    # A failed probe opens the breaker again
+    clock.now = 10
+    with pytest.raises(DeadlineExceeded):
+        client.encrypt(request={'plaintext': b'k'})
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        client.encrypt(request={'plaintext': b'k'})
+
+    # A successful one closes it
+    kms.healthy = True
+    clock.now = 20
+    assert client.encrypt(request={'plaintext': b'k'}).ciphertext == b'wrapped:k'
+    assert breaker.state == CLOSED
+    assert breaker.stats()['opened_total'] == 2
+
+
+def test_only_one_probe_at_a_time(kms):
+    clock = Clock()
+    breaker = CircuitBreaker('kms', deadline=0.5, failure_threshold=1, reset_seconds=10, clock=clock)
+    breaker._record_failure(False)
+    clock.now = 10
+
+    results = []
+    probe = threading.Thread(target=lambda: results.append(breaker.call(kms.encrypt, {'plaintext': b''})))
+    probe.start()
+    time.sleep(0.05)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.call(kms.encrypt, {'plaintext': b''})
+    kms.release.set()
+    probe.join()
+    assert len(results) == 1
+    assert breaker.state == CLOSED
+
+
+def test_client_errors_do_not_open_the_breaker():
+    breaker = CircuitBreaker('kms', failure_threshold=1)
+
+    def reject():
+        error = Exception('invalid ciphertext')
+        error.code = 400
+        raise error
+
+    with pytest.raises(Exception):
+        breaker.call(reject)
+    assert breaker.state == CLOSED
+
+    def throttle():
+        error = Exception('quota exceeded')
+        error.code = 429
+        raise error
+
+    with pytest.raises(Exception):
+        breaker.call(throttle)
+    assert breaker.state == OPEN
+
+
+def test_hanging_logging_backend_is_cut_off():
+    release = threading.Event()
+    batch = SimpleNamespace(log_struct=lambda *a, **kw: None, commit=lambda: release.wait(5))
+    sink = CloudLoggingSink(SimpleNamespace(batch=lambda: batch),
+                            CircuitBreaker('logging', deadline=0.05, failure_threshold=1))
+    event = {'event_type': 'X', 'severity': 'INFO', 'http_request': None, 'details': {}}
+    try:
+        with pytest.raises(DeadlineExceeded):
+            sink.write([event])
+        with pytest.raises(CircuitOpen):
+            sink.write([event])
+    finally:
+        release.set()
+
+
+def test_secure_main_falls_back_to_plaintext_and_reports_state(kms, monkeypatch):
+    breaker = CircuitBreaker('kms', deadline=0.05, failure_threshold=1)
+    cipher = EnvelopeCipher(GuardedClient(kms, breaker, ('encrypt', 'decrypt')), 'key', InMemoryStore())
+    monkeypatch.setattr(secure_main, 'kms_enabled', lambda: True)
+    monkeypatch.setattr(secure_main, 'cipher', LazyClient('cipher', lambda: cipher))
+    monkeypatch.setitem(secure_main.breakers, 'kms', breaker)
+
+    start = time.perf_counter()
+    assert secure_main.encrypt_text('hello') == 'hello'
+    assert secure_main.encrypt_text('again') == 'again'
+    assert time.perf_counter() - start < 0.5
+
+    status = secure_main.app.test_client().get('/api/status').get_json()
+    assert status['circuit_breakers']['kms']['state'] == 'open'
+    assert set(status['circuit_breakers']) == {'kms', 'logging', 'monitoring'}
@@ -0,0 +1,58 @@
+import pytest
+
+import main
+from records import Todo
+from storage import InMemoryStore
+
+
+def make_todo(text):
+    return Todo(text)
+
+
+@pytest.fixture
+def store_options():
+    return {'change_log_size': 3}
+
+
+def test_up_to_date_client_gets_no_changes(store):
+    assert store.changes_since('alice', 0) == (0, [])
+    store.add_todo('alice', make_todo('a'))
+    assert store.changes_since('alice', 1) == (1, [])
+
+
+def test_changes_since_a_version(store):
+    for text in ('a', 'b', 'c'):
+        store.add_todo('alice', make_todo(text))
+
+    version, changes = store.changes_since('alice', 1)
+    assert version == 3
+    assert [(c['version'], c['op'], c['todo'].text) for c in changes] == [
+        (2, 'create', 'b'), (3, 'create', 'c')
+    ]
+
+
+def test_client_too_far_behind_must_resync(store):
+    for text in ('a', 'b', 'c', 'd', 'e'):
+        store.add_todo('alice', make_todo(text))
+
+    # Only the last three versions are kept
+    assert store.changes_since('alice', 1) == (5, None)
+    assert [c['version'] for c in store.changes_since('alice', 2)[1]] == [3, 4, 5]
+    # A version the store never reached, e.g. from before a restart
+    assert store.changes_since('alice', 9) == (5, None)
+
+
+def test_changes_endpoint(monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore())
+    client = main.app.test_client()
+
+    listing = client.get('/api/todos?client_id=sync')
+    epoch, version = listing.headers['X-Todos-Epoch'], listing.headers['X-Todos-Version']
+
+    client.post('/api/todos?client_id=sync', json={'text': 'new'})
+    body = client.get(f'/api/todos/changes?client_id=sync&since={version}&epoch={epoch}').get_json()
+    assert body['version'] == 1
+    assert [c['todo']['text'] for c in body['changes']] == ['new']
+
+    assert client.get('/api/todos/changes?client_id=sync&since=1&epoch=other').get_json()['resync'] is True
+    assert client.get('/api/todos/changes?client_id=sync&since=x').status_code == 400
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+import secure_main
+from decryption import DecryptTimeout, DecryptUnavailable, ParallelDecryptor, PlaintextCache
+from records import Todo
+from storage import InMemoryStore
+
+
+class FakeDecrypt:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ciphertext):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return ciphertext.replace('enc:', '')
+
+
+def test_warm_lists_are_not_decrypted_again():
+    decrypt = FakeDecrypt()
+    decryptor = ParallelDecryptor(decrypt)
+    ciphertexts = ['enc:a', 'enc:b', 'enc:a', 'enc:c']
+
+    assert decryptor.decrypt_all(ciphertexts) == ['a', 'b', 'a', 'c']
+    assert decrypt.calls == 3
+    assert decryptor.decrypt_all(ciphertexts) == ['a', 'b', 'a', 'c']
+    assert decrypt.calls == 3
+
+
+def test_misses_are_decrypted_concurrently():
+    decryptor = ParallelDecryptor(FakeDecrypt(delay=0.1), workers=8)
+
+    start = time.perf_counter()
+    decryptor.decrypt_all([f'enc:{i}' for i in range(8)])
+    assert time.perf_counter() - start < 0.5
+
+
+def test_deadline_and_failures_are_not_cached():
+    decryptor = ParallelDecryptor(FakeDecrypt(delay=0.5), workers=1, deadline=0.1)
+    with pytest.raises(DecryptTimeout):
+        decryptor.decrypt_all(['enc:a', 'enc:b'])
+    assert decryptor.stats()['timeouts'] == 1
+
+    # Unavailable decryption serves the stored text and stays uncached
+    def unavailable(ciphertext):
+        raise DecryptUnavailable('kms down')
+
+    failing = ParallelDecryptor(unavailable)
+    assert failing.decrypt_all(['enc:a']) == ['enc:a']
+    assert len(failing.cache) == 0
+
+    # Plaintext rows come back unchanged and are cached like any plaintext
+    plain = FakeDecrypt()
+    decryptor = ParallelDecryptor(plain)
+    decryptor.decrypt_all(['stored in plaintext'])
+    assert decryptor.decrypt_all(['stored in plaintext']) == ['stored in plaintext']
+    assert plain.calls == 1
+
+
+class RejectingKMS:
+    """Fake KMS that rejects everything as an invalid ciphertext"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def crypto_key_path(self, *parts):
+        return 'key'
+
+    def decrypt(self, request):
+        self.calls += 1
+        error = Exception('400 Decryption failed: the ciphertext is invalid.')
+        error.code = 400
+        raise error
+
+
+def test_plaintext_fallback_rows_reach_kms_once(monkeypatch):
+    from breaker import CLOSED, CircuitBreaker, GuardedClient
+
+    kms = RejectingKMS()
+    breaker = CircuitBreaker('kms', failure_threshold=1)
+    monkeypatch.setattr(secure_main, 'kms_enabled', lambda: True)
+    monkeypatch.setattr(secure_main, 'kms_client', GuardedClient(kms, breaker, ('decrypt',)))
+    decryptor = ParallelDecryptor(secure_main.decrypt_text)
+
+    # Valid base64, so only KMS can tell it is not a ciphertext
+    texts = ['abcd', 'Todo', 'not base64!']
+    assert decryptor.decrypt_all(texts) == texts
+    assert decryptor.decrypt_all(texts) == texts
+    assert kms.calls == 2
+    assert breaker.state == CLOSED
+
+
+def test_cache_is_bounded():
+    cache = PlaintextCache(max_entries=2)
+    for key in (b'a', b'b', b'c'):
+        cache.put(key, key.decode())
+    assert len(cache) == 2
+    assert cache.get(b'a') is None
+
+
+def test_secure_get_caps_decryption(monkeypatch):
+    decrypt = FakeDecrypt()
+    store = InMemoryStore()
+    store.add_todos('capped', [Todo(f'enc:todo {i}', encrypted=True) for i in range(5)])
+    monkeypatch.setattr(secure_main, 'store', store)
+    monkeypatch.setattr(secure_main, 'kms_enabled', lambda: True)
+    monkeypatch.setattr(secure_main, 'MAX_DECRYPT_PER_GET', 3)
+    monkeypatch.setattr(secure_main, 'decryptor', ParallelDecryptor(decrypt))
+    client = secure_main.app.test_client()
+
+    response = client.get('/api/todos?client_id=capped')
+    assert [todo['text'] for todo in response.get_json()] == ['todo 0', 'todo 1', 'todo 2']
+    assert response.headers['X-Todos-Truncated'] == 'true'
+    assert response.headers['X-Next-Cursor'] == '3'
+
+    page = client.get('/api/todos?client_id=capped&after_id=3&limit=50').get_json()
+    assert [todo['text'] for todo in page['todos']] == ['todo 3', 'todo 4']
+    assert decrypt.calls == 5
+
+    # A warm GET decrypts nothing
+    client.get('/api/todos?client_id=capped&limit=2')
+    assert decrypt.calls == 5
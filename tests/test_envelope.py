@@ -0,0 +1,94 @@
+import base64
+from types import SimpleNamespace
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from envelope import EnvelopeCipher, is_envelope
+from storage import InMemoryStore, SQLiteStore
+
+
+class FakeKMS:
+    """Wraps keys by reversing them and counts the calls"""
+
+    def __init__(self):
+        self.encrypt_calls = 0
+        self.decrypt_calls = 0
+
+    def encrypt(self, request):
+        self.encrypt_calls += 1
+        return SimpleNamespace(ciphertext=b'wrapped:' + request['plaintext'][::-1])
+
+    def decrypt(self, request):
+        self.decrypt_calls += 1
+        return SimpleNamespace(plaintext=request['ciphertext'][len(b'wrapped:'):][::-1])
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_one_kms_call_for_many_todos():
+    kms = FakeKMS()
+    cipher = EnvelopeCipher(kms, 'key', InMemoryStore())
+
+    tokens = [cipher.encrypt(f'secret {i}') for i in range(200)]
+    assert all(is_envelope(token) for token in tokens)
+    assert 'secret' not in tokens[0]
+    assert [cipher.decrypt(token) for token in tokens] == [f'secret {i}' for i in range(200)]
+    assert (kms.encrypt_calls, kms.decrypt_calls) == (1, 0)
+
+
+def test_key_rotates_after_ttl_and_old_versions_still_decrypt():
+    kms = FakeKMS()
+    clock = Clock()
+    cipher = EnvelopeCipher(kms, 'key', InMemoryStore(), ttl=60, clock=clock)
+
+    old = cipher.encrypt('before')
+    clock.now = 61
+    new = cipher.encrypt('after')
+
+    assert old.split(':')[1] != new.split(':')[1]
+    assert kms.encrypt_calls == 2
+    # The expired key is unwrapped once and then cached again
+    assert cipher.decrypt(old) == 'before'
+    assert cipher.decrypt(old) == 'before'
+    assert kms.decrypt_calls == 1
+
+
+def test_other_workers_unwrap_from_the_shared_store(tmp_path):
+    kms = FakeKMS()
+    path = str(tmp_path / 'todos.db')
+    token = EnvelopeCipher(kms, 'key', SQLiteStore(path)).encrypt('shared')
+
+    other = EnvelopeCipher(kms, 'key', SQLiteStore(path))
+    assert other.decrypt(token) == 'shared'
+    assert kms.decrypt_calls == 1
+
+
+def test_tampered_ciphertext_is_rejected():
+    cipher = EnvelopeCipher(FakeKMS(), 'key', InMemoryStore())
+    prefix, key_version, payload = cipher.encrypt('secret').split(':')
+    data = bytearray(base64.b64decode(payload))
+    data[-1] ^= 1
+
+    with pytest.raises(InvalidTag):
+        cipher.decrypt(':'.join((prefix, key_version, base64.b64encode(bytes(data)).decode())))
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_preload_unwraps_stored_keys(backend, tmp_path):
+    store = InMemoryStore() if backend == 'memory' else SQLiteStore(str(tmp_path / 'todos.db'))
+    kms = FakeKMS()
+    token = EnvelopeCipher(kms, 'key', store).encrypt('secret')
+
+    # A new instance unwraps the stored key during warmup, not on first read
+    cipher = EnvelopeCipher(kms, 'key', store)
+    assert cipher.preload() == 2
+    calls = kms.decrypt_calls
+    assert cipher.decrypt(token) == 'secret'
+    assert kms.decrypt_calls == calls
@@ -0,0 +1,65 @@
+import pytest
+
+import main
+from records import Todo
+from storage import InMemoryStore, SQLiteStore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore())
+    return main.app.test_client()
+
+
+def test_versions_are_bumped_per_write(tmp_path):
+    for store in (InMemoryStore(), SQLiteStore(str(tmp_path / 'todos.db'))):
+        assert store.version('alice') == 0
+        store.add_todo('alice', Todo('a'))
+        store.add_todo('alice', Todo('b'))
+        assert store.version('alice') == 2
+        assert store.version('bob') == 0
+        assert store.version(None) == 0
+
+
+def test_unchanged_list_returns_304(client):
+    client.post('/api/todos?client_id=etag', json={'text': 'first'})
+
+    first = client.get('/api/todos?client_id=etag')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+
+    again = client.get('/api/todos?client_id=etag', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+    client.post('/api/todos?client_id=etag', json={'text': 'second'})
+    changed = client.get('/api/todos?client_id=etag', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert len(changed.get_json()) == 2
+
+
+def test_global_list_is_cacheable_by_a_cdn(client):
+    response = client.get('/api/todos', headers={'Origin': 'https://example.com'})
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+    assert 'Origin' in response.headers['Vary']
+    etag = response.headers['ETag']
+    assert 'Origin' in client.get('/api/todos', headers={'If-None-Match': etag}).headers['Vary']
+
+
+def test_secure_app_skips_decryption_on_304(monkeypatch):
+    import secure_main
+
+    monkeypatch.setattr(secure_main, 'store', InMemoryStore())
+    client = secure_main.app.test_client()
+    client.post('/api/todos?client_id=etag', json={'text': 'secret'})
+    etag = client.get('/api/todos?client_id=etag').headers['ETag']
+
+    def fail(ciphertext):
+        raise AssertionError('decrypt_text must not run for a 304')
+
+    monkeypatch.setattr(secure_main, 'decrypt_text', fail)
+    response = client.get('/api/todos?client_id=etag', headers={'If-None-Match': etag})
+    assert response.status_code == 304
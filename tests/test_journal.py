@@ -0,0 +1,182 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from journal import Journal, JournalLocked
+from records import Todo
+from storage import InMemoryStore
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+def open_store(directory, **kwargs):
+    kwargs.setdefault('snapshot_seconds', 0)
+    return InMemoryStore(journal=Journal(str(directory), **kwargs))
+
+
+def contents(store, client_id):
+    return [(t.id, t.text, t.created_ms, t.encrypted) for t in store.list_todos(client_id)]
+
+
+def test_todos_and_keys_survive_a_restart(tmp_path):
+    store = open_store(tmp_path)
+    store.add_todos('alice', [Todo('one', 1), Todo('two', 2, True)])
+    store.add_todo(None, Todo('global', 3))
+    store.add_todo('bob', Todo('bob', 4))
+    store.save_data_key('v1', 'wrapped')
+    store.journal.close()
+
+    restored = open_store(tmp_path)
+    assert contents(restored, 'alice') == [(1, 'one', 1, None), (2, 'two', 2, True)]
+    assert contents(restored, None) == [(1, 'global', 3, None)]
+    assert restored.load_data_key('v1') == 'wrapped'
+    assert restored.version('alice') == 2
+    assert restored.journal.recovered_todos == 4
+
+    # Ids continue where they stopped
+    assert restored.add_todo('alice', Todo('three')) == 3
+    assert restored.list_todos('alice')[-1].id == 3
+
+
+def test_snapshot_compacts_the_log(tmp_path):
+    store = InMemoryStore(max_resident_clients=2, lock_stripes=1, journal=Journal(str(tmp_path), snapshot_seconds=0))
+    for client in ('a', 'b', 'c', 'd'):
+        store.add_todos(client, [Todo(f'{client}{i}') for i in range(3)])
+    assert store.stats()['spilled_clients'] == 2
+
+    store.journal.snapshot()
+    store.add_todo('a', Todo('after snapshot'))
+    store.journal.close()
+    names = sorted(os.listdir(tmp_path))
+    assert names == ['LOCK', 'snapshot-00000002.json', 'wal-00000002.log']
+
+    restored = open_store(tmp_path)
+    assert [t.text for t in restored.list_todos('a')] == ['a0', 'a1', 'a2', 'after snapshot']
+    assert [t.text for t in restored.list_todos('d')] == ['d0', 'd1', 'd2']
+
+
+def test_replay_skips_todos_already_in_the_snapshot(tmp_path):
+    store = open_store(tmp_path)
+    store.add_todos('alice', [Todo('one'), Todo('two')])
+    # A write landing between the rotation and the snapshot is in both
+    segment = store.journal.rotate()
+    store.add_todo('alice', Todo('three'))
+    store.journal.write_snapshot(segment)
+    store.journal.compact(segment)
+    store.journal.close()
+
+    restored = open_store(tmp_path)
+    assert [t.id for t in restored.list_todos('alice')] == [1, 2, 3]
+    assert restored.version('alice') == 3
+
+
+def test_torn_record_ends_replay(tmp_path):
+    store = open_store(tmp_path)
+    store.add_todos('alice', [Todo('kept')])
+    store.journal.close()
+    with open(tmp_path / 'wal-00000001.log', 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x00\x00\x00\x00["t","alice",[[2,"to')
+
+    restored = open_store(tmp_path)
+    assert [t.text for t in restored.list_todos('alice')] == ['kept']
+    restored.add_todo('alice', Todo('next'))
+    restored.journal.close()
+    # New writes went to a fresh segment, after the torn one
+    assert [t.text for t in open_store(tmp_path).list_todos('alice')] == ['kept', 'next']
+
+
+def test_moved_partitions_survive_a_restart(tmp_path):
+    store = open_store(tmp_path)
+    store.add_todos('leaving', [Todo('gone')])
+    store.drop_partition('leaving')
+    store.restore_partition('arriving', 3, 2, [Todo('one', 1, id=1), Todo('two', 2, id=2)])
+    store.add_todo('arriving', Todo('three', 3))
+    store.journal.close()
+
+    restored = open_store(tmp_path)
+    assert restored.list_todos('leaving') == ()
+    assert contents(restored, 'arriving') == [(1, 'one', 1, None), (2, 'two', 2, None), (3, 'three', 3, None)]
+    assert restored.version('arriving') == 3
+
+
+def test_appends_do_not_wait_for_the_group_commit_fsync(tmp_path, monkeypatch):
+    store = open_store(tmp_path, sync_ms=60_000)
+    store.add_todo('alice', Todo('before'))
+    entered, release = threading.Event(), threading.Event()
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        entered.set()
+        release.wait(5)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', slow_fsync)
+    syncing = threading.Thread(target=store.journal.sync)
+    syncing.start()
+    assert entered.wait(2)
+
+    started = time.monotonic()
+    store.add_todo('alice', Todo('during the fsync'))
+    assert time.monotonic() - started < 1
+    release.set()
+    syncing.join()
+
+    # The record appended meanwhile still needs its own fsync
+    assert store.journal._pending == 1
+    monkeypatch.setattr(os, 'fsync', real_fsync)
+    store.journal.close()
+    assert [text for _, text, _, _ in contents(open_store(tmp_path), 'alice')] == ['before', 'during the fsync']
+
+
+def test_one_process_per_directory(tmp_path):
+    store = open_store(tmp_path)
+    with pytest.raises(JournalLocked):
+        Journal(str(tmp_path))
+    store.journal.close()
+
+
+WRITER = '''
+import sys
+sys.path.insert(0, sys.argv[2])
+from journal import Journal
+from records import Todo
+from storage import InMemoryStore
+
+store = InMemoryStore(journal=Journal(sys.argv[1], sync_ms=5, snapshot_seconds=0.05))
+batch_number = 0
+while True:
+    client = f'c{batch_number % 7}'
+    batch = [Todo(f'{client} item {n}') for n in range(25)]
+    store.add_todos(client, batch)
+    print(client, batch[-1].id, flush=True)
+    batch_number += 1
+'''
+
+
+def test_kill_during_writes_loses_no_acknowledged_batch(tmp_path):
+    writer = subprocess.Popen([sys.executable, '-c', WRITER, str(tmp_path), APP_DIR],
+                              stdout=subprocess.PIPE, text=True)
+    acked = {}
+    for _ in range(400):
+        client, last_id = writer.stdout.readline().split()
+        acked[client] = int(last_id)
+    os.kill(writer.pid, signal.SIGKILL)
+    for line in writer.stdout.read().splitlines():
+        client, last_id = line.split()
+        acked[client] = int(last_id)
+    writer.wait()
+
+    store = open_store(tmp_path)
+    for client, last_id in acked.items():
+        todos = store.list_todos(client)
+        # Whole batches only, in id order, nothing acknowledged missing
+        assert len(todos) % 25 == 0
+        assert len(todos) >= last_id
+        assert [t.id for t in todos] == list(range(1, len(todos) + 1))
+        assert [t.text for t in todos[:25]] == [f'{client} item {n}' for n in range(25)]
+    store.journal.close()
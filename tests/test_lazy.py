@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from lazy import FAILED, PENDING, READY, ClientUnavailable, LazyClient
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+def test_factory_runs_once_across_threads():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'client'
+
+    holder = LazyClient('slow', factory)
+    assert holder.state == PENDING and holder.enabled is None
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(holder.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['client'] * 8
+    assert len(calls) == 1
+    assert holder.state == READY and holder.enabled is True
+    assert holder.upper() == 'CLIENT'
+
+
+def test_failure_is_remembered():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        raise RuntimeError('no credentials')
+
+    holder = LazyClient('broken', factory)
+    assert holder.get() is None
+    assert not holder.available()
+    assert len(calls) == 1
+    assert holder.state == FAILED and holder.enabled is False
+    assert holder.describe()['error'] == 'no credentials'
+    with pytest.raises(ClientUnavailable):
+        holder.encrypt
+
+
+def test_secure_main_serves_home_and_status_without_google_clients():
+    script = (
+        "import sys, secure_main\n"
+        "client = secure_main.app.test_client()\n"
+        "assert client.get('/').status_code == 200\n"
+        "status = client.get('/api/status').get_json()\n"
+        "assert status['clients']['kms']['state'] == 'not_loaded', status['clients']\n"
+        "loaded = [m for m in ('google.cloud.kms_v1', 'google.cloud.logging', 'google.cloud.monitoring_v3')"
+        " if m in sys.modules]\n"
+        "assert not loaded, loaded\n"
+    )
+    env = dict(os.environ, SECURITY_LOG_SINKS='stdout', NO_GCE_CHECK='True')
+    result = subprocess.run([sys.executable, '-c', script], cwd=APP_DIR, env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
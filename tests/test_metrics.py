@@ -0,0 +1,129 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+import metrics
+from metrics import MetricsAggregator
+
+
+class FakeMonitoringClient:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.called = threading.Event()
+
+    def create_time_series(self, name, time_series):
+        self.calls.append((name, list(time_series)))
+        self.called.set()
+        if self.fail:
+            raise RuntimeError('monitoring unavailable')
+
+
+def aggregator(client, interval=60):
+    return MetricsAggregator(client, 'proj', 'gae_app', {'project_id': 'proj'}, interval=interval)
+
+
+def series_by_type(call):
+    return {(s.metric.type, tuple(sorted(s.metric.labels.items()))): s for s in call[1]}
+
+
+def test_one_batched_call_per_flush():
+    client = FakeMonitoringClient()
+    agg = aggregator(client)
+    for _ in range(100):
+        agg.count('incoming_requests', 1, {'method': 'GET'})
+    agg.count('incoming_requests', 1, {'method': 'POST'})
+    for value in (1.0, 3.0, 5.0, 500.0):
+        agg.observe('get_todos_response_time', value)
+
+    assert client.calls == []
+    assert agg.flush() == 3
+    assert len(client.calls) == 1
+    assert client.calls[0][0] == 'projects/proj'
+
+    series = series_by_type(client.calls[0])
+    get = series[('custom.googleapis.com/flask_app/incoming_requests', (('method', 'GET'),))]
+    assert get.points[0].value.double_value == 100
+    assert get.resource.labels['project_id'] == 'proj'
+
+    dist = series[('custom.googleapis.com/flask_app/get_todos_response_time_distribution', ())]
+    value = dist.points[0].value.distribution_value
+    assert value.count == 4
+    assert value.mean == pytest.approx(127.25)
+    assert sum(value.bucket_counts) == 4
+
+    # Nothing new, nothing sent
+    assert agg.flush() == 0
+
+
+def test_large_flushes_are_split_and_failures_dropped():
+    client = FakeMonitoringClient(fail=True)
+    agg = aggregator(client)
+    for i in range(450):
+        agg.count('todos_created', 1, {'client': str(i)})
+
+    agg.flush()
+    assert [len(batch) for _, batch in client.calls] == [200, 200, 50]
+    assert agg.stats()['dropped_series'] == 450
+    assert agg.stats()['pending_series'] == 0
+
+
+def test_background_thread_flushes(monkeypatch):
+    monkeypatch.setattr(metrics.atexit, 'register', lambda fn: None)
+    original = signal.getsignal(signal.SIGTERM)
+    client = FakeMonitoringClient()
+    agg = aggregator(client, interval=0.05)
+    agg.count('incoming_requests')
+    try:
+        agg.start()
+        assert client.called.wait(2)
+    finally:
+        agg.stop()
+        signal.signal(signal.SIGTERM, original)
+
+
+def test_sigterm_flushes_then_runs_previous_handler(monkeypatch):
+    monkeypatch.setattr(metrics.atexit, 'register', lambda fn: None)
+    received = []
+    original = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+    client = FakeMonitoringClient()
+    agg = aggregator(client)
+    try:
+        agg.start()
+        agg.count('incoming_requests')
+        os.kill(os.getpid(), signal.SIGTERM)
+        deadline = time.monotonic() + 2
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        signal.signal(signal.SIGTERM, original)
+
+    assert received == [signal.SIGTERM]
+    assert len(client.calls) == 1
+
+
+def test_sigterm_during_a_metric_update_does_not_hang(monkeypatch):
+    monkeypatch.setattr(metrics.atexit, 'register', lambda fn: None)
+    received = []
+    original = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+    client = FakeMonitoringClient()
+    agg = aggregator(client)
+    agg.shutdown_timeout = 0.2
+    agg.count('incoming_requests')
+    try:
+        agg.start()
+        # As if the signal arrived inside count() on this thread
+        with agg._lock:
+            started = time.monotonic()
+            os.kill(os.getpid(), signal.SIGTERM)
+            while not received and time.monotonic() - started < 2:
+                time.sleep(0.01)
+            assert received == [signal.SIGTERM]
+            assert client.calls == []
+        # The flush thread sends everything once the lock is free
+        assert client.called.wait(2)
+    finally:
+        signal.signal(signal.SIGTERM, original)
@@ -0,0 +1,76 @@
+import pytest
+
+from pagination import page_of, parse_page_args
+from records import Todo
+
+
+@pytest.fixture
+def store(store):
+    for i in range(1, 8):
+        store.add_todo('alice', Todo(f'todo {i}'))
+    return store
+
+
+def ids(page):
+    return [todo['id'] if isinstance(todo, dict) else todo.id for todo in page]
+
+
+def test_parse_page_args():
+    assert parse_page_args({}) is None
+    assert parse_page_args({'limit': '5', 'order': 'desc'}) == {
+        'limit': 5, 'after_id': None, 'before_id': None, 'order': 'desc'
+    }
+
+    for bad in ({'limit': '0'}, {'limit': '5000'}, {'limit': 'x'},
+                {'order': 'random'}, {'after_id': '-1'}):
+        with pytest.raises(ValueError):
+            parse_page_args(bad)
+
+
+def test_ascending_pages_follow_the_cursor(store):
+    page, cursor = store.page_todos('alice', limit=3)
+    assert ids(page) == [1, 2, 3] and cursor == 3
+
+    page, cursor = store.page_todos('alice', limit=3, after_id=cursor)
+    assert ids(page) == [4, 5, 6] and cursor == 6
+
+    page, cursor = store.page_todos('alice', limit=3, after_id=cursor)
+    assert ids(page) == [7] and cursor is None
+
+
+def test_descending_pages_follow_the_cursor(store):
+    page, cursor = store.page_todos('alice', limit=4, order='desc')
+    assert ids(page) == [7, 6, 5, 4] and cursor == 4
+
+    page, cursor = store.page_todos('alice', limit=4, order='desc', before_id=cursor)
+    assert ids(page) == [3, 2, 1] and cursor is None
+
+
+def test_range_between_cursors(store):
+    page, cursor = store.page_todos('alice', after_id=2, before_id=6)
+    assert ids(page) == [3, 4, 5] and cursor is None
+
+    page, cursor = store.page_todos('alice', after_id=6, before_id=2)
+    assert page == [] and cursor is None
+
+
+def test_page_of_does_not_touch_items_outside_the_page():
+    todos = [Todo('x', 0, id=i) for i in range(1, 100001)]
+    page, cursor = page_of(todos, limit=2, order='desc', before_id=50000)
+    assert ids(page) == [49999, 49998] and cursor == 49998
+
+
+def test_api_returns_page_envelope():
+    import main
+
+    client = main.app.test_client()
+    for i in range(3):
+        client.post('/api/todos?client_id=pager', json={'text': f'item {i}'})
+
+    # Without pagination parameters the response stays a plain array
+    assert len(client.get('/api/todos?client_id=pager').get_json()) == 3
+
+    body = client.get('/api/todos?client_id=pager&limit=2&order=desc').get_json()
+    assert ids(body['todos']) == [3, 2] and body['next_cursor'] == 2
+
+    assert client.get('/api/todos?client_id=pager&limit=abc').status_code == 400
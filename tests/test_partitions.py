@@ -0,0 +1,53 @@
+import os
+
+import main
+from records import Todo
+from storage import InMemoryStore
+
+
+def test_get_for_unknown_client_allocates_nothing(tmp_path, monkeypatch):
+    store = InMemoryStore(spill_dir=str(tmp_path))
+    monkeypatch.setattr(main, 'store', store)
+    client = main.app.test_client()
+
+    for i in range(50):
+        assert client.get(f'/api/todos?client_id=crawler_{i}').get_json() == []
+
+    assert store.users_count() == 0
+    assert store.stats()['resident_clients'] == 0
+
+
+def test_idle_partitions_are_spilled_and_reloaded(tmp_path):
+    store = InMemoryStore(max_resident_clients=2, spill_dir=str(tmp_path), lock_stripes=1)
+    for client_id in ('a', 'b', 'c'):
+        store.add_todo(client_id, Todo(f'{client_id} first', 1760524200000))
+
+    stats = store.stats()
+    assert stats['resident_clients'] == 2
+    assert stats['spilled_clients'] == 1
+    assert stats['evictions_total'] == 1
+    assert len(os.listdir(store.user_data.spill.directory)) == 1
+
+    # 'a' was least recently used; reading it brings it back and evicts 'b'
+    assert [t.text for t in store.list_todos('a')] == ['a first']
+    assert store.version('a') == 1
+    store.add_todo('a', Todo('a second'))
+    assert [t.id for t in store.list_todos('a')] == [1, 2]
+
+    stats = store.stats()
+    assert stats['reloads_total'] == 1
+    assert stats['evictions_total'] == 2
+    assert store.users_count() == 3
+    assert 'b' in store.user_data and 'b' in store.user_data.spill
+
+
+def test_status_reports_partition_counts(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore(max_resident_clients=1, spill_dir=str(tmp_path), lock_stripes=1))
+    client = main.app.test_client()
+    client.post('/api/todos?client_id=one', json={'text': 'x'})
+    client.post('/api/todos?client_id=two', json={'text': 'y'})
+
+    storage = client.get('/api/status').get_json()['storage']
+    assert storage['resident_clients'] == 1
+    assert storage['spilled_clients'] == 1
+    assert storage['evictions_per_minute'] == 1
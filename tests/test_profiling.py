@@ -0,0 +1,62 @@
+import time
+from collections import Counter
+
+from flask import Flask
+
+from profiling import ProfileRing, Profiler
+
+
+def slow_handler_work():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+
+def make_app(profiler):
+    app = Flask(__name__)
+
+    @app.route('/slow')
+    def slow():
+        slow_handler_work()
+        return 'ok'
+
+    profiler.install(app)
+    return app
+
+
+def test_token_profiles_one_request_and_admin_can_download(tmp_path):
+    profiler = Profiler(ProfileRing(str(tmp_path)), sample_rate=0, token='secret')
+    client = make_app(profiler).test_client()
+
+    assert 'X-Profile' not in client.get('/slow').headers
+    assert 'X-Profile' not in client.get('/slow', headers={'X-Profile-Token': 'wrong'}).headers
+    name = client.get('/slow', headers={'X-Profile-Token': 'secret'}).headers['X-Profile']
+
+    assert client.get('/admin/profiles').status_code == 403
+    listing = client.get('/admin/profiles', headers={'X-Profile-Token': 'secret'}).get_json()
+    assert [p['name'] for p in listing['profiles']] == [name]
+
+    body = client.get(f'/admin/profiles/{name}', headers={'X-Profile-Token': 'secret'}).get_data(as_text=True)
+    line = next(line for line in body.splitlines() if 'slow_handler_work' in line)
+    stack, count = line.rsplit(' ', 1)
+    assert stack.split(';')[-1] == 'test_profiling.py:slow_handler_work'
+    assert int(count) > 0
+
+    assert client.get('/admin/profiles/..%2Fsecret', headers={'X-Profile-Token': 'secret'}).status_code == 404
+
+
+def test_one_in_n_sampling(tmp_path):
+    profiler = Profiler(ProfileRing(str(tmp_path)), sample_rate=3, interval=0.005)
+    client = make_app(profiler).test_client()
+    profiled = ['X-Profile' in client.get('/slow').headers for _ in range(6)]
+    assert profiled == [False, False, True, False, False, True]
+
+    # No token configured: the admin endpoints stay closed
+    assert client.get('/admin/profiles', headers={'X-Profile-Token': ''}).status_code == 403
+
+
+def test_ring_keeps_newest_files(tmp_path):
+    ring = ProfileRing(str(tmp_path), max_files=3)
+    names = [ring.write(f'GET_/r{i}', Counter({'a;b': i + 1})) for i in range(5)]
+    assert ring.names() == names[:1:-1]
+    assert len(list(tmp_path.iterdir())) == 3
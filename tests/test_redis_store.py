@@ -0,0 +1,190 @@
+import os
+import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+import redis_store
+from records import Todo
+from redis_store import RedisStore
+from storage import InMemoryStore
+
+fakeredis = pytest.importorskip('fakeredis')
+# fakeredis runs the Lua write script with lupa
+pytest.importorskip('lupa')
+
+# Set to e.g. redis://localhost:6379/15 to also run against a real server
+REDIS_TEST_URL = os.environ.get('REDIS_TEST_URL')
+
+
+@pytest.fixture(params=['fake', 'server'])
+def connect(request):
+    """Return a function building RedisStores that share one server"""
+    prefix = f'test:{uuid.uuid4().hex}:'
+    if request.param == 'fake':
+        server = fakeredis.FakeServer()
+        yield lambda: RedisStore(prefix=prefix, client_factory=lambda: fakeredis.FakeRedis(
+            server=server, decode_responses=True))
+        return
+
+    if not REDIS_TEST_URL:
+        pytest.skip('REDIS_TEST_URL is not set')
+    yield lambda: RedisStore(REDIS_TEST_URL, pool_size=8, prefix=prefix)
+    client = RedisStore(REDIS_TEST_URL, prefix=prefix)._redis()
+    for key in client.scan_iter(prefix + '*'):
+        client.delete(key)
+
+
+@pytest.fixture
+def store(connect):
+    return connect()
+
+
+def test_ids_counts_and_flags(store):
+    assert store.add_todo('alice', Todo('a1', 1)) == 1
+    assert store.add_todos('alice', [Todo('a2', 2, True), Todo('a3', 3)]) == 3
+    assert store.add_todo(None, Todo('g1', 4)) == 1
+
+    assert [(t.id, t.text, t.created_ms, t.encrypted) for t in store.list_todos('alice')] == [
+        (1, 'a1', 1, None), (2, 'a2', 2, True), (3, 'a3', 3, None)
+    ]
+    assert store.version('alice') == 3 and store.version('bob') == 0
+    assert store.users_count() == 1
+    assert store.global_count() == 1
+    assert store.count_todos('alice') == 3
+    assert store.list_todos('bob') == []
+
+
+def test_instances_share_ids_epoch_and_data_keys(connect):
+    first, second = connect(), connect()
+    first.add_todo('alice', Todo('from worker 1'))
+    second.add_todo('alice', Todo('from worker 2'))
+    first.save_data_key('v1', 'wrapped')
+    second.save_data_key('v1', 'ignored')
+
+    assert [t.id for t in first.list_todos('alice')] == [1, 2]
+    assert first.epoch == second.epoch
+    assert second.load_data_key('v1') == 'wrapped'
+    assert second.data_key_versions() == ['v1']
+
+
+def test_pages_match_the_in_memory_store(store):
+    memory = InMemoryStore()
+    for i in range(23):
+        store.add_todo('alice', Todo(f'todo {i}', i))
+        memory.add_todo('alice', Todo(f'todo {i}', i))
+
+    rng = random.Random(7)
+    for _ in range(300):
+        args = {
+            'limit': rng.choice([None, 1, 3, 10, 50]),
+            'after_id': rng.choice([None, 0, 1, 5, 22, 23, 30]),
+            'before_id': rng.choice([None, 1, 2, 6, 23, 24, 40]),
+            'order': rng.choice(['asc', 'desc'])
+        }
+        page, cursor = store.page_todos('alice', **args)
+        expected, expected_cursor = memory.page_todos('alice', **args)
+        assert ([t.id for t in page], cursor) == ([t.id for t in expected], expected_cursor), args
+
+
+def test_changes_since(store, monkeypatch):
+    monkeypatch.setattr(redis_store, 'CHANGE_LOG_SIZE', 3)
+    assert store.changes_since('alice', 0) == (0, [])
+    for text in 'abcde':
+        store.add_todo('alice', Todo(text))
+
+    version, changes = store.changes_since('alice', 2)
+    assert version == 5
+    assert [(c['version'], c['op'], c['todo'].text) for c in changes] == [
+        (3, 'create', 'c'), (4, 'create', 'd'), (5, 'create', 'e')
+    ]
+    assert store.changes_since('alice', 5) == (5, [])
+    # Too far behind, from the future, or nonsense
+    assert store.changes_since('alice', 1) == (5, None)
+    assert store.changes_since('alice', 9) == (5, None)
+    assert store.changes_since('alice', -1) == (5, None)
+
+
+def test_partitions_move_in_and_out(store):
+    store.add_todos('alice', [Todo('one', 1), Todo('two', 2, True)])
+    exported = store.export_partition('alice')
+    assert exported[:2] == (3, 2)
+    assert store.client_ids() == ['alice']
+
+    store.drop_partition('alice')
+    assert store.export_partition('alice') is None
+    assert store.users_count() == 0
+
+    store.restore_partition('bob', *exported)
+    assert [(t.id, t.text, t.encrypted) for t in store.list_todos('bob')] == [(1, 'one', None), (2, 'two', True)]
+    assert store.add_todo('bob', Todo('three')) == 3
+    assert store.page_todos('bob', limit=1, order='desc')[0][0].text == 'three'
+
+
+def test_concurrent_writers_get_unique_ids(connect):
+    stores = [connect() for _ in range(4)]
+
+    def write(i):
+        store = stores[i % len(stores)]
+        if i % 5 == 0:
+            store.add_todos('hot', [Todo(f'batch {i}'), Todo(f'batch {i}')])
+        else:
+            store.add_todo('hot', Todo(f'todo {i}'))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(write, range(200)))
+
+    ids = [todo.id for todo in stores[0].list_todos('hot')]
+    assert ids == list(range(1, 241))
+    assert stores[0].version('hot') == 240
+
+
+def test_each_worker_process_gets_its_own_client(monkeypatch):
+    server = fakeredis.FakeServer()
+    clients = []
+
+    def factory():
+        clients.append(fakeredis.FakeRedis(server=server, decode_responses=True))
+        return clients[-1]
+
+    store = RedisStore(client_factory=factory)
+    store.add_todo('alice', Todo('before fork'))
+    monkeypatch.setattr(os, 'getpid', lambda: -1)
+    store.add_todo('alice', Todo('after fork'))
+    assert len(clients) == 2
+    assert [t.id for t in store.list_todos('alice')] == [1, 2]
+
+
+def test_api_on_redis(store, monkeypatch):
+    monkeypatch.setattr(main, 'store', store)
+    client = main.app.test_client()
+
+    assert client.post('/api/todos?client_id=shared', json={'text': 'one'}).status_code == 201
+    client.post('/api/todos?client_id=shared', json={'text': 'two'})
+    listing = client.get('/api/todos?client_id=shared')
+    assert [t['text'] for t in listing.get_json()] == ['one', 'two']
+    assert listing.headers['X-Todos-Epoch'] == store.epoch
+
+    page = client.get('/api/todos?client_id=shared&limit=1&order=desc').get_json()
+    assert [t['text'] for t in page['todos']] == ['two'] and page['next_cursor'] == 2
+
+
+def test_unconditional_list_get_is_one_read(store, monkeypatch):
+    monkeypatch.setattr(main, 'store', store)
+    monkeypatch.setattr(main, 'response_cache', main.ResponseCache())
+    client = main.app.test_client()
+    client.post('/api/todos/batch?client_id=one_trip', json={'texts': ['a', 'b']})
+
+    reads = []
+    for name in ('version', 'list_todos', 'list_with_version', 'changes_since'):
+        method = getattr(store, name)
+        monkeypatch.setattr(store, name, lambda *args, _name=name, _method=method: reads.append(_name) or _method(*args))
+
+    listing = client.get('/api/todos?client_id=one_trip')
+    assert [t['text'] for t in listing.get_json()] == ['a', 'b']
+    assert listing.headers['X-Todos-Version'] == '2'
+    client.post('/api/todos?client_id=one_trip', json={'text': 'c'})
+    assert len(client.get('/api/todos?client_id=one_trip').get_json()) == 3
+    assert reads == ['list_with_version', 'changes_since']
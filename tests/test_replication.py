@@ -0,0 +1,226 @@
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from journal import apply_record, load_snapshot, snapshot_lines
+from records import Todo
+from replication import FollowerStore, LeaderStore, Replication, ReplicationLog
+from storage import InMemoryStore, SQLiteStore
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+TOKEN = 'test-replication-token'
+
+
+def test_log_serves_records_after_a_seq():
+    log = ReplicationLog(size=3)
+    for n in range(1, 6):
+        log.append(['t', 'alice', [[n, f'todo {n}', 0, None]]])
+
+    records, seq = log.read(3)
+    assert seq == 5 and [record[0] for record in records] == [4, 5]
+    assert log.read(5) == ([], 5)
+    assert log.read(3, limit=1)[0][0][0] == 4
+    # Evicted, or from a leader that restarted
+    assert log.read(1) is None
+    assert log.read(9) is None
+
+
+def test_idle_read_waits_for_the_next_record():
+    log = ReplicationLog()
+    threading.Timer(0.05, log.append, [['k', 'v1', 'wrapped']]).start()
+    started = time.monotonic()
+    records, seq = log.read(0, wait=2)
+    assert records == [[1, ['k', 'v1', 'wrapped']]] and seq == 1
+    assert time.monotonic() - started < 1
+
+
+def test_leader_log_and_snapshot_rebuild_the_store():
+    log = ReplicationLog()
+    leader = LeaderStore(InMemoryStore(), log)
+    leader.add_todos('alice', [Todo('one', 1), Todo('two', 2)])
+    leader.save_data_key('v1', 'wrapped')
+    lines = list(snapshot_lines(leader, epoch=leader.epoch, seq=log.seq))
+    leader.add_todo('alice', Todo('three', 3))
+
+    replica = InMemoryStore()
+    header, restored = load_snapshot(replica, lines)
+    assert (header['seq'], restored) == (2, 2)
+    for _, record in log.read(header['seq'])[0]:
+        apply_record(replica, record)
+    assert [(t.id, t.text) for t in replica.list_todos('alice')] == [(1, 'one'), (2, 'two'), (3, 'three')]
+    assert replica.version('alice') == 3
+    assert replica.load_data_key('v1') == 'wrapped'
+
+
+def test_replayed_todos_serve_delta_polls():
+    leader = InMemoryStore()
+    replica = InMemoryStore()
+    leader.add_todos('alice', [Todo('one', 1), Todo('two', 2)])
+    apply_record(replica, ['t', 'alice', [[1, 'one', 1, None], [2, 'two', 2, None]]])
+
+    version, changes = replica.changes_since('alice', 1)
+    assert version == 2 and [(c['version'], c['todo'].text) for c in changes] == [(2, 'two')]
+    assert [c['version'] for c in leader.changes_since('alice', 1)[1]] == [2]
+
+
+def test_snapshot_catch_up_closes_replaced_stores(monkeypatch):
+    leader = InMemoryStore()
+    leader.add_todo('alice', Todo('one', 1))
+    snapshot = ''.join(line for line in snapshot_lines(leader, epoch=leader.epoch, seq=1)).encode()
+    follower = FollowerStore('http://leader.invalid', token=TOKEN)
+    monkeypatch.setattr(follower, '_get', lambda path, timeout: io.BytesIO(snapshot))
+
+    directories = [follower._store.user_data.spill.directory]
+    for _ in range(3):
+        follower.catch_up()
+        directories.append(follower._store.user_data.spill.directory)
+    # The store just replaced may still be serving a read
+    assert [os.path.isdir(d) for d in directories] == [False, False, True, True]
+    assert [t.text for t in follower.list_todos('alice')] == ['one']
+    follower._store.close()
+    follower._retired.close()
+
+
+def test_roles_are_validated(tmp_path):
+    assert Replication(InMemoryStore(), role='').stats() == {'role': 'off'}
+    with pytest.raises(ValueError):
+        Replication(InMemoryStore(), role='follower', leader_url='')
+    with pytest.raises(ValueError):
+        Replication(SQLiteStore(str(tmp_path / 'todos.db')), role='leader')
+
+
+# Several local instances under gunicorn
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_instance(role, leader_port=None, workers=1, **env):
+    port = free_port()
+    env = dict(os.environ, TODO_REPLICATION_ROLE=role, TODO_REPLICATION_TOKEN=TOKEN,
+               TODO_REPLICATION_POLL_WAIT='0.2', **env)
+    if leader_port:
+        env['TODO_REPLICATION_LEADER_URL'] = f'http://127.0.0.1:{leader_port}'
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '-w', str(workers), '--threads', '8',
+         'main:app'], cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        # Signals go to the whole process group, gunicorn master and workers
+        start_new_session=True
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+            return proc, port
+        except OSError:
+            time.sleep(0.1)
+    os.killpg(proc.pid, signal.SIGKILL)
+    raise RuntimeError(f'{role} did not start')
+
+
+def call(port, path, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=data,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, response.headers, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, json.load(e)
+
+
+def wait_for_list(port, client_id, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        status, headers, todos = call(port, f'/api/todos?client_id={client_id}')
+        if headers.get('X-Replica-Role') == 'follower' and len(todos) == count:
+            return headers, todos
+        if time.monotonic() > deadline:
+            raise AssertionError(f'follower has {len(todos)} of {count} todos')
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def instances():
+    procs = []
+
+    def start(*args, **kwargs):
+        proc, port = start_instance(*args, **kwargs)
+        procs.append(proc)
+        return proc, port
+
+    yield start
+    for proc in procs:
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGCONT)
+            os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def test_followers_serve_replicated_reads(instances):
+    _, leader = instances('leader')
+    _, follower = instances('follower', leader, workers=2, TODO_REPLICATION_MAX_STALENESS_MS='5000')
+
+    for n in range(10):
+        call(leader, '/api/todos?client_id=alice', {'text': f'todo {n}'})
+    call(leader, '/api/todos/batch?client_id=alice', {'texts': ['x', 'y']})
+
+    headers, todos = wait_for_list(follower, 'alice', 12)
+    assert [t['id'] for t in todos] == list(range(1, 13))
+    assert 0 <= int(headers['X-Replica-Staleness-Ms']) <= 5000
+    _, leader_headers, _ = call(leader, '/api/todos?client_id=alice')
+    assert headers['ETag'] == leader_headers['ETag']
+
+    # Writes on a follower are forwarded to the leader
+    status, headers, body = call(follower, '/api/todos?client_id=alice', {'text': 'via follower'})
+    assert status == 201 and body['todos_count'] == 13
+    assert headers['X-Replica-Role'] == 'leader'
+    wait_for_list(follower, 'alice', 13)
+
+
+def test_lagging_follower_catches_up_from_a_snapshot(instances):
+    _, leader = instances('leader', TODO_REPLICATION_LOG_SIZE='5')
+    follower_proc, follower = instances('follower', leader, TODO_REPLICATION_MAX_STALENESS_MS='5000')
+    call(leader, '/api/todos?client_id=bob', {'text': 'first'})
+    wait_for_list(follower, 'bob', 1)
+
+    os.killpg(follower_proc.pid, signal.SIGSTOP)
+    for n in range(30):
+        call(leader, '/api/todos?client_id=bob', {'text': f'while stopped {n}'})
+    os.killpg(follower_proc.pid, signal.SIGCONT)
+
+    _, todos = wait_for_list(follower, 'bob', 31)
+    assert todos[-1]['text'] == 'while stopped 29'
+    replication = call(follower, '/api/status')[2]['replication']
+    assert replication['role'] == 'follower' and replication['snapshots'] >= 2
+
+
+def test_follower_never_serves_reads_staler_than_the_bound(instances):
+    leader_proc, leader = instances('leader')
+    _, follower = instances('follower', leader, TODO_REPLICATION_MAX_STALENESS_MS='500')
+    call(leader, '/api/todos?client_id=carol', {'text': 'one'})
+    wait_for_list(follower, 'carol', 1)
+
+    os.killpg(leader_proc.pid, signal.SIGKILL)
+    leader_proc.wait()
+    time.sleep(0.8)
+    status, headers, body = call(follower, '/api/todos?client_id=carol')
+    assert status == 503 and body == {'error': 'leader unavailable'}
+    assert 'X-Replica-Staleness-Ms' not in headers
+
+
+def test_replication_endpoints_need_the_token(instances):
+    _, leader = instances('leader')
+    assert call(leader, '/_replication/log?after=0')[0] == 403
+    assert call(leader, '/_replication/snapshot')[0] == 403
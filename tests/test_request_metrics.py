@@ -0,0 +1,84 @@
+import time
+
+from flask import Flask
+
+import main
+from request_metrics import RequestMetrics
+from storage import InMemoryStore
+
+
+def make_app(metrics):
+    app = Flask(__name__)
+
+    @app.route('/api/todos/<int:todo_id>')
+    def todo(todo_id):
+        return {'id': todo_id}
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    metrics.install(app)
+    return app
+
+
+def test_routes_are_labelled_by_template_and_status(tmp_path):
+    metrics = RequestMetrics(directory=None)
+    client = make_app(metrics).test_client()
+    client.get('/api/todos/1')
+    client.get('/api/todos/2')
+    client.get('/boom')
+    client.get('/nowhere')
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    labels = 'route="/api/todos/<int:todo_id>",method="GET",status="200"'
+    assert f'http_request_duration_seconds_count{{{labels}}} 2' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert 'route="/boom",method="GET",status="500"' in text
+    assert 'route="unmatched",method="GET",status="404"' in text
+    assert '/api/todos/1' not in text
+
+
+def test_buckets_are_cumulative():
+    metrics = RequestMetrics(directory=None)
+    for seconds in (0.0005, 0.003, 0.003, 20):
+        metrics.observe('/api/todos', 'GET', 200, seconds)
+
+    lines = dict(line.rsplit(' ', 1) for line in metrics.render().splitlines() if not line.startswith('#'))
+    prefix = 'http_request_duration_seconds_bucket{route="/api/todos",method="GET",status="200",le='
+    assert lines[prefix + '"0.001"}'] == '1'
+    assert lines[prefix + '"0.005"}'] == '3'
+    assert lines[prefix + '"10.0"}'] == '3'
+    assert lines[prefix + '"+Inf"}'] == '4'
+
+
+def test_workers_are_summed_through_the_directory(tmp_path):
+    first = RequestMetrics(directory=str(tmp_path), pid=1)
+    second = RequestMetrics(directory=str(tmp_path), pid=2)
+    first.observe('/api/todos', 'GET', 200, 0.01)
+    second.observe('/api/todos', 'GET', 200, 0.02)
+    second.observe('/api/todos', 'POST', 201, 0.02)
+    second.write_snapshot()
+
+    text = first.render()
+    assert 'http_request_duration_seconds_count{route="/api/todos",method="GET",status="200"} 2' in text
+    assert 'http_request_duration_seconds_count{route="/api/todos",method="POST",status="201"} 1' in text
+
+
+def test_recording_is_cheap():
+    metrics = RequestMetrics(directory=None)
+    observe = metrics.observe
+    start = time.perf_counter()
+    for _ in range(100_000):
+        observe('/api/todos', 'GET', 200, 0.003)
+    # About a microsecond here, generous bound for slow CI machines
+    assert (time.perf_counter() - start) / 100_000 < 5e-6
+
+
+def test_main_serves_metrics(monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore())
+    client = main.app.test_client()
+    client.get('/api/todos?client_id=prom')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'route="/api/todos",method="GET",status="200"' in text
@@ -0,0 +1,97 @@
+import json
+
+import main
+from records import Todo, to_dicts
+from response_cache import ResponseCache
+from storage import InMemoryStore
+
+
+def body_of(cache, store, client_id):
+    list_ver = (store.epoch, store.version(client_id))
+    return cache.list_body(store, client_id, list_ver, to_dicts)
+
+
+def test_hit_splice_and_full_encode_agree(store):
+    cache = ResponseCache()
+    store.add_todo('alice', Todo('first'))
+    body_of(cache, store, 'alice')
+
+    store.add_todos('alice', [Todo('second'), Todo('third')])
+    spliced = body_of(cache, store, 'alice')
+    assert body_of(cache, store, 'alice') is spliced
+
+    expected = [todo.to_dict() for todo in store.list_todos('alice')]
+    assert json.loads(spliced) == expected
+    assert spliced == body_of(ResponseCache(), store, 'alice')
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['splices'] == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_change_log_overrun_reencodes(monkeypatch):
+    monkeypatch.setattr('storage.CHANGE_LOG_SIZE', 2)
+    store = InMemoryStore()
+    cache = ResponseCache()
+    store.add_todo('alice', Todo('first'))
+    body_of(cache, store, 'alice')
+
+    store.add_todos('alice', [Todo(str(i)) for i in range(5)])
+    assert len(json.loads(body_of(cache, store, 'alice'))) == 6
+    assert cache.stats()['misses'] == 2
+    assert cache.stats()['splices'] == 0
+
+
+def test_eviction_keeps_size_bounded():
+    store = InMemoryStore()
+    for client_id in ('a', 'b', 'c'):
+        store.add_todo(client_id, Todo('x' * 100))
+
+    # Room for two entries of about 360 bytes each
+    cache = ResponseCache(max_bytes=800)
+    for client_id in ('a', 'b', 'c'):
+        body_of(cache, store, client_id)
+
+    stats = cache.stats()
+    assert stats['bytes'] <= 800
+    assert stats['evictions'] == 1
+    body_of(cache, store, 'a')
+    assert cache.stats()['misses'] == 4
+
+
+def test_empty_lists_are_not_cached(store):
+    cache = ResponseCache()
+    for n in range(100):
+        assert body_of(cache, store, f'unknown_{n}') == b'[]\n'
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+
+
+def test_status_reports_counters(monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore())
+    monkeypatch.setattr(main, 'response_cache', ResponseCache())
+    client = main.app.test_client()
+
+    client.post('/api/todos?client_id=cached', json={'text': 'one'})
+    client.get('/api/todos?client_id=cached')
+    client.get('/api/todos?client_id=cached')
+    client.post('/api/todos?client_id=cached', json={'text': 'two'})
+    response = client.get('/api/todos?client_id=cached')
+
+    assert [todo['text'] for todo in response.get_json()] == ['one', 'two']
+    stats = client.get('/api/status').get_json()['response_cache']
+    assert (stats['misses'], stats['hits'], stats['splices']) == (1, 1, 1)
+
+
+def test_read_list_gets_the_version_with_the_list(store):
+    cache = ResponseCache()
+    assert cache.read_list(store, 'alice', to_dicts) == ((store.epoch, 0), b'[]\n')
+
+    store.add_todo('alice', Todo('first'))
+    list_ver, body = cache.read_list(store, 'alice', to_dicts)
+    assert list_ver == (store.epoch, 1)
+    assert cache.read_list(store, 'alice', to_dicts) == (list_ver, body)
+
+    store.add_todos('alice', [Todo('second'), Todo('third')])
+    list_ver, body = cache.read_list(store, 'alice', to_dicts)
+    assert list_ver == (store.epoch, 3)
+    assert body == body_of(ResponseCache(), store, 'alice')
+    assert (cache.stats()['misses'], cache.stats()['hits'], cache.stats()['splices']) == (2, 1, 1)
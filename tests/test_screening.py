@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+import secure_main
+from screening import Automaton, Rule, ScreeningEngine
+
+
+def write_rules(path, rules, mtime=None):
+    path.write_text(json.dumps({'rules': rules}))
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+def test_automaton_finds_every_overlapping_pattern():
+    rules = [Rule(p) for p in ('he', 'she', 'his', 'hers', 'localStorage')]
+    found = [rule.pattern for rule in Automaton(rules).search('uSHErs read LOCALSTORAGE')]
+    assert found == ['she', 'he', 'hers', 'localstorage']
+    assert Automaton(rules).search('nothing to see') == []
+
+
+def test_actions_and_hot_reload(tmp_path):
+    path = tmp_path / 'rules.json'
+    write_rules(path, [
+        {'pattern': '<script', 'action': 'reject'},
+        {'pattern': 'todo', 'action': 'log'},
+        {'pattern': 'curl/', 'target': 'user_agent', 'action': 'tag', 'tag': 'cli'}
+    ], mtime=1_000_000_000)
+    engine = ScreeningEngine(str(path), reload_seconds=0)
+
+    verdict = engine.screen('text', 'A TODO with <SCRIPT>')
+    assert verdict.rejected_by.pattern == '<script'
+    assert [rule.pattern for rule in verdict.logged_by] == ['todo']
+    assert engine.screen('user_agent', 'curl/8.0').tags == ['cli']
+    assert engine.screen('text', 'curl/8.0').tags == []
+
+    write_rules(path, [{'pattern': 'milk', 'action': 'reject'}], mtime=2_000_000_000)
+    assert engine.screen('text', 'buy milk').rejected_by.pattern == 'milk'
+    assert engine.screen('text', '<script>').rejected_by is None
+
+    # A broken file keeps the rules that were loaded
+    path.write_text('{not json')
+    os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+    assert engine.screen('text', 'buy milk').rejected_by is not None
+    assert engine.stats() == {'rules': 1, 'reloads': 1, 'path': str(path)}
+
+
+def test_invalid_rule_is_refused(tmp_path):
+    path = tmp_path / 'rules.json'
+    write_rules(path, [{'pattern': 'x', 'action': 'explode'}])
+    with pytest.raises(ValueError):
+        ScreeningEngine(str(path))
+
+
+def test_secure_main_uses_the_shipped_rules(monkeypatch):
+    monkeypatch.setattr(secure_main, 'log_security_event', lambda event, details: None)
+    assert secure_main.validate_todo_text('<script>alert(1)</script>') == (False, 'Invalid characters detected')
+    assert secure_main.validate_todo_text('read about localStorage') == (False, 'Invalid characters detected')
+    assert secure_main.validate_todo_text('Buy milk') == (True, None)
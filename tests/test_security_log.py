@@ -0,0 +1,99 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from security_log import AsyncEventLogger, CloudLoggingSink, FileSink, StdoutJSONSink
+
+
+def event(name, http_request=None):
+    return {'event_type': name, 'severity': 'INFO', 'time': '2025-10-15T10:30:00Z',
+            'http_request': http_request, 'details': {'n': name}}
+
+
+class ListSink:
+    name = 'list'
+
+    def __init__(self, block=False, delay=0):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.delay = delay
+        if not block:
+            self.release.set()
+
+    def write(self, events):
+        self.entered.set()
+        self.release.wait(5)
+        time.sleep(self.delay)
+        self.batches.append([e['event_type'] for e in events])
+
+
+def test_events_are_written_in_batches():
+    sink = ListSink(block=True)
+    log = AsyncEventLogger([sink], batch_size=4, flush_seconds=0.05)
+    log.log(event('first'))
+    assert sink.entered.wait(2)
+    for i in range(9):
+        log.log(event(str(i)))
+    sink.release.set()
+    log.close()
+
+    assert sink.batches == [['first'], ['0', '1', '2', '3'], ['4', '5', '6', '7'], ['8']]
+    assert log.stats()['written'] == 10
+
+
+@pytest.mark.parametrize('policy, kept', [('drop_newest', ['a', 'b']), ('drop_oldest', ['b', 'c'])])
+def test_overflow_policy(policy, kept):
+    sink = ListSink(block=True)
+    log = AsyncEventLogger([sink], queue_size=2, overflow=policy, flush_seconds=0.05)
+    log.log(event('held'))
+    assert sink.entered.wait(2)
+    for name in ('a', 'b', 'c'):
+        log.log(event(name))
+    sink.release.set()
+    log.close()
+
+    assert sum(sink.batches, []) == ['held'] + kept
+    assert log.stats()['dropped'] == 1
+
+
+def test_slow_sink_does_not_block_logging():
+    log = AsyncEventLogger([ListSink(delay=0.2)], flush_seconds=0.05)
+    start = time.perf_counter()
+    for i in range(100):
+        log.log(event(str(i)))
+    assert time.perf_counter() - start < 0.1
+    log.close()
+
+
+def test_sinks_write_structured_entries(tmp_path):
+    stream = io.StringIO()
+    request = {'requestMethod': 'GET', 'requestUrl': 'http://x/api/todos'}
+    StdoutJSONSink(stream).write([event('GET_TODOS', request), event('STATUS_CHECK')])
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]['message'] == 'SECURITY_EVENT: GET_TODOS'
+    assert lines[0]['severity'] == 'INFO'
+    assert lines[0]['httpRequest'] == request
+    assert 'httpRequest' not in lines[1]
+
+    path = tmp_path / 'events.log'
+    FileSink(str(path)).write([event('a'), event('b')])
+    assert len(path.read_text().splitlines()) == 2
+
+    class FakeBatch:
+        def __init__(self):
+            self.entries, self.commits = [], 0
+
+        def log_struct(self, info, **kw):
+            self.entries.append((info, kw))
+
+        def commit(self):
+            self.commits += 1
+
+    batch = FakeBatch()
+    CloudLoggingSink(type('Logger', (), {'batch': lambda self: batch})()).write([event('a'), event('b')])
+    assert len(batch.entries) == 2
+    assert batch.commits == 1
@@ -0,0 +1,92 @@
+import re
+
+import pytest
+from flask import Flask
+
+import main
+from request_metrics import RequestMetrics
+from server_timing import ServerTiming, header_value, span
+from storage import InMemoryStore
+
+
+def make_app(timing):
+    app = Flask(__name__)
+
+    @app.route('/work')
+    def work():
+        with span('validate'):
+            pass
+        for _ in range(3):
+            with span('store'):
+                pass
+        return 'ok'
+
+    timing.install(app)
+    return app
+
+
+def phases(response):
+    header = response.headers.get('Server-Timing')
+    return dict(re.findall(r'(\w+);dur=([0-9.]+)', header)) if header else {}
+
+
+def test_only_requests_asking_for_it_are_timed():
+    client = make_app(ServerTiming(mode='header')).test_client()
+    assert 'Server-Timing' not in client.get('/work').headers
+
+    response = client.get('/work', headers={'X-Server-Timing': '1'})
+    assert set(phases(response)) == {'validate', 'store', 'total'}
+    assert 'store;dur=' in response.headers['Server-Timing']
+    assert 'desc="3 calls"' in response.headers['Server-Timing']
+
+
+def test_token_and_modes():
+    client = make_app(ServerTiming(mode='header', token='secret')).test_client()
+    assert 'Server-Timing' not in client.get('/work', headers={'X-Server-Timing': '1'}).headers
+    assert 'Server-Timing' in client.get('/work', headers={'X-Server-Timing': 'secret'}).headers
+
+    assert 'Server-Timing' in make_app(ServerTiming(mode='always')).test_client().get('/work').headers
+    off = make_app(ServerTiming(mode='off')).test_client()
+    assert 'Server-Timing' not in off.get('/work', headers={'X-Server-Timing': '1'}).headers
+
+    with pytest.raises(ValueError):
+        ServerTiming(mode='sometimes')
+
+
+def test_span_is_a_no_op_outside_timed_requests():
+    assert span('a') is span('b')
+    with span('a'):
+        pass
+
+
+def test_phases_are_added_to_histograms():
+    metrics = RequestMetrics(directory=None)
+    client = make_app(ServerTiming(mode='always', metrics=metrics)).test_client()
+    client.get('/work')
+    client.get('/work')
+
+    text = metrics.render()
+    assert '# TYPE app_phase_duration_seconds histogram' in text
+    assert 'app_phase_duration_seconds_count{route="/work",phase="store"} 2' in text
+
+
+def test_header_value_format():
+    assert header_value({'encrypt': [0.0012, 1]}, 0.002) == 'encrypt;dur=1.200, total;dur=2.000'
+
+
+def test_app_reports_store_phase(monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore())
+    client = main.app.test_client()
+    response = client.post('/api/todos?client_id=timing', json={'text': 'x'}, headers={'X-Server-Timing': '1'})
+    assert response.status_code == 201
+    assert {'validate', 'store', 'total'} <= set(phases(response))
+
+
+def test_secure_app_is_off_by_default(monkeypatch):
+    import secure_main
+
+    monkeypatch.setattr(secure_main, 'store', InMemoryStore())
+    assert secure_main.server_timing.mode == 'off'
+    client = secure_main.app.test_client()
+    response = client.get('/api/todos?client_id=timing', headers={'X-Server-Timing': '1'})
+    assert 'Server-Timing' not in response.headers
@@ -0,0 +1,189 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+from records import Todo
+from sharding import HashRing, ShardedStore
+from storage import InMemoryStore, SQLiteStore
+
+KEYS = [f'client_{i}' for i in range(5000)]
+
+
+def owners(ring):
+    return {key: ring.shard_for(key) for key in KEYS}
+
+
+def memory_shards(count):
+    return {f'shard-{i}': InMemoryStore() for i in range(count)}
+
+
+def contents(store, client_id):
+    return [(t.id, t.text) for t in store.list_todos(client_id)]
+
+
+def test_virtual_nodes_spread_the_keys():
+    ring = HashRing([f'shard-{i}' for i in range(4)])
+    counts = {}
+    for owner in owners(ring).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert sorted(counts) == ['shard-0', 'shard-1', 'shard-2', 'shard-3']
+    assert all(0.15 < count / len(KEYS) < 0.35 for count in counts.values())
+    assert sum(ring.shares().values()) == pytest.approx(1.0)
+
+
+def test_adding_or_removing_a_shard_moves_few_keys():
+    ring = HashRing([f'shard-{i}' for i in range(4)])
+    before = owners(ring)
+
+    grown = owners(ring.plus('shard-4'))
+    moved = [key for key in KEYS if grown[key] != before[key]]
+    assert all(grown[key] == 'shard-4' for key in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+
+    shrunk = owners(ring.without('shard-2'))
+    moved = [key for key in KEYS if shrunk[key] != before[key]]
+    assert all(before[key] == 'shard-2' for key in moved)
+
+
+def test_clients_are_routed_to_their_owner():
+    store = ShardedStore(memory_shards(3), background=False)
+    for i in range(30):
+        store.add_todos(f'c{i}', [Todo('a'), Todo('b')])
+    store.add_todo(None, Todo('global'))
+
+    assert contents(store, 'c7') == [(1, 'a'), (2, 'b')]
+    assert store.version('c7') == 2
+    assert store.users_count() == 30
+    assert store.global_count() == 1
+    for i in range(30):
+        owner = store.shards[store.ring.shard_for(f'c{i}')]
+        assert owner.count_todos(f'c{i}') == 2
+
+    store.save_data_key('v1', 'wrapped')
+    assert all(shard.load_data_key('v1') == 'wrapped' for shard in store.shards.values())
+
+
+def test_added_shard_takes_over_its_clients():
+    store = ShardedStore(memory_shards(2), background=False)
+    for i in range(200):
+        store.add_todos(f'c{i}', [Todo(f'c{i} one'), Todo(f'c{i} two')])
+    store.save_data_key('v1', 'wrapped')
+
+    store.add_shard('shard-2', InMemoryStore())
+    pending = store.stats()['moves_pending']
+    assert 20 < pending < 120
+    # Served from the old shard until moved
+    assert all(store.count_todos(f'c{i}') == 2 for i in range(200))
+
+    store.rebalance()
+    assert store.stats()['moves_pending'] == 0
+    assert store.shards['shard-2'].users_count() == pending
+    assert store.users_count() == 200
+    assert store.shards['shard-2'].load_data_key('v1') == 'wrapped'
+    for i in range(200):
+        assert contents(store, f'c{i}') == [(1, f'c{i} one'), (2, f'c{i} two')]
+        # Ids continue after the move
+        assert store.add_todo(f'c{i}', Todo('three')) == 3
+
+
+def test_removed_shard_is_drained_and_dropped():
+    store = ShardedStore(memory_shards(3), background=False)
+    for i in range(100):
+        store.add_todo(f'c{i}', Todo(f'c{i}'))
+    store.add_todo(None, Todo('global'))
+
+    store.remove_shard('shard-1')
+    assert 'shard-1' in store.shards
+    store.rebalance()
+    assert sorted(store.shards) == ['shard-0', 'shard-2']
+    assert store.users_count() == 100
+    assert [t.text for t in store.list_todos(None)] == ['global']
+
+    with pytest.raises(ValueError):
+        ShardedStore(memory_shards(1), background=False).remove_shard('shard-0')
+
+
+def test_background_rebalance_under_concurrent_writes():
+    store = ShardedStore(memory_shards(2), rebalance_batch=5, rebalance_pause_ms=0)
+    clients = [f'c{i}' for i in range(60)]
+
+    def write(i):
+        store.add_todo(clients[i % len(clients)], Todo(f'todo {i}'))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(write, range(600)))
+        store.add_shard('shard-2', InMemoryStore())
+        list(pool.map(write, range(600, 1200)))
+
+    deadline = time.monotonic() + 10
+    while store.stats()['moves_pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.stats()['moves_pending'] == 0
+    assert store.stats()['moved_clients'] > 0
+    for client in clients:
+        assert [t.id for t in store.list_todos(client)] == list(range(1, 21))
+
+
+def test_readers_never_see_a_client_half_moved():
+    store = ShardedStore(memory_shards(2), background=False, rebalance_batch=3)
+    clients = [f'c{i}' for i in range(50)]
+    for client in clients:
+        store.add_todos(client, [Todo('one'), Todo('two'), Todo('three')])
+
+    stop = threading.Event()
+    seen = []
+
+    def read():
+        while not stop.is_set():
+            for client in clients:
+                seen.append(len(store.list_todos(client)))
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for name in ('shard-2', 'shard-3'):
+            store.add_shard(name, InMemoryStore())
+            store.rebalance()
+        store.remove_shard('shard-0')
+        store.rebalance()
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    assert seen and set(seen) == {3}
+
+
+def test_restart_with_more_shards_moves_misplaced_clients(tmp_path):
+    def sqlite_shards(count):
+        return {f'shard-{i}': SQLiteStore(str(tmp_path / f'todos-{i}.db')) for i in range(count)}
+
+    store = ShardedStore(sqlite_shards(2), background=False)
+    for i in range(50):
+        store.add_todos(f'c{i}', [Todo(f'c{i}'), Todo(f'c{i}')])
+
+    restarted = ShardedStore(sqlite_shards(3), background=False)
+    assert restarted.stats()['moves_pending'] > 0
+    assert all(restarted.count_todos(f'c{i}') == 2 for i in range(50))
+    restarted.rebalance()
+    assert restarted.shards['shard-2'].users_count() > 0
+    assert all(contents(restarted, f'c{i}') == [(1, f'c{i}'), (2, f'c{i}')] for i in range(50))
+
+
+def test_status_reports_per_shard_load(monkeypatch):
+    monkeypatch.setattr(main, 'store', ShardedStore(memory_shards(2), background=False))
+    client = main.app.test_client()
+    for i in range(10):
+        client.post(f'/api/todos?client_id=user{i}', json={'text': 'hello'})
+        client.get(f'/api/todos?client_id=user{i}')
+
+    status = client.get('/api/status').get_json()
+    assert status['storage_backend'] == 'sharded'
+    shards = status['storage']['shards']
+    assert sorted(shards) == ['shard-0', 'shard-1']
+    assert sum(shard['writes'] for shard in shards.values()) == 10
+    assert sum(shard['clients'] for shard in shards.values()) == 10
+    assert all(shard['reads'] > 0 for shard in shards.values())
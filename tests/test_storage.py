@@ -0,0 +1,57 @@
+import pytest
+
+from records import Todo
+from storage import SQLiteStore, create_store
+
+
+@pytest.fixture
+def store_options():
+    return {'pool_size': 2}
+
+
+def make_todo(text):
+    return Todo(text, 1760524200000)
+
+
+def test_ids_are_allocated_per_client(store):
+    assert store.add_todo('alice', make_todo('a1')) == 1
+    assert store.add_todo('alice', make_todo('a2')) == 2
+    assert store.add_todo('bob', make_todo('b1')) == 1
+    assert store.add_todo(None, make_todo('g1')) == 1
+
+    assert [t.id for t in store.list_todos('alice')] == [1, 2]
+    assert [t.text for t in store.list_todos('bob')] == ['b1']
+    assert [t.text for t in store.list_todos(None)] == ['g1']
+    assert store.users_count() == 2
+    assert store.global_count() == 1
+
+
+def test_encrypted_flag_round_trips(store):
+    todo = Todo('secret', 1760524200000, encrypted=True)
+    store.add_todo('alice', todo)
+
+    assert store.list_todos('alice')[0].encrypted is True
+    store.add_todo('bob', make_todo('plain'))
+    assert 'encrypted' not in store.list_todos('bob')[0].to_dict()
+
+
+def test_sqlite_is_shared_between_store_instances(tmp_path):
+    path = str(tmp_path / 'todos.db')
+    SQLiteStore(path).add_todo('alice', make_todo('from worker 1'))
+
+    other = SQLiteStore(path)
+    other.add_todo('alice', make_todo('from worker 2'))
+
+    assert [t.id for t in other.list_todos('alice')] == [1, 2]
+
+
+def test_create_store_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        create_store('mongodb')
+
+
+def test_todo_serializes_lazily_to_the_api_format():
+    todo = Todo('write report', 1760524200123, id=7)
+    assert todo.to_dict() == {'id': 7, 'text': 'write report', 'created_at': '2025-10-15T10:30:00.123Z'}
+    assert todo.to_dict(text='decrypted')['text'] == 'decrypted'
+    assert not hasattr(todo, '__dict__')
@@ -0,0 +1,62 @@
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from records import Todo
+
+
+@pytest.fixture(autouse=True)
+def frequent_thread_switches():
+    # Switch threads as often as possible to surface races
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.fixture
+def store_options():
+    # A small resident cap also exercises eviction under contention
+    return {'max_resident_clients': 8, 'pool_size': 8}
+
+
+def assert_consistent(store, client_id, expected):
+    ids = [todo.id for todo in store.list_todos(client_id)]
+    assert ids == list(range(1, expected + 1)), f'gaps, duplicates or lost appends for {client_id!r}'
+    assert store.version(client_id) == expected
+
+
+def test_one_hot_client(store):
+    writes = 400 if store.name == 'sqlite' else 2000
+
+    def write(i):
+        if i % 10 == 0:
+            store.add_todos('hot', [Todo(f'batch {i}'), Todo(f'batch {i}')])
+        else:
+            store.add_todo('hot', Todo(f'todo {i}'))
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(write, range(writes)))
+
+    assert_consistent(store, 'hot', writes + writes // 10)
+
+
+def test_many_clients_and_the_global_list(store):
+    clients = [f'client_{i}' for i in range(32)] + [None]
+    per_client = 20 if store.name == 'sqlite' else 60
+    jobs = [client_id for client_id in clients for _ in range(per_client)]
+    random.Random(7).shuffle(jobs)
+
+    def write(client_id):
+        store.add_todo(client_id, Todo('todo'))
+        # Interleave reads, which also touch the LRU order
+        store.list_todos(client_id)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(write, jobs))
+
+    for client_id in clients:
+        assert_consistent(store, client_id, per_client)
+    assert store.users_count() == 32
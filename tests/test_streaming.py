@@ -0,0 +1,79 @@
+import json
+import tracemalloc
+
+import pytest
+
+import main
+from records import Todo, to_dicts
+from response_cache import ResponseCache, encode_json
+from storage import InMemoryStore
+from streaming import stream_list
+
+
+def test_stream_matches_full_body(store):
+    assert b''.join(stream_list(store, 'alice', to_dicts)) == b'[]\n'
+
+    store.add_todos('alice', [Todo(f'todo {i}') for i in range(25)])
+    streamed = b''.join(stream_list(store, 'alice', to_dicts, chunk_size=10))
+    full = ResponseCache().list_body(store, 'alice', (store.epoch, 25), to_dicts)
+    assert streamed == full
+    assert len(json.loads(streamed)) == 25
+
+
+def test_streaming_100k_items_has_bounded_peak():
+    store = InMemoryStore()
+    store.add_todos('big', [Todo(f'todo item number {i}') for i in range(100_000)])
+    full_size = len(encode_json([todo.to_dict() for todo in store.list_todos('big')]))
+
+    tracemalloc.start()
+    streamed = 0
+    for chunk in stream_list(store, 'big', to_dicts, chunk_size=500):
+        streamed += len(chunk)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert streamed == full_size + 1
+    # Roughly one chunk of dicts and bytes, not the multi-MB body
+    assert peak < full_size / 20
+
+
+def test_get_todos_stream_opt_in(monkeypatch):
+    monkeypatch.setattr(main, 'store', InMemoryStore())
+    client = main.app.test_client()
+    client.post('/api/todos/batch?client_id=streamed', json={'texts': ['a', 'b', 'c']})
+
+    response = client.get('/api/todos?client_id=streamed&stream=1')
+    assert response.is_streamed
+    assert response.headers['ETag']
+    assert response.get_data() == client.get('/api/todos?client_id=streamed').get_data()
+
+
+@pytest.mark.parametrize('max_decrypt', [1000, 0])
+def test_secure_stream_times_out_with_503_not_a_cut_off_body(monkeypatch, max_decrypt):
+    import time
+
+    import secure_main
+    from decryption import ParallelDecryptor
+
+    def slow_decrypt(ciphertext):
+        time.sleep(0.3)
+        return ciphertext
+
+    store = InMemoryStore()
+    store.add_todos('slow', [Todo(f'enc {i}') for i in range(10)])
+    monkeypatch.setattr(secure_main, 'store', store)
+    monkeypatch.setattr(secure_main, 'kms_enabled', lambda: True)
+    monkeypatch.setattr(secure_main, 'MAX_DECRYPT_PER_GET', max_decrypt)
+    decryptor = ParallelDecryptor(slow_decrypt, workers=10, deadline=0.1)
+    monkeypatch.setattr(secure_main, 'decryptor', decryptor)
+    client = secure_main.app.test_client()
+
+    response = client.get('/api/todos?client_id=slow&stream=1')
+    assert response.status_code == 503
+    assert response.get_json() == {'error': 'Decryption timed out'}
+
+    # Within the deadline the whole array is sent
+    decryptor.deadline = 5
+    response = client.get('/api/todos?client_id=slow&stream=1')
+    assert response.status_code == 200
+    assert [todo['text'] for todo in json.loads(response.get_data())] == [f'enc {i}' for i in range(10)]
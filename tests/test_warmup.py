@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from flask import Flask
+
+from storage import SQLiteStore
+from warmup import Warmup
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+def make_app(on_start=False):
+    app = Flask(__name__)
+    warmup = Warmup()
+    calls = []
+
+    @warmup.phase('slow')
+    def slow():
+        time.sleep(0.05)
+        calls.append('slow')
+
+    @warmup.phase('broken')
+    def broken():
+        raise RuntimeError('no credentials')
+
+    warmup.install(app, on_start=on_start)
+    return app, warmup, calls
+
+
+def test_phases_run_once_and_are_timed():
+    app, warmup, calls = make_app()
+    client = app.test_client()
+    assert client.get('/_ah/ready').status_code == 503
+
+    report = client.get('/_ah/warmup').get_json()
+    assert report['ready'] is True
+    assert report['phases']['slow']['seconds'] >= 0.05
+    assert report['phases']['broken']['error'] == 'no credentials'
+
+    client.get('/_ah/warmup')
+    assert calls == ['slow']
+    assert client.get('/_ah/ready').status_code == 200
+
+
+def test_readiness_follows_warmup_on_start():
+    app, warmup, calls = make_app(on_start=True)
+    client = app.test_client()
+    deadline = time.monotonic() + 5
+    while client.get('/_ah/ready').status_code != 200:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert calls == ['slow']
+
+
+def test_sqlite_warm_fills_the_pool(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'todos.db'), pool_size=3)
+    store.warm()
+    assert store._pool._idle_connections().qsize() == 3
+
+
+FIRST_REQUEST = '''
+import json, sys, time
+import secure_main
+client = secure_main.app.test_client()
+warmup = None
+if sys.argv[1] == 'warm':
+    warmup = client.get('/_ah/warmup').get_json()
+started = time.perf_counter()
+assert client.post('/api/todos?client_id=first', json={'text': 'first'}).status_code == 201
+print(json.dumps({'first_request': time.perf_counter() - started, 'warmup': warmup}))
+'''
+
+
+def first_request(mode):
+    env = dict(os.environ, SECURITY_LOG_SINKS='', NO_GCE_CHECK='True')
+    result = subprocess.run([sys.executable, '-c', FIRST_REQUEST, mode], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return json.loads(next(line for line in result.stdout.splitlines() if line.startswith('{')))
+
+
+def test_time_to_first_request_with_and_without_warmup():
+    cold = first_request('cold')
+    warm = first_request('warm')
+    print(f"first POST /api/todos: {cold['first_request'] * 1000:.1f} ms cold, "
+          f"{warm['first_request'] * 1000:.1f} ms after warmup")
+    assert set(warm['warmup']['phases']) == {'modules', 'clients', 'store', 'encryption_keys'}
+    assert warm['first_request'] < cold['first_request']